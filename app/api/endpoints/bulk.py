@@ -0,0 +1,97 @@
+"""
+Bulk download submission endpoints.
+"""
+import json
+from typing import Dict, List
+
+from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models import BulkDownloadResponse
+from app.services.url_parser import ParsedURL, URLParser, URLType
+
+router = APIRouter()
+
+PLAYLIST_TYPES = (URLType.SPOTIFY_PLAYLIST, URLType.YOUTUBE_PLAYLIST)
+
+
+@router.post("/download", response_model=BulkDownloadResponse)
+async def download_bulk(request: Request):
+    """
+    Submit many track and playlist downloads at once.
+    
+    The body is a JSON array of URLs (or {"urls": [...]}) or, with any
+    other content type, one URL per line, read as it streams in. URLs are
+    canonicalized, so tracking parameters and youtu.be / music.youtube.com
+    variants of a link are queued once.
+    
+    Args:
+        request: Request with the URL list as its body
+    
+    Returns:
+        Queued tasks with their canonical URLs, the number of duplicates
+        dropped and the URLs that are not supported
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        urls = await _read_json(request)
+    else:
+        urls = await _read_lines(request)
+    
+    parsed, rejected, duplicates = URLParser.parse_many(urls)
+    
+    try:
+        tasks = await run_in_threadpool(_enqueue, parsed)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue tasks: {str(e)}")
+    
+    return BulkDownloadResponse(tasks=tasks, duplicates=duplicates, rejected=rejected)
+
+
+async def _read_json(request: Request) -> List[str]:
+    try:
+        body = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body is not valid JSON")
+    urls = body.get("urls") if isinstance(body, dict) else body
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of URL strings")
+    _check_size(len(urls))
+    return urls
+
+
+async def _read_lines(request: Request) -> List[str]:
+    urls = []
+    pending = b""
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        urls.extend(line.decode(errors="replace") for line in lines)
+        # Refuse oversized uploads before reading all of them
+        _check_size(len(urls))
+    urls.append(pending.decode(errors="replace"))
+    _check_size(len(urls))
+    return urls
+
+
+def _check_size(count: int) -> None:
+    if count > settings.bulk_max_urls:
+        raise HTTPException(
+            status_code=413, detail=f"At most {settings.bulk_max_urls} URLs per submission"
+        )
+
+
+def _enqueue(parsed: List[ParsedURL]) -> List[Dict]:
+    """Publish one task per URL, all over a single broker connection."""
+    from app.workers.celery_app import celery_app
+    from app.workers.tasks import download_playlist_task, download_track_task
+    
+    tasks = []
+    if not parsed:
+        return tasks
+    with celery_app.producer_or_acquire() as producer:
+        for item in parsed:
+            task = download_playlist_task if item.url_type in PLAYLIST_TYPES else download_track_task
+            result = task.apply_async(args=[item.url], producer=producer)
+            tasks.append({"task_id": result.id, "url": item.url, "url_type": item.url_type.value})
+    return tasks
@@ -0,0 +1,60 @@
+"""
+Downloaded file delivery endpoints.
+"""
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from app.utils.file_delivery import file_response, resolve_download, stored_file_response
+from app.utils.storage import get_storage
+
+router = APIRouter()
+
+
+@router.api_route("/{task_id}", methods=["GET", "HEAD"])
+async def get_file(task_id: str, request: Request, format: Optional[str] = None):
+    """
+    Download the file a track task produced.
+    
+    Supports Range requests (resuming downloads, seeking in players),
+    If-None-Match revalidation and HEAD. With FILE_OFFLOAD set, a fronting
+    proxy sends the file instead of the API. Files in the artifact storage
+    (STORAGE_BACKEND) are served from there, wherever they were downloaded.
+    
+    Args:
+        task_id: The task ID returned from the track download endpoint
+        request: Request, for its Range and validator headers
+        format: One of the extra formats the download asked for (default: the MP3)
+    
+    Returns:
+        The audio file
+    """
+    from app.workers.celery_app import celery_app
+    
+    task = celery_app.AsyncResult(task_id)
+    if task.state != "SUCCESS":
+        raise HTTPException(status_code=404, detail="Task has no file (yet)")
+    
+    result = task.result
+    if not isinstance(result, dict) or not result.get("success") or not result.get("file"):
+        raise HTTPException(status_code=404, detail="Task did not produce a file")
+    if format and format != "mp3":
+        # Same 'file' and 'storage_key' fields as the MP3's
+        result = (result.get("formats") or {}).get(format)
+        if not result:
+            raise HTTPException(status_code=404, detail=f"Task did not produce format {format}")
+    
+    storage = get_storage()
+    if result.get("storage_key") and storage is not None:
+        # Stored by whichever worker downloaded it, so no shared volume is needed
+        try:
+            return await stored_file_response(storage, result["storage_key"], request, Path(result["file"]).name)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File no longer exists")
+    
+    path = resolve_download(result["file"])
+    if path is None:
+        raise HTTPException(status_code=404, detail="File no longer exists")
+    return file_response(path, request)
+
@@ -1,9 +1,23 @@
 """
 Playlist download endpoints.
 """
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
 from app.models import PlaylistDownloadRequest, TaskResponse, TaskStatus, TaskStatusResponse
 from app.workers.tasks import download_playlist_task
+from app.utils.archive import m3u_playlist, stream_zip
+from app.utils.file_delivery import resolve_download
+from app.utils.storage import get_storage
+
+# Child results read per Redis round trip
+RESULT_BATCH_SIZE = 500
 
 router = APIRouter()
 
@@ -33,17 +47,20 @@ async def download_playlist(request: PlaylistDownloadRequest):
 
 
 @router.get("/status/{task_id}", response_model=TaskStatusResponse)
-async def get_playlist_task_status(task_id: str):
+async def get_playlist_task_status(task_id: str, offset: int = 0, limit: int = 100):
     """
     Get the status of a playlist download task.
     
     Args:
         task_id: The task ID returned from the download endpoint
+        offset: Index of the first child task returned
+        limit: Maximum number of child tasks returned (at most 1000)
     
     Returns:
-        Task status and result
+        Task status and result, with one page of the child tasks
     """
     from app.workers.celery_app import celery_app
+    from app.workers.results import expand_result
     
     task = celery_app.AsyncResult(task_id)
     
@@ -55,12 +72,158 @@ async def get_playlist_task_status(task_id: str):
         status = TaskStatus.COMPLETED
     elif task.state == "FAILURE":
         status = TaskStatus.FAILED
+    elif task.state == "REVOKED":
+        status = TaskStatus.CANCELLED
     else:
         status = TaskStatus.PROCESSING
     
     return TaskStatusResponse(
         task_id=task_id,
         status=status,
-        result=task.result if task.state == "SUCCESS" else None,
+        result=expand_result(
+            task.backend, task_id, task.result, max(offset, 0), max(1, min(limit, 1000))
+        ) if task.state == "SUCCESS" else None,
         error=str(task.info) if task.state == "FAILURE" else None
     )
+
+
+@router.delete("/{task_id}", response_model=TaskResponse)
+async def cancel_playlist(task_id: str):
+    """
+    Cancel a playlist download task and all of its track tasks.
+    
+    A playlist that is still queueing tracks stops and cancels the ones
+    it queued; once it has finished, its track tasks are cancelled here.
+    
+    Args:
+        task_id: The task ID returned from the download endpoint
+    
+    Returns:
+        Task ID and status
+    """
+    from app.workers.celery_app import celery_app
+    from app.workers.cancellation import cancel_tasks, child_task_ids, mark_cancelled
+    
+    if not celery_app.backend.is_known(task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    try:
+        # Flag the playlist before reading its result, so it can't finish queueing unseen
+        cancel_tasks(celery_app, [task_id])
+        task = celery_app.AsyncResult(task_id)
+        if task.state == "SUCCESS":
+            children = child_task_ids(task.backend, task_id, task.result)
+            cancel_tasks(celery_app, children)
+        else:
+            children = []
+            mark_cancelled(task.backend, task_id, download_playlist_task.name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to cancel task: {str(e)}")
+    
+    return TaskResponse(
+        task_id=task_id,
+        status=TaskStatus.CANCELLED,
+        message=(
+            f"Playlist download task and {len(children)} track tasks have been cancelled"
+            if children else "Playlist download task has been cancelled"
+        )
+    )
+
+
+@router.get("/{task_id}/archive")
+async def download_playlist_archive(task_id: str):
+    """
+    Download a playlist's finished tracks as one ZIP archive.
+    
+    The archive is streamed while it is written, straight from the files,
+    and holds every track that has finished downloading plus a
+    playlist.m3u8 in the playlist's order. Tracks still downloading are
+    left out.
+    
+    Args:
+        task_id: The task ID returned from the download endpoint
+    
+    Returns:
+        ZIP archive
+    """
+    from app.workers.celery_app import celery_app
+    
+    task = celery_app.AsyncResult(task_id)
+    if task.state != "SUCCESS" or not isinstance(task.result, dict) or not task.result.get("success"):
+        raise HTTPException(status_code=404, detail="Playlist has not finished queueing its tracks")
+    
+    tracks = await run_in_threadpool(_archive_tracks, task.backend, task_id, task.result)
+    if not tracks:
+        raise HTTPException(status_code=404, detail="No track of the playlist has been downloaded yet")
+    
+    members = [("playlist.m3u8", m3u_playlist((title, name) for title, name, _ in tracks))]
+    added = set()
+    for _, name, source in tracks:
+        # A track listed twice, or linked to the same recording, is archived once
+        if name not in added:
+            added.add(name)
+            members.append((name, source))
+    
+    return StreamingResponse(
+        stream_zip(members),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="playlist-{task_id}.zip"'}
+    )
+
+
+def _archive_tracks(backend, task_id: str, result: Dict) -> List[Tuple[str, str, Any]]:
+    """
+    Find the downloaded files of a playlist's tracks.
+    
+    Args:
+        backend: Result backend the playlist result came from
+        task_id: ID of the playlist task
+        result: Playlist task result
+    
+    Returns:
+        (title, name in the archive, path or opener of the stored object)
+        of each track, in playlist order
+    """
+    from app.workers.results import iter_children
+    
+    found = []
+    children = list(iter_children(backend, task_id, result, "tasks"))
+    for start in range(0, len(children), RESULT_BATCH_SIZE):
+        batch = children[start:start + RESULT_BATCH_SIZE]
+        values = backend.mget([backend.get_key_for_task(child["task_id"]) for child in batch])
+        for child, value in zip(batch, values):
+            if value is None:
+                continue
+            meta = backend.decode_result(value)
+            track = meta.get("result")
+            if meta.get("status") == "SUCCESS" and isinstance(track, dict) and track.get("file"):
+                found.append((child, track["file"], track.get("storage_key")))
+    for entry in iter_children(backend, task_id, result, "already_downloaded"):
+        found.append((entry, entry["file"], None))
+    
+    # Results from before positions were recorded keep their listed order
+    found.sort(key=lambda item: item[0].get("position", float("inf")))
+    
+    storage = get_storage()
+    tracks = []
+    for entry, file, key in found:
+        name = _archive_name(file)
+        if key and storage is not None:
+            path = storage.local_path(key)
+            source = path if path is not None else partial(storage.open, key)
+            if path is not None and not path.is_file():
+                continue
+        else:
+            source = resolve_download(file)
+            if source is None:
+                continue
+        tracks.append((f"{entry['artist']} - {entry['track']}", name, source))
+    return tracks
+
+
+def _archive_name(file: str) -> str:
+    """Name a track's file in the archive by its path below the download directory."""
+    path = Path(file)
+    if path.is_relative_to(settings.download_dir):
+        return path.relative_to(settings.download_dir).as_posix()
+    return path.name
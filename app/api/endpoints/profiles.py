@@ -0,0 +1,57 @@
+"""
+Worker task profile endpoints.
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+
+from app.utils.profiling import profiler
+
+router = APIRouter()
+
+
+@router.get("")
+async def list_profiles(limit: int = 50):
+    """
+    List recently captured task profiles.
+    
+    Args:
+        limit: Maximum number of profiles to return
+    
+    Returns:
+        Profile summaries, newest first
+    """
+    return {"profiles": profiler.list_profiles(limit=limit)}
+
+
+@router.get("/{task_id}")
+async def get_profile(task_id: str, sort: str = "cumulative", limit: int = 40, raw: bool = False):
+    """
+    Fetch a captured task profile.
+    
+    Args:
+        task_id: ID of the profiled task
+        sort: pstats sort key for the text report
+        limit: Number of functions in the text report
+        raw: Return the pstats dump (for snakeviz, pstats.Stats) instead of text
+    
+    Returns:
+        Text report or raw pstats data
+    """
+    if raw:
+        data = profiler.load_raw(task_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return Response(
+            content=data,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{task_id}.prof"'}
+        )
+    
+    try:
+        report = profiler.render(task_id, sort=sort, limit=limit)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Invalid sort key: {sort}")
+    
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(report)
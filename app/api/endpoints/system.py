@@ -0,0 +1,73 @@
+"""
+Operational endpoints for inspecting worker nodes.
+"""
+from fastapi import APIRouter, HTTPException
+
+from app.utils.http import metrics as http_metrics
+from app.utils.resilience import breaker_states
+
+router = APIRouter()
+
+
+@router.get("/transcode")
+async def get_transcode_stats(timeout: float = 1.0):
+    """
+    Get transcode pool statistics from every worker node.
+    
+    Args:
+        timeout: Seconds to wait for worker replies
+    
+    Returns:
+        Statistics keyed by worker hostname
+    """
+    from app.workers.celery_app import celery_app
+    
+    try:
+        replies = celery_app.control.inspect(timeout=timeout)._request("transcode_stats")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Failed to reach workers: {str(e)}")
+    
+    return {"workers": replies or {}}
+
+
+@router.get("/http")
+async def get_http_stats(workers: bool = True, timeout: float = 1.0):
+    """
+    Get connection reuse statistics of the shared HTTP clients.
+    
+    Args:
+        workers: Also ask every worker node for its counters
+        timeout: Seconds to wait for worker replies
+    
+    Returns:
+        Counters of this process (which runs the standalone engine's
+        downloads) and, if requested, the totals of each worker node's
+        processes keyed by hostname
+    """
+    stats = {"api": http_metrics.snapshot()}
+    if workers:
+        from app.workers.celery_app import celery_app
+        
+        try:
+            stats["workers"] = celery_app.control.inspect(timeout=timeout)._request("http_stats") or {}
+        except Exception as e:
+            stats["workers_error"] = str(e)
+    return stats
+
+
+@router.get("/breakers")
+async def get_breaker_states():
+    """
+    Get the circuit breaker of each external dependency.
+    
+    Breaker state is shared by all workers through Redis, so an open
+    breaker here is why tracks are being retried instead of downloaded.
+    
+    Returns:
+        State, consecutive failures and, while open, seconds until the
+        next probe, keyed by dependency
+    """
+    # Importing the Celery app switches breakers to the shared Redis store
+    from app.workers.celery_app import celery_app  # noqa: F401
+    
+    return {"breakers": breaker_states()}
@@ -4,6 +4,8 @@ Track download endpoints.
 from fastapi import APIRouter, HTTPException
 from app.models import TrackDownloadRequest, TaskResponse, TaskStatus, TaskStatusResponse
 from app.workers.tasks import download_track_task
+from app.utils.ffmpeg import parse_formats
+from app.utils.profiling import PROFILE_HEADER
 
 router = APIRouter()
 
@@ -19,9 +21,18 @@ async def download_track(request: TrackDownloadRequest):
     Returns:
         Task ID and status
     """
+    try:
+        parse_formats(request.formats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Enqueue the task
-        task = download_track_task.delay(request.url)
+        task = download_track_task.apply_async(
+            args=[request.url],
+            kwargs={"formats": request.formats} if request.formats else None,
+            headers={PROFILE_HEADER: True} if request.profile else None
+        )
         
         return TaskResponse(
             task_id=task.id,
@@ -55,6 +66,8 @@ async def get_task_status(task_id: str):
         status = TaskStatus.COMPLETED
     elif task.state == "FAILURE":
         status = TaskStatus.FAILED
+    elif task.state == "REVOKED":
+        status = TaskStatus.CANCELLED
     else:
         status = TaskStatus.PROCESSING
     
@@ -63,4 +76,42 @@ async def get_task_status(task_id: str):
         status=status,
         result=task.result if task.state == "SUCCESS" else None,
         error=str(task.info) if task.state == "FAILURE" else None
-    )
\ No newline at end of file
+    )
+
+
+@router.delete("/{task_id}", response_model=TaskResponse)
+async def cancel_track(task_id: str):
+    """
+    Cancel a track download task.
+    
+    A queued task is dropped before it starts; a running one aborts its
+    download or kills its encode within a second, removes its partial
+    files and frees the worker for other users' tasks.
+    
+    Args:
+        task_id: The task ID returned from the download endpoint
+    
+    Returns:
+        Task ID and status
+    """
+    from app.workers.celery_app import celery_app
+    from app.workers.cancellation import cancel_tasks, mark_cancelled
+    
+    task = celery_app.AsyncResult(task_id)
+    if not task.backend.is_known(task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task.state in ("SUCCESS", "FAILURE"):
+        raise HTTPException(status_code=409, detail="Task has already finished")
+    
+    try:
+        cancel_tasks(celery_app, [task_id])
+        # Report the task as cancelled now, not once a worker gets to its message
+        mark_cancelled(task.backend, task_id, download_track_task.name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to cancel task: {str(e)}")
+    
+    return TaskResponse(
+        task_id=task_id,
+        status=TaskStatus.CANCELLED,
+        message="Track download task has been cancelled"
+    )
@@ -0,0 +1,435 @@
+"""
+Headless command line interface for bulk downloads.
+"""
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.models import TrackMetadata
+from app.services.library import LibraryIndex
+from app.services.library_scanner import LibraryScanner, LibraryFingerprinter, walk_audio_files
+from app.services.layout_migration import LayoutMigrator
+from app.services.metadata_service import MetadataService
+from app.services.pipeline import resolve_track, resolve_playlist, finish_track
+from app.services.url_parser import URLParser, URLType
+from app.utils.downloader import AudioDownloader
+from app.utils.ffmpeg import Loudness
+from app.utils.journal import JobJournal
+from app.utils.layout import PathLayout
+
+
+PLAYLIST_TYPES = (URLType.SPOTIFY_PLAYLIST, URLType.YOUTUBE_PLAYLIST)
+
+
+def read_urls(sources: Iterable[str], input_file: Optional[str]) -> List[str]:
+    """
+    Collect URLs from arguments and an input file ("-" for stdin).
+    
+    Args:
+        sources: URLs given on the command line
+        input_file: Path of a file with one URL per line, or "-"
+    
+    Returns:
+        List of URLs in input order
+    """
+    urls = list(sources)
+    if input_file:
+        stream = sys.stdin if input_file == "-" else open(input_file, encoding="utf-8")
+        with stream:
+            for line in stream:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    urls.append(line)
+    return urls
+
+
+def job_key(url_type: URLType, url_id: Optional[str], url: str) -> str:
+    """Build the dedupe/journal key of a URL."""
+    return f"{url_type.value}:{url_id or url}"
+
+
+class BulkRunner:
+    """Runs the download pipeline over many URLs with a resumable journal."""
+    
+    def __init__(
+        self,
+        journal: JobJournal,
+        output_dir: Path,
+        concurrency: int,
+        retry_failed: bool = True,
+        library: Optional[LibraryIndex] = None
+    ):
+        """
+        Initialize runner.
+        
+        Args:
+            journal: Journal recording completed stages
+            output_dir: Directory to save downloaded files
+            concurrency: Tracks processed at the same time
+            retry_failed: Retry jobs that failed in a previous run
+            library: Library index of output_dir, to skip tracks already in it
+        """
+        self.journal = journal
+        self.downloader = AudioDownloader(output_dir)
+        self.library = library
+        self.concurrency = concurrency
+        self.retry_failed = retry_failed
+        self.stats = {"completed": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        self._lock = threading.Lock()
+    
+    def classify(self, urls: Iterable[str]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], int]:
+        """
+        Dedupe URLs and split them into tracks and playlists.
+        
+        Args:
+            urls: Input URLs
+        
+        Returns:
+            Tuple of (track (key, url) list, playlist (key, url) list, unsupported count)
+        """
+        tracks, playlists, unsupported = {}, {}, 0
+        for url in urls:
+            url_type, url_id = URLParser.identify_url(url)
+            if url_type == URLType.UNKNOWN:
+                print(f"Skipping unsupported URL: {url}", file=sys.stderr)
+                unsupported += 1
+                continue
+            target = playlists if url_type in PLAYLIST_TYPES else tracks
+            target.setdefault(job_key(url_type, url_id, url), url)
+        return list(tracks.items()), list(playlists.items()), unsupported
+    
+    def expand_playlists(self, playlists: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Expand playlists into track jobs, reusing journaled expansions.
+        
+        Args:
+            playlists: Playlist (key, url) pairs
+        
+        Returns:
+            Track (key, url) pairs
+        """
+        tracks = []
+        for key, url in playlists:
+            state = self.journal.state(key)
+            if state and state.get("stage") == "expanded":
+                entries = state["entries"]
+            else:
+                try:
+                    _, entries = resolve_playlist(url)
+                except Exception as e:
+                    print(f"Failed to expand playlist {url}: {e}", file=sys.stderr)
+                    continue
+                self.journal.record(key, "expanded", url=url, entries=entries)
+            print(f"Playlist {url}: {len(entries)} tracks")
+            
+            for entry in entries:
+                url_type, url_id = URLParser.identify_url(entry["url"])
+                tracks.append((job_key(url_type, url_id, entry["url"]), entry["url"]))
+        return tracks
+    
+    def run(self, tracks: List[Tuple[str, str]]) -> None:
+        """
+        Process track jobs concurrently.
+        
+        Args:
+            tracks: Track (key, url) pairs
+        """
+        tracks = list(dict(tracks).items())
+        total = len(tracks)
+        done = 0
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.process_track, key, url): url for key, url in tracks}
+            for future in as_completed(futures):
+                done += 1
+                outcome, label = future.result()
+                symbol = {"completed": "✓", "skipped": "=", "failed": "✗"}[outcome]
+                print(f"[{done}/{total}] {symbol} {label}")
+    
+    def process_track(self, key: str, url: str) -> Tuple[str, str]:
+        """
+        Run the remaining stages of one track job.
+        
+        Args:
+            key: Job key
+            url: Track URL
+        
+        Returns:
+            Tuple of (outcome, display label)
+        """
+        state = self.journal.state(key) or {}
+        stage = state.get("stage")
+        
+        if stage == "tagged" or (stage == "failed" and not self.retry_failed):
+            self._count("skipped")
+            return "skipped", state.get("label", url)
+        
+        try:
+            url_type, _ = URLParser.identify_url(url)
+            if stage in ("resolved", "downloaded"):
+                youtube_url = state["youtube_url"]
+                metadata = TrackMetadata(**state["metadata"])
+            else:
+                _, youtube_url, metadata = resolve_track(url)
+                self.journal.record(
+                    key, "resolved", url=url, youtube_url=youtube_url,
+                    metadata=metadata.model_dump(), label=f"{metadata.artist} - {metadata.title}"
+                )
+            label = f"{metadata.artist} - {metadata.title}"
+            
+            existing = self.library.find(
+                spotify_id=metadata.spotify_id or None, youtube_url=youtube_url,
+                artist=metadata.artist, title=metadata.title
+            ) if self.library and stage != "downloaded" else None
+            if existing:
+                self.journal.record(key, "tagged", file=existing["path"])
+                self._count("skipped")
+                return "skipped", label
+            
+            # Fetch the cover art while the audio downloads
+            tags = MetadataService.prepare_tags_async(metadata)
+            output_file = Path(state["file"]) if stage == "downloaded" else None
+            loudness = Loudness(**state["loudness"]) if stage == "downloaded" and state.get("loudness") else None
+            if output_file is None or not output_file.exists():
+                output_file = self.downloader.download(youtube_url, metadata)
+                if not output_file:
+                    raise RuntimeError("Failed to download audio")
+                loudness = self.downloader.pop_loudness(output_file)
+                size = output_file.stat().st_size
+                self.journal.record(
+                    key, "downloaded", file=str(output_file), bytes=size,
+                    loudness=asdict(loudness) if loudness else None
+                )
+                self._count("bytes", size)
+            
+            result = finish_track(
+                output_file, metadata, url_type, youtube_url, library=self.library,
+                loudness=loudness, tags=tags
+            )
+            self.journal.record(key, "tagged", duplicate_of=result["duplicate_of"])
+            
+            self._count("completed")
+            return "completed", label
+        
+        except Exception as e:
+            self.journal.record(key, "failed", url=url, error=str(e))
+            self._count("failed")
+            return "failed", f"{url}: {e}"
+    
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+
+def cmd_download(args: argparse.Namespace) -> int:
+    """Download every URL from the arguments/input file."""
+    urls = read_urls(args.urls, args.input)
+    if not urls:
+        print("No URLs given. Pass URLs, --input FILE or --input - for stdin.", file=sys.stderr)
+        return 2
+    
+    output_dir = Path(args.output or settings.download_dir)
+    journal_path = Path(args.journal or output_dir / ".bulk-journal.jsonl")
+    
+    library = None
+    if settings.library_index:
+        # The configured library belongs to DOWNLOAD_DIR; other outputs get their own
+        library = LibraryIndex(output_dir / ".library.sqlite3" if args.output else None)
+    
+    started = time.perf_counter()
+    with JobJournal(journal_path) as journal:
+        runner = BulkRunner(
+            journal, output_dir, args.concurrency, retry_failed=not args.skip_failed, library=library
+        )
+        tracks, playlists, unsupported = runner.classify(urls)
+        tracks += runner.expand_playlists(playlists)
+        print(f"{len(tracks)} unique tracks ({len(urls)} URLs, {unsupported} unsupported), "
+              f"concurrency {args.concurrency}, journal {journal_path}")
+        runner.run(tracks)
+    elapsed = time.perf_counter() - started
+    if library:
+        library.close()
+    
+    stats = runner.stats
+    print()
+    print(f"Completed: {stats['completed']}  Skipped (already done): {stats['skipped']}  "
+          f"Failed: {stats['failed']}")
+    print(f"Elapsed: {elapsed:.1f}s  Throughput: {stats['completed'] / elapsed * 60:.1f} tracks/min, "
+          f"{stats['bytes'] / 1e6 / elapsed:.2f} MB/s ({stats['bytes'] / 1e6:.1f} MB written)")
+    return 1 if stats["failed"] else 0
+
+
+def cmd_scan(args: argparse.Namespace) -> int:
+    """Index the audio files already present in a directory."""
+    root = Path(args.directory or settings.download_dir)
+    library = LibraryIndex(args.db or (root / ".library.sqlite3" if args.directory else None))
+    
+    print(f"Scanning {root} into {library.db_path} with {args.workers or 'all'} workers...")
+    stats = LibraryScanner(library, workers=args.workers).scan(root, prune=not args.keep_missing)
+    library.close()
+    
+    print(f"Files: {stats['files']}  Unchanged: {stats['unchanged']}  Indexed: {stats['indexed']}  "
+          f"Failed: {stats['failed']}  Removed: {stats['removed']}")
+    print(f"Elapsed: {stats['elapsed']:.1f}s")
+    return 1 if stats["failed"] else 0
+
+
+def cmd_fingerprint(args: argparse.Namespace) -> int:
+    """Fingerprint indexed files and find duplicate recordings."""
+    root = Path(args.directory or settings.download_dir)
+    library = LibraryIndex(args.db or (root / ".library.sqlite3" if args.directory else None))
+    
+    print(f"Fingerprinting {root} with {args.workers or 'all'} workers...")
+    stats = LibraryFingerprinter(library, workers=args.workers).run(root, link=args.link)
+    library.close()
+    
+    print(f"Fingerprinted: {stats['fingerprinted']}/{stats['files']}  Duplicates: {stats['duplicates']}  "
+          f"Linked: {stats['linked']}  Failed: {stats['failed']}")
+    print(f"Elapsed: {stats['elapsed']:.1f}s")
+    return 1 if stats["failed"] else 0
+
+
+def cmd_migrate(args: argparse.Namespace) -> int:
+    """Move existing files into the configured path layout."""
+    root = Path(args.directory or settings.download_dir)
+    layout = PathLayout(root, args.template)
+    library = None
+    if settings.library_index and not args.dry_run:
+        library = LibraryIndex(args.db or (root / ".library.sqlite3" if args.directory else None))
+    
+    print(f"Migrating {root} to layout '{layout.template}' with {args.workers} workers...")
+    stats = LayoutMigrator(layout, workers=args.workers, library=library).migrate(dry_run=args.dry_run)
+    if library:
+        library.close()
+    
+    print(f"Moved: {stats['moved']}/{stats['planned']}  Already in place: {stats['in_place']}  "
+          f"Failed: {stats['failed']}")
+    print(f"Elapsed: {stats['elapsed']:.1f}s")
+    return 1 if stats["failed"] else 0
+
+
+def album_files(paths: Iterable[str]) -> List[Path]:
+    """
+    Collect the audio files named by files, directories and M3U playlists.
+    
+    Args:
+        paths: Command line paths
+    
+    Returns:
+        Audio files in the given order, without duplicates
+    """
+    files: List[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files += sorted(Path(entry.path) for entry in walk_audio_files(path))
+        elif path.suffix.lower() in (".m3u", ".m3u8"):
+            for line in path.read_text(encoding="utf-8", errors="replace").splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    files.append(path.parent / line)
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def cmd_album_gain(args: argparse.Namespace) -> int:
+    """Write ReplayGain album gain/peak to a set of tagged tracks."""
+    files = album_files(args.paths)
+    stats = MetadataService.write_album_gain(files)
+    if stats is None:
+        print(f"None of the {len(files)} files has a ReplayGain track gain.", file=sys.stderr)
+        return 1
+    
+    print(f"Album gain: {stats['album_gain']:+.2f} dB  Album peak: {stats['album_peak']:.6f}  "
+          f"Tracks: {stats['tracks']}  Skipped: {len(stats['skipped'])}")
+    for path in stats["skipped"]:
+        print(f"Skipped (no track gain): {path}")
+    return 0
+
+
+def cmd_results_report(args: argparse.Namespace) -> int:
+    """Show the Redis memory used by task results per task type."""
+    from app.workers.celery_app import celery_app
+    from app.workers.results import CompactRedisBackend, memory_report
+    
+    backend = celery_app.backend
+    if not isinstance(backend, CompactRedisBackend):
+        print(f"Result backend {type(backend).__name__} is not supported.", file=sys.stderr)
+        return 2
+    
+    report = memory_report(backend, batch_size=args.batch_size)
+    total_keys = sum(entry["keys"] for entry in report.values())
+    total_bytes = sum(entry["bytes"] for entry in report.values())
+    print(f"{'Task type':<36} {'Keys':>9} {'Memory':>12} {'Avg/key':>10}")
+    for kind, entry in sorted(report.items(), key=lambda item: item[1]["bytes"], reverse=True):
+        print(f"{kind:<36} {entry['keys']:>9} {entry['bytes'] / 1e6:>10.2f}MB "
+              f"{entry['bytes'] / entry['keys']:>9.0f}B")
+    print(f"{'Total':<36} {total_keys:>9} {total_bytes / 1e6:>10.2f}MB")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(prog="music-download", description="Music Downloader command line")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    download = commands.add_parser("download", help="Download tracks and playlists in bulk")
+    download.add_argument("urls", nargs="*", help="Spotify/YouTube track or playlist URLs")
+    download.add_argument("-i", "--input", help="File with one URL per line ('-' for stdin)")
+    download.add_argument("-o", "--output", help="Download directory (default: DOWNLOAD_DIR)")
+    download.add_argument("-j", "--concurrency", type=int, default=settings.max_workers,
+                          help="Tracks processed at the same time")
+    download.add_argument("--journal", help="Journal file (default: <output>/.bulk-journal.jsonl)")
+    download.add_argument("--skip-failed", action="store_true",
+                          help="Don't retry jobs that failed in a previous run")
+    download.set_defaults(func=cmd_download)
+    
+    scan = commands.add_parser("scan", help="Rebuild the library index from existing files")
+    scan.add_argument("directory", nargs="?", help="Directory to scan (default: DOWNLOAD_DIR)")
+    scan.add_argument("--db", help="Library index file (default: <directory>/.library.sqlite3)")
+    scan.add_argument("-w", "--workers", type=int, help="Reader processes (default: CPU count)")
+    scan.add_argument("--keep-missing", action="store_true",
+                      help="Keep index rows of files that no longer exist")
+    scan.set_defaults(func=cmd_scan)
+    
+    fingerprint = commands.add_parser("fingerprint", help="Fingerprint the library and find duplicates")
+    fingerprint.add_argument("directory", nargs="?", help="Library directory (default: DOWNLOAD_DIR)")
+    fingerprint.add_argument("--db", help="Library index file (default: <directory>/.library.sqlite3)")
+    fingerprint.add_argument("-w", "--workers", type=int, help="Decoder processes (default: CPU count)")
+    fingerprint.add_argument("--link", action="store_true",
+                             help="Replace duplicate recordings with hard links to the first copy")
+    fingerprint.set_defaults(func=cmd_fingerprint)
+    
+    migrate = commands.add_parser("migrate", help="Move existing files into the PATH_TEMPLATE layout")
+    migrate.add_argument("directory", nargs="?", help="Directory to migrate (default: DOWNLOAD_DIR)")
+    migrate.add_argument("-t", "--template", help="Path template (default: PATH_TEMPLATE)")
+    migrate.add_argument("--db", help="Library index file to update (default: <directory>/.library.sqlite3)")
+    migrate.add_argument("-w", "--workers", type=int, default=16, help="Threads reading tags and moving files")
+    migrate.add_argument("-n", "--dry-run", action="store_true", help="Print the planned moves only")
+    migrate.set_defaults(func=cmd_migrate)
+    
+    album_gain = commands.add_parser("album-gain", help="Write ReplayGain album gain from the track tags")
+    album_gain.add_argument("paths", nargs="+", help="Album files, directories or .m3u playlists")
+    album_gain.set_defaults(func=cmd_album_gain)
+    
+    results_report = commands.add_parser("results-report", help="Show Redis memory used by task results")
+    results_report.add_argument("--batch-size", type=int, default=500, help="Keys measured per round trip")
+    results_report.set_defaults(func=cmd_results_report)
+    
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the command line interface."""
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,8 +19,92 @@ class Settings(BaseSettings):
     # Application
     download_dir: Path = Path("/app/downloads")
     max_workers: int = 4
+    audio_bitrate: int = 192  # MP3 output bitrate in kbps
+    streaming_transcode: bool = False  # Encode while downloading via an ffmpeg pipe
+    efficient_format_selection: bool = True  # Smallest audio-only source meeting audio_bitrate
+    loudness_analysis: bool = True  # Measure EBU R128 loudness during the encode for ReplayGain tags
+    tag_padding_kb: int = 256  # Space reserved in each MP3's ID3 header for tags and cover art
+    
+    # Path of each file below download_dir, e.g. "{artist}/{album}/{artist} - {title}"
+    # or "{hash:.2}/{artist} - {title}" for hash-prefix shards
+    path_template: str = "{artist} - {title}"
+    
+    # Library index (skip tracks that were already downloaded)
+    library_index: bool = True
+    library_db: Optional[Path] = None  # Defaults to <download_dir>/.library.sqlite3
+    fingerprint_dedup: bool = True  # Link re-downloads of the same recording to the existing file
+    
+    # Parallel downloads
+    fragment_concurrency: int = 4  # Connections per download (fragments / HTTP ranges)
+    worker_connection_limit: int = 8  # Connections shared by all downloads of a worker process
+    range_chunk_size: int = 1024 * 1024
+    external_downloader: Optional[str] = None  # e.g. "aria2c" for multi-connection HTTP
+    
+    # Shared HTTP client (pooled keep-alive connections for every service)
+    http2: bool = True  # Used when the h2 package is installed
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0  # Seconds an idle connection is kept open
+    http_timeout: float = 10.0
+    http_retries: int = 2  # Retries of idempotent requests on connection errors, 429 and 5xx
+    
+    # Transcode pool (workers then run with --pool=threads to share it; prefork is refused)
+    transcode_pool: bool = False
+    transcode_workers: int = 0  # 0 = one encoder process per CPU core
+    transcode_queue_size: Optional[int] = None  # Defaults to 2x transcode_workers
+    fetch_threads: int = 0  # Worker threads with the pool; 0 = running + queued encodes + transcode_workers
+    
+    # Task results in Redis (seconds until they expire, per task type)
+    result_expires: int = 24 * 3600
+    result_expires_track: int = 24 * 3600
+    result_expires_playlist: int = 24 * 3600
+    result_compress_threshold: int = 1024  # zlib-compress encoded results larger than this (bytes)
+    
+    # Worker processes
+    worker_prewarm: bool = True  # Load yt-dlp extractors when a worker process starts
+    worker_max_tasks_per_child: int = 500  # Recycle a worker process after N tasks (0 = never)
+    ytdl_pool_size: int = 4  # Idle YoutubeDL instances kept per option profile
+    
+    # Retries of transient failures and circuit breakers per dependency (Spotify, YouTube)
+    task_max_retries: int = 4
+    task_retry_backoff: float = 10.0  # Seconds before the first retry, doubled for each further one
+    task_retry_backoff_max: float = 600.0
+    breaker_failure_threshold: int = 5  # Consecutive transient failures that open a breaker
+    breaker_reset_timeout: float = 60.0  # Seconds an open breaker fails fast before letting a probe through
+    
+    # Autoscaling (run the worker with --autoscale=MAX,MIN)
+    worker_autoscale: str = "8,1"  # MAX,MIN processes, read by the worker image's start command
+    autoscale_policy: str = "auto"  # "network", "transcode" or "auto" (transcode; tasks encode in-process)
+    autoscale_queue_interval: float = 5.0  # Seconds between broker queue depth checks
+    
+    # File delivery (GET /api/v1/files/{task_id})
+    file_offload: Optional[str] = None  # "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd)
+    file_offload_prefix: str = "/protected-downloads/"  # Internal nginx location aliased to download_dir
+    
+    # Artifact storage, so the API can serve files downloaded on other hosts
+    storage_backend: Optional[str] = None  # None (files stay in download_dir), "local" or "s3"
+    storage_dir: Optional[Path] = None  # "local": defaults to <download_dir>/.objects
+    storage_prefix: str = ""  # Prefix of the content-addressed keys
+    storage_redirect: bool = True  # "s3": redirect downloads to presigned URLs instead of proxying them
+    storage_url_expires: int = 3600  # Seconds a presigned URL stays valid
+    storage_part_size_mb: int = 8  # "s3": multipart upload part size
+    s3_bucket: str = "music"
+    s3_endpoint_url: Optional[str] = None  # e.g. http://minio:9000 for MinIO
+    s3_region: Optional[str] = None
+    s3_access_key: Optional[str] = None  # Default AWS credential chain when unset
+    s3_secret_key: Optional[str] = None
+    
+    # Standalone engine (run.py, no Redis/Celery)
+    standalone_network_workers: int = 8
+    standalone_db: Optional[Path] = None  # Persist task state to this SQLite file
+    
+    # Profiling
+    profile_sample_rate: int = 0  # Profile 1 in N tasks (0 disables sampling)
+    profiles_dir: Optional[Path] = None  # Defaults to <download_dir>/.profiles
+    profiles_keep: int = 200
     
     # API
+    bulk_max_urls: int = 10000  # URLs accepted by one bulk submission
     api_title: str = "Music Download API"
     api_version: str = "0.1.0"
     
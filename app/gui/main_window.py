@@ -2,131 +2,170 @@
 Desktop GUI for Music Downloader using PyQt6.
 """
 import sys
+import threading
+import time
+import uuid
 from pathlib import Path
+from typing import Dict
 from PyQt6.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QVBoxLayout, 
-    QHBoxLayout, QLineEdit, QPushButton, QTextEdit, 
-    QLabel, QProgressBar, QListWidget
+    QApplication, QMainWindow, QWidget, QVBoxLayout,
+    QHBoxLayout, QPlainTextEdit, QPushButton, QTextEdit,
+    QLabel, QProgressBar, QListWidget, QSpinBox,
+    QTableWidget, QTableWidgetItem, QHeaderView
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, Qt
 from PyQt6.QtGui import QFont
 
-from app.services.spotify_service import SpotifyService
-from app.services.youtube_service import YouTubeService
-from app.utils.downloader import AudioDownloader
+from app.config import settings
 from app.models import TrackMetadata
+from app.services.metadata_service import MetadataService
+from app.services.pipeline import resolve_track, resolve_playlist
+from app.services.url_parser import URLParser, URLType
+from app.utils.downloader import AudioDownloader
+from app.workers.cancellation import TaskCancelled
+
+
+DOWNLOAD_DIR = Path.home() / "Music" / "Music Downloader"
+
+# Queue table columns
+COL_TITLE, COL_STATUS, COL_PROGRESS, COL_SPEED, COL_CANCEL = range(5)
 
 
-class DownloadWorker(QThread):
-    """Background thread for downloading music."""
+class JobSignals(QObject):
+    """Signals emitted by a download job from its worker thread."""
     
-    progress = pyqtSignal(str)  # Status updates
-    finished = pyqtSignal(dict)  # Download result
-    error = pyqtSignal(str)  # Error message
+    titled = pyqtSignal(str, str)  # job_id, display title
+    status = pyqtSignal(str, str)  # job_id, status text
+    progress = pyqtSignal(str, int, float)  # job_id, percent (-1 if unknown), bytes/s
+    finished = pyqtSignal(str, dict)  # job_id, download result
+    error = pyqtSignal(str, str)  # job_id, error message
+
+
+class DownloadJob(QRunnable):
+    """A single track download, run on the download thread pool."""
     
-    def __init__(self, url: str):
+    def __init__(self, job_id: str, url: str, download_dir: Path):
         super().__init__()
+        self.setAutoDelete(False)
+        self.job_id = job_id
         self.url = url
-        # Initialize downloader with Music directory
-        download_dir = Path.home() / "Music" / "Music Downloader"
-        self.downloader = AudioDownloader(download_dir)
-
+        self.download_dir = download_dir
+        self.signals = JobSignals()
+        self.cancel_event = threading.Event()
+        self._last_progress = 0.0
+    
+    def cancel(self):
+        """Ask the running download or encode to stop at its next check."""
+        self.cancel_event.set()
+    
+    def _check_cancelled(self):
+        """Raise TaskCancelled once Cancel was pressed; kills a running encode."""
+        if self.cancel_event.is_set():
+            raise TaskCancelled("Cancelled by user")
+    
     def run(self):
         """Execute download in background."""
         try:
-            self.progress.emit("🔍 Analyzing URL...")
+            if self.cancel_event.is_set():
+                self.signals.error.emit(self.job_id, "Cancelled")
+                return
             
-            if "spotify.com" in self.url:
-                # Spotify download
-                self.progress.emit("🎵 Fetching Spotify metadata...")
-                spotify = SpotifyService()
-                metadata_dict = spotify.get_track_metadata(self.url)
-                
-                # Map Spotify field names to TrackMetadata field names
-                mapped_metadata = {
-                    'title': metadata_dict.get('name', 'Unknown'),
-                    'artist': metadata_dict.get('artist', 'Unknown Artist'),
-                    'album': metadata_dict.get('album', 'Unknown Album'),
-                    'year': metadata_dict.get('year'),
-                    'duration_ms': metadata_dict.get('duration') or 0,
-                    'spotify_id': metadata_dict.get('track_id', ''),
-                    'cover_art_url': metadata_dict.get('cover_url')
-                }
-                
-                metadata = TrackMetadata(**mapped_metadata)
-                
-                self.progress.emit(f"🔎 Searching YouTube for: {metadata.artist} - {metadata.title}")
-                youtube = YouTubeService()
-                youtube_url = youtube.search_track(metadata)
-                
-                if not youtube_url:
-                    self.error.emit("Could not find track on YouTube")
-                    return
-                
-                self.progress.emit("⬇️ Downloading audio...")
-                file_path = self.downloader.download(youtube_url, metadata)
-                
-                if file_path:
-                    result = {
-                        "track": metadata.title,
-                        "artist": metadata.artist,
-                        "file_path": str(file_path)
-                    }
-                    self.finished.emit(result)
-                else:
-                    self.error.emit("Download failed - no file created")
-                
-            else:
-                # Direct YouTube download
-                self.progress.emit("⬇️ Downloading from YouTube...")
-                
-                try:
-                    # Get video info first
-                    youtube = YouTubeService()
-                    video_metadata = youtube.get_video_metadata(self.url)
-                    
-                    if video_metadata:
-                        # Use extracted metadata
-                        metadata = video_metadata
-                        self.progress.emit(f"Found: {metadata.artist} - {metadata.title}")
-                    else:
-                        # Fallback: Create basic metadata
-                        metadata = TrackMetadata(
-                            title="Unknown",
-                            artist="Unknown",
-                            album="Unknown",
-                            year=None,
-                            duration_ms=0,
-                            spotify_id='',
-                            cover_art_url=None
-                        )
-                except Exception as e:
-                    print(f"Could not get YouTube metadata: {e}")
-                    # Fallback metadata
-                    metadata = TrackMetadata(
-                        title="Unknown",
-                        artist="Unknown",
-                        album="Unknown",
-                        year=None,
-                        duration_ms=0,
-                        spotify_id='',
-                        cover_art_url=None
-                    )
-                
-                file_path = self.downloader.download(self.url, metadata)
-                
+            youtube_url, metadata = self._resolve()
+            self.signals.titled.emit(self.job_id, f"{metadata.artist} - {metadata.title}")
+            
+            self.signals.status.emit(self.job_id, "Downloading")
+            downloader = AudioDownloader(self.download_dir)
+            file_path = downloader.download(
+                youtube_url, metadata, progress_hooks=[self._on_progress], cancel_check=self._check_cancelled
+            )
+            
+            if self.cancel_event.is_set():
+                # An encode that finished as Cancel was pressed leaves its file behind
                 if file_path:
-                    result = {
-                        "track": metadata.title,
-                        "artist": metadata.artist,
-                        "file_path": str(file_path)
-                    }
-                    self.finished.emit(result)
-                else:
-                    self.error.emit("Download failed - no file created")
+                    file_path.unlink(missing_ok=True)
+                self.signals.error.emit(self.job_id, "Cancelled")
+                return
+            
+            if not file_path:
+                self.signals.error.emit(self.job_id, "Download failed - no file created")
+                return
+            
+            self.signals.status.emit(self.job_id, "Tagging")
+            MetadataService.embed_metadata(file_path, metadata)
             
+            self.signals.finished.emit(self.job_id, {
+                "track": metadata.title,
+                "artist": metadata.artist,
+                "file_path": str(file_path)
+            })
+        
         except Exception as e:
-            self.error.emit(str(e))
+            self.signals.error.emit(self.job_id, str(e))
+    
+    def _resolve(self):
+        """Resolve the URL; YouTube videos whose metadata can't be read still download as "Unknown"."""
+        try:
+            _, youtube_url, metadata = resolve_track(
+                self.url,
+                lambda step: self.signals.status.emit(self.job_id, step)
+            )
+            return youtube_url, metadata
+        except Exception as e:
+            url_type, _ = URLParser.identify_url(self.url)
+            if url_type != URLType.YOUTUBE_VIDEO:
+                raise
+            print(f"Could not get YouTube metadata: {e}")
+            # Fallback metadata
+            return self.url, TrackMetadata(
+                title="Unknown",
+                artist="Unknown",
+                album="Unknown",
+                duration_ms=0,
+                spotify_id='',
+                cover_art_url=None
+            )
+    
+    def _on_progress(self, info: dict):
+        """yt-dlp progress hook: report progress and honour cancellation."""
+        self._check_cancelled()
+        
+        if info.get('status') != 'downloading':
+            return
+        
+        # Limit UI updates to a few per second
+        now = time.monotonic()
+        if now - self._last_progress < 0.2:
+            return
+        self._last_progress = now
+        
+        total = info.get('total_bytes') or info.get('total_bytes_estimate')
+        downloaded = info.get('downloaded_bytes') or 0
+        percent = int(downloaded * 100 / total) if total else -1
+        self.signals.progress.emit(self.job_id, percent, float(info.get('speed') or 0.0))
+
+
+class PlaylistSignals(QObject):
+    """Signals emitted while expanding a playlist."""
+    
+    expanded = pyqtSignal(str, list)  # playlist URL, list of {"url", "track", "artist"}
+    error = pyqtSignal(str, str)  # playlist URL, error message
+
+
+class PlaylistExpandJob(QRunnable):
+    """Resolve a playlist URL into track URLs in the background."""
+    
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self.signals = PlaylistSignals()
+    
+    def run(self):
+        """Expand the playlist in background."""
+        try:
+            _, entries = resolve_playlist(self.url)
+            self.signals.expanded.emit(self.url, entries)
+        except Exception as e:
+            self.signals.error.emit(self.url, str(e))
 
 
 class MainWindow(QMainWindow):
@@ -134,13 +173,22 @@ class MainWindow(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.download_worker = None
+        self.jobs: Dict[str, DownloadJob] = {}
+        self.job_rows: Dict[str, int] = {}
+        self.playlist_jobs = []
+        
+        # Downloads run on their own pool; playlist expansion never takes a download slot
+        self.download_pool = QThreadPool()
+        self.download_pool.setMaxThreadCount(settings.max_workers)
+        self.playlist_pool = QThreadPool()
+        self.playlist_pool.setMaxThreadCount(2)
+        
         self.init_ui()
     
     def init_ui(self):
         """Initialize the user interface."""
         self.setWindowTitle("🎵 Music Downloader")
-        self.setMinimumSize(800, 600)
+        self.setMinimumSize(900, 700)
         
         # Central widget
         central_widget = QWidget()
@@ -167,23 +215,25 @@ class MainWindow(QMainWindow):
         # URL input section
         input_layout = QHBoxLayout()
         
-        self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText("Paste Spotify or YouTube URL here...")
-        self.url_input.setMinimumHeight(40)
+        self.url_input = QPlainTextEdit()
+        self.url_input.setPlaceholderText(
+            "Paste Spotify or YouTube URLs here (tracks or playlists, one per line)..."
+        )
+        self.url_input.setMaximumHeight(80)
         self.url_input.setStyleSheet("""
-            QLineEdit {
+            QPlainTextEdit {
                 padding: 10px;
                 border: 2px solid #ddd;
                 border-radius: 5px;
                 font-size: 14px;
             }
-            QLineEdit:focus {
+            QPlainTextEdit:focus {
                 border-color: #1DB954;
             }
         """)
         input_layout.addWidget(self.url_input)
         
-        self.download_btn = QPushButton("Download")
+        self.download_btn = QPushButton("Add to Queue")
         self.download_btn.setMinimumHeight(40)
         self.download_btn.setMinimumWidth(120)
         self.download_btn.setStyleSheet("""
@@ -210,23 +260,37 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(input_layout)
         
-        # Progress bar
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setVisible(False)
-        self.progress_bar.setTextVisible(False)
-        self.progress_bar.setMinimumHeight(8)
-        self.progress_bar.setStyleSheet("""
-            QProgressBar {
-                border: none;
-                border-radius: 4px;
-                background-color: #f0f0f0;
-            }
-            QProgressBar::chunk {
-                background-color: #1DB954;
-                border-radius: 4px;
+        # Concurrency control
+        concurrency_layout = QHBoxLayout()
+        concurrency_layout.addWidget(QLabel("Parallel downloads:"))
+        self.concurrency_input = QSpinBox()
+        self.concurrency_input.setRange(1, 16)
+        self.concurrency_input.setValue(settings.max_workers)
+        self.concurrency_input.valueChanged.connect(self.download_pool.setMaxThreadCount)
+        concurrency_layout.addWidget(self.concurrency_input)
+        concurrency_layout.addStretch()
+        layout.addLayout(concurrency_layout)
+        
+        # Download queue
+        queue_label = QLabel("Download Queue:")
+        queue_label.setFont(QFont("Arial", 12, QFont.Weight.Bold))
+        layout.addWidget(queue_label)
+        
+        self.queue_table = QTableWidget(0, 5)
+        self.queue_table.setHorizontalHeaderLabels(["Track", "Status", "Progress", "Speed", ""])
+        self.queue_table.verticalHeader().setVisible(False)
+        self.queue_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        header = self.queue_table.horizontalHeader()
+        header.setSectionResizeMode(COL_TITLE, QHeaderView.ResizeMode.Stretch)
+        for column in (COL_STATUS, COL_PROGRESS, COL_SPEED, COL_CANCEL):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        self.queue_table.setStyleSheet("""
+            QTableWidget {
+                border: 1px solid #ddd;
+                border-radius: 5px;
             }
         """)
-        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.queue_table)
         
         # Status text
         self.status_text = QTextEdit()
@@ -251,6 +315,7 @@ class MainWindow(QMainWindow):
         layout.addWidget(history_label)
         
         self.history_list = QListWidget()
+        self.history_list.setMaximumHeight(120)
         self.history_list.setStyleSheet("""
             QListWidget {
                 border: 1px solid #ddd;
@@ -269,38 +334,112 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.history_list)
         
         # Download folder info
-        download_path = Path.home() / "Music" / "Music Downloader"
-        download_path.mkdir(parents=True, exist_ok=True)
+        DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
         
-        footer = QLabel(f"Downloads saved to: {download_path}")
+        footer = QLabel(f"Downloads saved to: {DOWNLOAD_DIR}")
         footer.setStyleSheet("color: #666; font-size: 11px;")
         footer.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(footer)
     
     def start_download(self):
-        """Start downloading the track."""
-        url = self.url_input.text().strip()
+        """Queue every URL in the input box."""
+        urls = self.url_input.toPlainText().split()
         
-        if not url:
+        if not urls:
             self.update_status("❌ Please enter a URL")
             return
         
-        if not ("spotify.com" in url or "youtube.com" in url or "youtu.be" in url):
-            self.update_status("❌ Invalid URL. Please use Spotify or YouTube links.")
+        for url in dict.fromkeys(urls):
+            url_type, _ = URLParser.identify_url(url)
+            
+            if url_type == URLType.UNKNOWN:
+                self.update_status(f"❌ Invalid URL (use Spotify or YouTube links): {url}")
+            elif url_type in (URLType.SPOTIFY_PLAYLIST, URLType.YOUTUBE_PLAYLIST):
+                self.expand_playlist(url)
+            else:
+                self.enqueue_track(url, url)
+        
+        self.url_input.clear()
+    
+    def expand_playlist(self, url: str):
+        """Resolve a playlist in the background and queue its tracks."""
+        self.update_status(f"📃 Fetching playlist: {url}")
+        job = PlaylistExpandJob(url)
+        job.signals.expanded.connect(self.playlist_expanded)
+        job.signals.error.connect(
+            lambda playlist_url, error: self.update_status(f"❌ Playlist failed: {error}")
+        )
+        self.playlist_jobs.append(job)
+        self.playlist_pool.start(job)
+    
+    def playlist_expanded(self, url: str, entries: list):
+        """Queue the tracks of an expanded playlist."""
+        self.update_status(f"📃 Queued {len(entries)} tracks from playlist")
+        for entry in entries:
+            self.enqueue_track(entry["url"], f"{entry['artist']} - {entry['track']}")
+        self.playlist_jobs = [job for job in self.playlist_jobs if job.url != url]
+    
+    def enqueue_track(self, url: str, label: str):
+        """Add a track to the queue table and the download pool."""
+        job_id = uuid.uuid4().hex
+        row = self.queue_table.rowCount()
+        self.queue_table.insertRow(row)
+        self.queue_table.setItem(row, COL_TITLE, QTableWidgetItem(label))
+        self.queue_table.setItem(row, COL_STATUS, QTableWidgetItem("Queued"))
+        self.queue_table.setItem(row, COL_SPEED, QTableWidgetItem(""))
+        
+        progress_bar = QProgressBar()
+        progress_bar.setRange(0, 100)
+        progress_bar.setValue(0)
+        progress_bar.setMaximumHeight(16)
+        self.queue_table.setCellWidget(row, COL_PROGRESS, progress_bar)
+        
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(lambda: self.cancel_job(job_id))
+        self.queue_table.setCellWidget(row, COL_CANCEL, cancel_btn)
+        
+        job = DownloadJob(job_id, url, DOWNLOAD_DIR)
+        job.signals.titled.connect(self.job_titled)
+        job.signals.status.connect(self.job_status)
+        job.signals.progress.connect(self.job_progress)
+        job.signals.finished.connect(self.download_finished)
+        job.signals.error.connect(self.download_error)
+        
+        self.jobs[job_id] = job
+        self.job_rows[job_id] = row
+        self.download_pool.start(job)
+    
+    def cancel_job(self, job_id: str):
+        """Cancel a queued or running download."""
+        job = self.jobs.get(job_id)
+        if job is None:
             return
         
-        # Disable UI during download
-        self.download_btn.setEnabled(False)
-        self.url_input.setEnabled(False)
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setRange(0, 0)  # Indeterminate progress
-        
-        # Start download in background thread
-        self.download_worker = DownloadWorker(url)
-        self.download_worker.progress.connect(self.update_status)
-        self.download_worker.finished.connect(self.download_finished)
-        self.download_worker.error.connect(self.download_error)
-        self.download_worker.start()
+        if self.download_pool.tryTake(job):
+            # Never started: drop it from the queue right away
+            self.download_error(job_id, "Cancelled")
+        else:
+            job.cancel()
+            self.job_status(job_id, "Cancelling...")
+    
+    def job_titled(self, job_id: str, title: str):
+        """Show the resolved track name of a job."""
+        self.queue_table.item(self.job_rows[job_id], COL_TITLE).setText(title)
+    
+    def job_status(self, job_id: str, status: str):
+        """Show the current stage of a job."""
+        self.queue_table.item(self.job_rows[job_id], COL_STATUS).setText(status)
+    
+    def job_progress(self, job_id: str, percent: int, speed: float):
+        """Show download progress and speed of a job."""
+        row = self.job_rows[job_id]
+        progress_bar = self.queue_table.cellWidget(row, COL_PROGRESS)
+        if percent < 0:
+            progress_bar.setRange(0, 0)  # Indeterminate progress
+        else:
+            progress_bar.setRange(0, 100)
+            progress_bar.setValue(percent)
+        self.queue_table.item(row, COL_SPEED).setText(f"{speed / 1024 / 1024:.1f} MB/s")
     
     def update_status(self, message: str):
         """Update status text."""
@@ -310,7 +449,7 @@ class MainWindow(QMainWindow):
             self.status_text.verticalScrollBar().maximum()
         )
     
-    def download_finished(self, result: dict):
+    def download_finished(self, job_id: str, result: dict):
         """Handle successful download."""
         track = result.get("track", "Unknown")
         artist = result.get("artist", "Unknown")
@@ -320,20 +459,32 @@ class MainWindow(QMainWindow):
         # Add to history
         self.history_list.insertItem(0, f"✓ {artist} - {track}")
         
-        # Re-enable UI
-        self.reset_ui()
+        self.finish_job(job_id, "Done", 100)
     
-    def download_error(self, error: str):
+    def download_error(self, job_id: str, error: str):
         """Handle download error."""
-        self.update_status(f"❌ Error: {error}")
-        self.reset_ui()
+        label = self.queue_table.item(self.job_rows[job_id], COL_TITLE).text()
+        self.update_status(f"❌ {label}: {error}")
+        self.finish_job(job_id, error if error == "Cancelled" else "Failed", 0)
     
-    def reset_ui(self):
-        """Reset UI after download."""
-        self.download_btn.setEnabled(True)
-        self.url_input.setEnabled(True)
-        self.url_input.clear()
-        self.progress_bar.setVisible(False)
+    def finish_job(self, job_id: str, status: str, percent: int):
+        """Show a job's final state and release it."""
+        row = self.job_rows[job_id]
+        self.job_status(job_id, status)
+        self.queue_table.item(row, COL_SPEED).setText("")
+        progress_bar = self.queue_table.cellWidget(row, COL_PROGRESS)
+        progress_bar.setRange(0, 100)
+        progress_bar.setValue(percent)
+        self.queue_table.cellWidget(row, COL_CANCEL).setEnabled(False)
+        self.jobs.pop(job_id, None)
+    
+    def closeEvent(self, event):
+        """Stop queued and running downloads when the window closes."""
+        self.download_pool.clear()
+        for job in self.jobs.values():
+            job.cancel()
+        self.download_pool.waitForDone(5000)
+        super().closeEvent(event)
 
 
 def main():
@@ -350,4 +501,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,7 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 
 from app.config import settings
-from app.api.endpoints import tracks, playlists
+from app.api.endpoints import tracks, playlists, bulk, files, profiles, system
 
 app = FastAPI(
     title=settings.api_title,
@@ -19,13 +19,18 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8000", "http://127.0.0.1:8000"],
     allow_credentials=True,
-    allow_methods=["GET", "POST"],
-    allow_headers=["Content-Type"],
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["Content-Type", "Range", "If-None-Match", "If-Range"],
+    expose_headers=["Content-Range", "Content-Length", "ETag", "Accept-Ranges"],
 )
 
 # Include routers
 app.include_router(tracks.router, prefix="/api/v1/tracks", tags=["tracks"])
 app.include_router(playlists.router, prefix="/api/v1/playlists", tags=["playlists"])
+app.include_router(bulk.router, prefix="/api/v1/bulk", tags=["bulk"])
+app.include_router(files.router, prefix="/api/v1/files", tags=["files"])
+app.include_router(profiles.router, prefix="/api/v1/profiles", tags=["profiles"])
+app.include_router(system.router, prefix="/api/v1/system", tags=["system"])
 
 
 @app.get("/")
@@ -0,0 +1,133 @@
+"""
+Standalone FastAPI entry point that runs tasks in-process (no Redis/Celery).
+"""
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
+
+from app.config import settings
+from app.models import (
+    TrackDownloadRequest, PlaylistDownloadRequest, TaskResponse, TaskStatus, TaskStatusResponse
+)
+from app.standalone.engine import StandaloneEngine
+from app.utils.ffmpeg import parse_formats
+
+# Created with the server, not on import: spawned encoder processes import
+# the entry point again and must not open (and fail over) the task database
+engine: Optional[StandaloneEngine] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the in-process engine with the server."""
+    global engine
+    engine = StandaloneEngine()
+    await engine.start()
+    try:
+        yield
+    finally:
+        await engine.stop()
+        engine = None
+
+
+app = FastAPI(
+    title=settings.api_title,
+    version=settings.api_version,
+    description="Standalone API for downloading music from Spotify URLs",
+    lifespan=lifespan
+)
+
+# CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:8000", "http://127.0.0.1:8000"],
+    allow_credentials=True,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
+)
+
+tracks = APIRouter()
+playlists = APIRouter()
+
+
+def _task_status(task_id: str) -> TaskStatusResponse:
+    """Build the status response of an engine task."""
+    record = engine.get(task_id)
+    
+    if record is None:
+        # Same as Celery, which reports unknown task IDs as pending
+        return TaskStatusResponse(task_id=task_id, status=TaskStatus.PENDING)
+    
+    return TaskStatusResponse(
+        task_id=task_id,
+        status=record.status,
+        result=record.result if record.status == TaskStatus.COMPLETED else None,
+        error=record.error if record.status == TaskStatus.FAILED else None
+    )
+
+
+@tracks.post("/download", response_model=TaskResponse)
+async def download_track(request: TrackDownloadRequest):
+    """Submit a track download task."""
+    try:
+        parse_formats(request.formats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        task_id = engine.submit_track(request.url, request.formats)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue task: {str(e)}")
+    
+    return TaskResponse(
+        task_id=task_id,
+        status=TaskStatus.PENDING,
+        message="Track download task has been queued"
+    )
+
+
+@tracks.get("/status/{task_id}", response_model=TaskStatusResponse)
+async def get_task_status(task_id: str):
+    """Get the status of a download task."""
+    return _task_status(task_id)
+
+
+@playlists.post("/download", response_model=TaskResponse)
+async def download_playlist(request: PlaylistDownloadRequest):
+    """Submit a playlist download task."""
+    try:
+        task_id = engine.submit_playlist(request.url)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue task: {str(e)}")
+    
+    return TaskResponse(
+        task_id=task_id,
+        status=TaskStatus.PENDING,
+        message="Playlist download task has been queued"
+    )
+
+
+@playlists.get("/status/{task_id}", response_model=TaskStatusResponse)
+async def get_playlist_task_status(task_id: str):
+    """Get the status of a playlist download task."""
+    return _task_status(task_id)
+
+
+# Include routers
+app.include_router(tracks, prefix="/api/v1/tracks", tags=["tracks"])
+app.include_router(playlists, prefix="/api/v1/playlists", tags=["playlists"])
+
+
+@app.get("/")
+async def serve_frontend():
+    """Serve the web UI."""
+    return FileResponse('index.html')
+
+
+@app.get("/health")
+async def health_check():
+    """Health check endpoint."""
+    return {"status": "healthy", "mode": "standalone"}
@@ -12,11 +12,18 @@ class TaskStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class TrackDownloadRequest(BaseModel):
     """Request model for downloading a single track."""
     url: str = Field(..., description="Spotify track URL or YouTube video URL")
+    formats: Optional[List[str]] = Field(
+        None,
+        description='Output formats besides the library MP3, e.g. ["opus", "preview", "opus@96"], '
+                    'all encoded from a single download'
+    )
+    profile: bool = Field(False, description="Capture a cProfile profile of the worker task")
     
     class Config:
         json_schema_extra = {
@@ -61,3 +68,17 @@ class TaskStatusResponse(BaseModel):
     status: TaskStatus
     result: Optional[dict] = None
     error: Optional[str] = None
+
+
+class BulkTask(BaseModel):
+    """A task queued by a bulk submission."""
+    task_id: str
+    url: str  # Canonical URL
+    url_type: str
+
+
+class BulkDownloadResponse(BaseModel):
+    """Response model for bulk submissions."""
+    tasks: List[BulkTask]
+    duplicates: int = Field(0, description="URLs dropped as variants of an earlier one")
+    rejected: List[str] = Field(default_factory=list, description="URLs that are not supported")
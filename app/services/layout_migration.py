@@ -0,0 +1,174 @@
+"""
+Moves existing files into the configured download directory layout.
+"""
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.services.library import LibraryIndex
+from app.services.library_scanner import read_tags, walk_audio_files
+from app.utils.layout import PathLayout
+
+
+def _move(source: Path, target: Path) -> None:
+    """Move a file without ever replacing an existing target."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # link() fails if the target exists, unlike rename()
+        os.link(source, target)
+        os.unlink(source)
+    except FileExistsError:
+        raise
+    except OSError:
+        # Filesystems without hard links, or another device
+        if target.exists():
+            raise FileExistsError(str(target))
+        shutil.move(str(source), str(target))
+
+
+class LayoutMigrator:
+    """
+    Moves audio files below a root into a PathLayout.
+    
+    Targets are planned up front from the ID3 tags, in sorted order, so
+    the same files always get the same paths: a file whose target is
+    taken by a different track gets the layout's deterministic collision
+    suffix. Files already at their target are left alone, which makes
+    re-running an interrupted migration safe. Moves run in a thread pool.
+    """
+    
+    def __init__(self, layout: PathLayout, workers: int = 8, library: Optional[LibraryIndex] = None):
+        """
+        Initialize migrator.
+        
+        Args:
+            layout: Target layout (its root is the directory to migrate)
+            workers: Threads reading tags and moving files
+            library: Library index whose paths are updated as files move
+        """
+        self.layout = layout
+        self.root = Path(layout.root).resolve()
+        self.workers = workers
+        self.library = library
+    
+    def plan(self) -> Tuple[List[Tuple[Path, Path]], int]:
+        """
+        Compute the moves needed to reach the layout.
+        
+        Returns:
+            Tuple of ((source, target) moves, number of files already in place)
+        """
+        sources = sorted(Path(entry.path) for entry in walk_audio_files(self.root))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            tags = list(executor.map(lambda path: read_tags(str(path)), sources))
+        
+        preferred: Dict[Path, Tuple[Path, str]] = {}
+        for source, track in zip(sources, tags):
+            target = self.root / self.layout.relative_path(track["artist"], track["title"], track["album"])
+            # Stable across moves, and different for different encodes of a title
+            identity = f"{track['artist']}|{track['title']}|{track['album']}|{source.stat().st_size}"
+            preferred[source] = (target, identity)
+        
+        # Files already at their (possibly suffixed) target keep their paths
+        claimed = set()
+        pending = []
+        for source, (target, identity) in preferred.items():
+            if source in (target, self.layout.collision_path(target, identity)):
+                claimed.add(source)
+            else:
+                pending.append(source)
+        in_place = len(claimed)
+        
+        moves = []
+        for source in pending:
+            target, identity = preferred[source]
+            attempt = 0
+            while target in claimed or (target.exists() and target not in preferred):
+                attempt += 1
+                target = self.layout.collision_path(
+                    preferred[source][0], identity if attempt == 1 else f"{identity}#{attempt}"
+                )
+            claimed.add(target)
+            moves.append((source, target))
+        
+        return moves, in_place
+    
+    def migrate(self, dry_run: bool = False) -> Dict:
+        """
+        Move every file into the layout.
+        
+        Args:
+            dry_run: Only print the planned moves
+        
+        Returns:
+            Dictionary of migration statistics
+        """
+        started = time.perf_counter()
+        moves, in_place = self.plan()
+        
+        if dry_run:
+            for source, target in moves:
+                print(f"{source.relative_to(self.root)} -> {target.relative_to(self.root)}")
+            return {"moved": 0, "planned": len(moves), "in_place": in_place, "failed": 0,
+                    "elapsed": time.perf_counter() - started}
+        
+        # A target can be the current path of a file that moves later;
+        # moving in dependency order keeps every link() collision-free
+        ordered = self._order(moves)
+        
+        failed = 0
+        moved: List[Tuple[Path, Path]] = []
+        for batch in ordered:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(self._try_move, batch))
+            for (source, target), ok in zip(batch, results):
+                if ok:
+                    moved.append((source, target))
+                else:
+                    failed += 1
+        
+        if self.library and moved:
+            self.library.move([(str(source), str(target)) for source, target in moved])
+        self._remove_empty_dirs(source.parent for source, _ in moved)
+        
+        return {"moved": len(moved), "planned": len(moves), "in_place": in_place, "failed": failed,
+                "elapsed": time.perf_counter() - started}
+    
+    @staticmethod
+    def _order(moves: List[Tuple[Path, Path]]) -> List[List[Tuple[Path, Path]]]:
+        """Group moves into batches so no target is still occupied by a pending source."""
+        remaining = list(moves)
+        batches = []
+        while remaining:
+            sources = {source for source, _ in remaining}
+            ready = [move for move in remaining if move[1] not in sources]
+            if not ready:
+                # Only files swapping paths form a cycle; their moves fail
+                # and are reported instead of overwriting each other
+                ready = remaining
+            batches.append(ready)
+            done = set(ready)
+            remaining = [move for move in remaining if move not in done]
+        return batches
+    
+    @staticmethod
+    def _try_move(move: Tuple[Path, Path]) -> bool:
+        source, target = move
+        try:
+            _move(source, target)
+            return True
+        except Exception as e:
+            print(f"Error moving {source}: {e}")
+            return False
+    
+    def _remove_empty_dirs(self, directories) -> None:
+        for directory in sorted(set(directories), key=lambda path: len(path.parts), reverse=True):
+            while directory != self.root and self.root in directory.parents:
+                try:
+                    directory.rmdir()
+                except OSError:
+                    break
+                directory = directory.parent
@@ -0,0 +1,468 @@
+"""
+Index of the tracks already present in the download directory.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.models import TrackMetadata
+from app.services.url_parser import URLParser, URLType
+from app.services.youtube_service import YouTubeService
+from app.utils.fingerprint import best_alignment
+
+HASH_CHUNK_SIZE = 1024 * 1024
+FINGERPRINT_QUERY_BATCH = 500
+ID3V1_SIZE = 128
+
+COLUMNS = (
+    "path", "spotify_id", "youtube_id", "artist", "title", "album",
+    "norm_key", "file_hash", "size", "mtime", "added_at",
+)
+
+# Bumped when normalize_track() changes, so stored keys are rebuilt
+NORM_KEY_VERSION = 1
+
+# Placeholder artists that would make unrelated titles collide
+UNKNOWN_ARTISTS = ("Unknown", "Unknown Artist")
+
+# Decorations that differ between sources for the same recording
+_DECORATIONS = re.compile(
+    r"[\(\[][^\)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|remaster(ed)?)\b[^\)\]]*[\)\]]"
+)
+# Only remasters are the same recording; live, acoustic, edit and mix suffixes are kept
+_REMASTER_SUFFIX = re.compile(r"\s-\s[^-]*\bremaster(ed)?\b[^-]*$")
+_FEATURING = re.compile(r"\s[\(\[]?(feat\.?|ft\.?|featuring)\s.*$")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_track(artist: str, title: str) -> str:
+    """
+    Build a source-independent key from an artist and a title.
+    
+    Args:
+        artist: Artist name
+        title: Track title
+    
+    Returns:
+        Lowercase ASCII-folded key with decorations and punctuation removed
+    """
+    def clean(text: str) -> str:
+        text = unicodedata.normalize("NFKD", text or "")
+        text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+        text = _DECORATIONS.sub(" ", text)
+        text = _REMASTER_SUFFIX.sub("", text)
+        text = _FEATURING.sub("", text)
+        return _NON_WORD.sub(" ", text).strip()
+    
+    return f"{clean(artist)}|{clean(title)}"
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def audio_hash(file_path: Path) -> str:
+    """
+    Hash the audio data of an MP3 file, ignoring its ID3 tags.
+    
+    Re-tagging a file (new cover art, ReplayGain, ...) doesn't change
+    the hash, so it identifies the same encode across tag edits.
+    
+    Args:
+        file_path: Path to the MP3 file
+    
+    Returns:
+        Hex SHA-1 digest of the audio frames
+    """
+    digest = hashlib.sha1()
+    
+    with open(file_path, "rb") as f:
+        f.seek(0, 2)
+        end = f.tell()
+        
+        start = 0
+        f.seek(0)
+        header = f.read(10)
+        if len(header) == 10 and header[:3] == b"ID3":
+            start = 10 + _syncsafe(header[6:10])
+            if header[5] & 0x10:  # Footer present
+                start += 10
+        
+        if end - start >= ID3V1_SIZE:
+            f.seek(end - ID3V1_SIZE)
+            if f.read(3) == b"TAG":
+                end -= ID3V1_SIZE
+        
+        f.seek(start)
+        remaining = max(end - start, 0)
+        while remaining:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    
+    return digest.hexdigest()
+
+
+def youtube_id(url: Optional[str]) -> Optional[str]:
+    """Get the video ID of a YouTube URL, or None."""
+    if not url:
+        return None
+    url_type, video_id = URLParser.identify_url(url)
+    return video_id if url_type == URLType.YOUTUBE_VIDEO else None
+
+
+class LibraryIndex:
+    """
+    SQLite index of downloaded tracks.
+    
+    Lookups by Spotify ID, YouTube ID, normalized artist+title and audio
+    hash are all indexed, so checking a whole playlist against a large
+    library costs one query per track. Rows whose file was deleted are
+    treated as missing and pruned on lookup.
+    """
+    
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        Open (or create) the index.
+        
+        Args:
+            db_path: SQLite file, defaults to <download_dir>/.library.sqlite3
+        """
+        self.db_path = Path(db_path or settings.library_db or settings.download_dir / ".library.sqlite3")
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Shared by Celery worker processes, so wait on their write locks
+        self._db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " path TEXT PRIMARY KEY, spotify_id TEXT, youtube_id TEXT, artist TEXT,"
+            " title TEXT, album TEXT, norm_key TEXT, file_hash TEXT, size INTEGER,"
+            " mtime REAL, added_at REAL);"
+            "CREATE INDEX IF NOT EXISTS tracks_spotify_id ON tracks (spotify_id);"
+            "CREATE INDEX IF NOT EXISTS tracks_youtube_id ON tracks (youtube_id);"
+            "CREATE INDEX IF NOT EXISTS tracks_norm_key ON tracks (norm_key);"
+            "CREATE INDEX IF NOT EXISTS tracks_file_hash ON tracks (file_hash);"
+            # The primary key is the hash lookup index; track_id is tracks.rowid
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " hash INTEGER, track_id INTEGER, offset INTEGER,"
+            " PRIMARY KEY (hash, track_id, offset)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS fingerprinted (track_id INTEGER PRIMARY KEY, hashes INTEGER);"
+            # Fingerprints go stale when a file's audio changes or it leaves the index
+            "CREATE TRIGGER IF NOT EXISTS tracks_audio_changed AFTER UPDATE OF file_hash ON tracks"
+            " WHEN old.file_hash IS NOT new.file_hash BEGIN"
+            " DELETE FROM fingerprints WHERE track_id = old.rowid;"
+            " DELETE FROM fingerprinted WHERE track_id = old.rowid; END;"
+            "CREATE TRIGGER IF NOT EXISTS tracks_deleted AFTER DELETE ON tracks BEGIN"
+            " DELETE FROM fingerprints WHERE track_id = old.rowid;"
+            " DELETE FROM fingerprinted WHERE track_id = old.rowid; END;"
+        )
+        self._rebuild_keys()
+    
+    def _rebuild_keys(self) -> None:
+        """Recompute the normalized keys of an index made by an older normalize_track()."""
+        with self._lock, self._db:
+            version, = self._db.execute("PRAGMA user_version").fetchone()
+            if version >= NORM_KEY_VERSION:
+                return
+            rows = self._db.execute("SELECT path, artist, title FROM tracks").fetchall()
+            self._db.executemany(
+                "UPDATE tracks SET norm_key = ? WHERE path = ?",
+                [(normalize_track(row["artist"], row["title"]), row["path"]) for row in rows]
+            )
+            self._db.execute(f"PRAGMA user_version = {NORM_KEY_VERSION}")
+    
+    def add(
+        self,
+        file_path: Path,
+        metadata: TrackMetadata,
+        youtube_url: Optional[str] = None,
+        file_hash: Optional[str] = None
+    ) -> None:
+        """
+        Record a downloaded track.
+        
+        Args:
+            file_path: Path to the MP3 file
+            metadata: Track metadata
+            youtube_url: YouTube URL the audio was downloaded from
+            file_hash: Audio hash, computed from the file if not given
+        """
+        file_path = Path(file_path)
+        stat = file_path.stat()
+        video_id = youtube_id(youtube_url)
+        # YouTube-sourced metadata stores the video ID in spotify_id
+        spotify_id = metadata.spotify_id if metadata.spotify_id != video_id else None
+        self.upsert([{
+            "path": str(file_path.resolve()),
+            "spotify_id": spotify_id or None,
+            "youtube_id": video_id,
+            "artist": metadata.artist,
+            "title": metadata.title,
+            "album": metadata.album,
+            "file_hash": file_hash or audio_hash(file_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }])
+    
+    def upsert(self, rows: Iterable[Dict]) -> int:
+        """
+        Insert or update index rows in a single transaction.
+        
+        Args:
+            rows: Dictionaries keyed by column name; 'norm_key' and
+                'added_at' are filled in when missing
+        
+        Returns:
+            Number of rows written
+        """
+        values = []
+        for row in rows:
+            row = {
+                "norm_key": normalize_track(row.get("artist"), row.get("title")),
+                "added_at": time.time(),
+                **row,
+            }
+            values.append(tuple(row.get(column) for column in COLUMNS))
+        
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        # Source IDs can't be recovered from a file, so keep known ones on rescans
+        updates = ", ".join(
+            f"{column} = COALESCE(excluded.{column}, {column})" if column in ("spotify_id", "youtube_id")
+            else f"{column} = excluded.{column}"
+            for column in COLUMNS[1:]
+        )
+        with self._lock, self._db:
+            self._db.executemany(
+                f"INSERT INTO tracks ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(path) DO UPDATE SET {updates}",
+                values
+            )
+        return len(values)
+    
+    def file_stats(self, root: Optional[Path] = None) -> Dict[str, Tuple[int, float]]:
+        """
+        Get the size and mtime recorded for every indexed file.
+        
+        Args:
+            root: Only include files below this directory
+        
+        Returns:
+            Dictionary of path to (size, mtime)
+        """
+        query, params = "SELECT path, size, mtime FROM tracks", ()
+        if root is not None:
+            prefix = str(Path(root).resolve()).rstrip("/") + "/"
+            query, params = query + " WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+        with self._lock:
+            return {path: (size, mtime) for path, size, mtime in self._db.execute(query, params)}
+    
+    def find(
+        self,
+        spotify_id: Optional[str] = None,
+        youtube_url: Optional[str] = None,
+        artist: Optional[str] = None,
+        title: Optional[str] = None,
+        file_hash: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Find a downloaded track by any of its identifiers.
+        
+        Args:
+            spotify_id: Spotify track ID
+            youtube_url: YouTube video URL
+            artist: Artist name (used together with title)
+            title: Track title (used together with artist)
+            file_hash: Audio hash
+        
+        Returns:
+            Dictionary of the indexed track whose file still exists, or None
+        """
+        lookups: List[Tuple[str, str]] = []
+        if spotify_id:
+            lookups.append(("spotify_id", spotify_id))
+        video_id = youtube_id(youtube_url)
+        if video_id:
+            lookups.append(("youtube_id", video_id))
+        if artist and title and artist not in UNKNOWN_ARTISTS:
+            lookups.append(("norm_key", normalize_track(artist, title)))
+        if file_hash:
+            lookups.append(("file_hash", file_hash))
+        
+        for column, value in lookups:
+            with self._lock:
+                rows = self._db.execute(f"SELECT * FROM tracks WHERE {column} = ?", (value,)).fetchall()
+            for row in rows:
+                if Path(row["path"]).exists():
+                    return dict(row)
+                self.remove(row["path"])
+        return None
+    
+    def find_entry(self, entry: Dict) -> Optional[Dict]:
+        """
+        Find a playlist entry ({"url", "track", "artist"}) in the index.
+        
+        Args:
+            entry: Playlist entry as returned by resolve_playlist
+        
+        Returns:
+            Dictionary of the indexed track, or None
+        """
+        artist, title = entry.get("artist"), entry.get("track")
+        # YouTube playlist entries carry the raw video title; split it the
+        # same way get_video_metadata does for single videos
+        if artist == "YouTube" and title:
+            artist, title = YouTubeService()._parse_title(title)
+        return self.find(youtube_url=entry.get("url"), artist=artist, title=title)
+    
+    def missing(self, entries: Iterable[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Split playlist entries into those still to download and those already present.
+        
+        Args:
+            entries: Playlist entries
+        
+        Returns:
+            Tuple of (missing entries, present entries with their 'file')
+        """
+        missing, present = [], []
+        for entry in entries:
+            found = self.find_entry(entry)
+            if found:
+                present.append({**entry, "file": found["path"]})
+            else:
+                missing.append(entry)
+        return missing, present
+    
+    def add_fingerprint(self, file_path: Path, fingerprint: np.ndarray) -> None:
+        """
+        Store the acoustic fingerprint of an indexed file.
+        
+        Args:
+            file_path: Path of an indexed file
+            fingerprint: Array of (hash, offset) rows from fingerprint_file()
+        """
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT rowid FROM tracks WHERE path = ?", (str(Path(file_path).resolve()),)
+            ).fetchone()
+            if row is None:
+                return
+            track_id = row[0]
+            self._db.execute("DELETE FROM fingerprints WHERE track_id = ?", (track_id,))
+            self._db.executemany(
+                "INSERT OR IGNORE INTO fingerprints VALUES (?, ?, ?)",
+                [(int(hash_value), track_id, int(offset)) for hash_value, offset in fingerprint]
+            )
+            self._db.execute("INSERT OR REPLACE INTO fingerprinted VALUES (?, ?)", (track_id, len(fingerprint)))
+    
+    def match_fingerprint(self, fingerprint: np.ndarray, exclude: Optional[Path] = None) -> Optional[Dict]:
+        """
+        Find an indexed file with the same recording.
+        
+        Args:
+            fingerprint: Query fingerprint
+            exclude: Path to ignore (the file being checked, if indexed)
+        
+        Returns:
+            Dictionary of the matching track plus its 'matches' count, or None
+        """
+        hashes = sorted({int(hash_value) for hash_value, _ in fingerprint})
+        exclude_id = None
+        candidates = []
+        with self._lock:
+            if exclude is not None:
+                row = self._db.execute(
+                    "SELECT rowid FROM tracks WHERE path = ?", (str(Path(exclude).resolve()),)
+                ).fetchone()
+                exclude_id = row[0] if row else None
+            for start in range(0, len(hashes), FINGERPRINT_QUERY_BATCH):
+                batch = hashes[start:start + FINGERPRINT_QUERY_BATCH]
+                candidates += self._db.execute(
+                    f"SELECT hash, track_id, offset FROM fingerprints WHERE hash IN ({', '.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+        
+        if exclude_id is not None:
+            candidates = [row for row in candidates if row[1] != exclude_id]
+        best = best_alignment(fingerprint, candidates)
+        if best is None:
+            return None
+        
+        track_id, matches = best
+        with self._lock:
+            row = self._db.execute("SELECT * FROM tracks WHERE rowid = ?", (track_id,)).fetchone()
+        if row is None or not Path(row["path"]).exists():
+            return None
+        return {**dict(row), "matches": matches}
+    
+    def unfingerprinted(self, root: Optional[Path] = None) -> List[str]:
+        """
+        Get the indexed files that have no fingerprint yet.
+        
+        Args:
+            root: Only include files below this directory
+        
+        Returns:
+            Sorted list of paths
+        """
+        query = (
+            "SELECT path FROM tracks WHERE rowid NOT IN (SELECT track_id FROM fingerprinted)"
+        )
+        params: Tuple = ()
+        if root is not None:
+            prefix = str(Path(root).resolve()).rstrip("/") + "/"
+            query, params = query + " AND substr(path, 1, ?) = ?", (len(prefix), prefix)
+        with self._lock:
+            return sorted(path for path, in self._db.execute(query, params))
+    
+    def move(self, moves: Iterable[Tuple[str, str]]) -> None:
+        """
+        Update the paths of moved files.
+        
+        Args:
+            moves: (old path, new path) pairs
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE tracks SET path = ? WHERE path = ?",
+                [(str(Path(new).resolve()), str(old)) for old, new in moves]
+            )
+    
+    def remove(self, *file_paths) -> None:
+        """Remove files from the index."""
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM tracks WHERE path = ?", [(str(path),) for path in file_paths])
+    
+    def count(self) -> int:
+        """Get the number of indexed tracks."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        self._db.close()
+
+
+_library: Optional[LibraryIndex] = None
+_library_lock = threading.Lock()
+
+
+def get_library() -> LibraryIndex:
+    """Get this process's library index, opening it on first use."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = LibraryIndex()
+        return _library
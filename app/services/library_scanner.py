@@ -0,0 +1,270 @@
+"""
+Parallel scanner that rebuilds the library index from files on disk.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from mutagen.id3 import ID3, ID3NoHeaderError
+
+from app.services.library import LibraryIndex, audio_hash
+from app.utils.fingerprint import fingerprint_file
+from app.utils.layout import replace_with_link
+
+AUDIO_EXTENSIONS = (".mp3",)
+UPSERT_BATCH_SIZE = 500
+# Below this many changed files the pool's startup costs more than it saves
+POOL_THRESHOLD = 64
+
+
+def walk_audio_files(root: Path) -> Iterator[os.DirEntry]:
+    """
+    Walk a directory tree for finished audio files.
+    
+    Hidden entries (the index, profiles, journals) and in-progress
+    downloads are skipped.
+    
+    Args:
+        root: Directory to walk
+    
+    Yields:
+        Directory entries of audio files
+    """
+    pending = [str(root)]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif (
+                        entry.name.lower().endswith(AUDIO_EXTENSIONS)
+                        and ".source." not in entry.name
+                        and entry.is_file()
+                    ):
+                        yield entry
+        except OSError as e:
+            print(f"Error scanning directory: {e}")
+
+
+def _text(tags: Optional[ID3], frame: str) -> Optional[str]:
+    if tags is None or frame not in tags:
+        return None
+    return str(tags[frame].text[0]) if tags[frame].text else None
+
+
+def read_tags(path: str) -> Dict[str, Optional[str]]:
+    """
+    Read artist, title and album from the ID3 header of a file.
+    
+    Args:
+        path: Path to the audio file
+    
+    Returns:
+        Dictionary with 'artist', 'title' and 'album'
+    """
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        tags = None
+    
+    # Files without tags still carry "Artist - Title" in their name
+    stem = Path(path).stem
+    name_artist, _, name_title = stem.partition(" - ")
+    
+    return {
+        "artist": _text(tags, "TPE1") or (name_artist if name_title else "Unknown Artist"),
+        "title": _text(tags, "TIT2") or name_title or stem,
+        "album": _text(tags, "TALB"),
+    }
+
+
+def read_track(path: str) -> Optional[Dict]:
+    """
+    Read the index row of one audio file.
+    
+    Only the ID3 tag at the start of the file is parsed; the audio is
+    streamed through the hash without being decoded.
+    
+    Args:
+        path: Path to the audio file
+    
+    Returns:
+        Index row dictionary, or None if the file couldn't be read
+    """
+    try:
+        stat = os.stat(path)
+        return {
+            "path": path,
+            **read_tags(path),
+            "file_hash": audio_hash(path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+    except Exception as e:
+        print(f"Error reading {path}: {e}")
+        return None
+
+
+class LibraryScanner:
+    """
+    Inventories a download directory into a LibraryIndex.
+    
+    Files whose size and mtime match the index are skipped without being
+    opened, so rescanning an unchanged library only costs the directory
+    walk. Changed and new files are read in a process pool and upserted
+    in batches as they complete.
+    """
+    
+    def __init__(self, library: LibraryIndex, workers: Optional[int] = None):
+        """
+        Initialize scanner.
+        
+        Args:
+            library: Index to update
+            workers: Reader processes (defaults to the CPU count)
+        """
+        self.library = library
+        self.workers = workers or os.cpu_count() or 1
+    
+    def scan(self, root: Path, prune: bool = True) -> Dict:
+        """
+        Scan a directory tree and update the index.
+        
+        Args:
+            root: Directory to scan
+            prune: Remove index rows of files below root that no longer exist
+        
+        Returns:
+            Dictionary of scan statistics
+        """
+        started = time.perf_counter()
+        root = Path(root).resolve()
+        known = self.library.file_stats(root)
+        
+        seen = set()
+        changed: List[str] = []
+        for entry in walk_audio_files(root):
+            seen.add(entry.path)
+            stat = entry.stat()
+            if known.get(entry.path) != (stat.st_size, stat.st_mtime):
+                changed.append(entry.path)
+        
+        indexed = failed = 0
+        batch = []
+        for row in self._read(changed):
+            if row is None:
+                failed += 1
+                continue
+            batch.append(row)
+            if len(batch) >= UPSERT_BATCH_SIZE:
+                indexed += self.library.upsert(batch)
+                batch = []
+        if batch:
+            indexed += self.library.upsert(batch)
+        
+        removed = [path for path in known if path not in seen] if prune else []
+        if removed:
+            self.library.remove(*removed)
+        
+        return {
+            "files": len(seen),
+            "unchanged": len(seen) - len(changed),
+            "indexed": indexed,
+            "failed": failed,
+            "removed": len(removed),
+            "elapsed": time.perf_counter() - started,
+        }
+    
+    def _read(self, paths: List[str]) -> Iterator[Optional[Dict]]:
+        if self.workers <= 1 or len(paths) < POOL_THRESHOLD:
+            yield from map(read_track, paths)
+            return
+        
+        chunksize = max(1, min(64, len(paths) // (self.workers * 4)))
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            yield from executor.map(read_track, paths, chunksize=chunksize)
+
+
+def fingerprint_path(path: str) -> Tuple[str, Optional[np.ndarray]]:
+    """
+    Fingerprint one file, reporting errors instead of raising.
+    
+    Args:
+        path: Path to the audio file
+    
+    Returns:
+        Tuple of (path, fingerprint or None)
+    """
+    try:
+        return path, fingerprint_file(path)
+    except Exception as e:
+        print(f"Error fingerprinting {path}: {e}")
+        return path, None
+
+
+class LibraryFingerprinter:
+    """
+    Fingerprints indexed files that don't have a fingerprint yet.
+    
+    Decoding and fingerprinting run on every core; results are matched
+    against the index in sorted path order, so of several copies of one
+    recording the first is always the one that is kept.
+    """
+    
+    def __init__(self, library: LibraryIndex, workers: Optional[int] = None):
+        """
+        Initialize fingerprinter.
+        
+        Args:
+            library: Index to read files from and store fingerprints in
+            workers: Decoder processes (defaults to the CPU count)
+        """
+        self.library = library
+        self.workers = workers or os.cpu_count() or 1
+    
+    def run(self, root: Optional[Path] = None, link: bool = False) -> Dict:
+        """
+        Fingerprint the library and find duplicate recordings.
+        
+        Args:
+            root: Only fingerprint files below this directory
+            link: Replace duplicates with hard links to the kept copy
+        
+        Returns:
+            Dictionary of statistics
+        """
+        started = time.perf_counter()
+        paths = self.library.unfingerprinted(root)
+        stats = {"files": len(paths), "fingerprinted": 0, "duplicates": 0, "linked": 0, "failed": 0}
+        
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            for path, fingerprint in executor.map(fingerprint_path, paths, chunksize=4):
+                if fingerprint is None:
+                    stats["failed"] += 1
+                    continue
+                
+                match = self.library.match_fingerprint(fingerprint, exclude=Path(path)) if len(fingerprint) else None
+                if match and not os.path.samefile(match["path"], path):
+                    stats["duplicates"] += 1
+                    print(f"Duplicate: {path} == {match['path']} ({match['matches']} matching hashes)")
+                    if link and replace_with_link(Path(match["path"]), Path(path)):
+                        stats["linked"] += 1
+                
+                self.library.add_fingerprint(Path(path), fingerprint)
+                stats["fingerprinted"] += 1
+        
+        stats["elapsed"] = time.perf_counter() - started
+        return stats
@@ -1,61 +1,224 @@
 """
 Service for embedding metadata into audio files.
 """
-import requests
+import base64
+import math
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from mutagen import PaddingInfo
+from mutagen.flac import Picture
 from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
-from typing import Optional
+from mutagen.oggopus import OggOpus
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC, TXXX
+from typing import Dict, List, Optional
 
 from app.models import TrackMetadata
+from app.utils.ffmpeg import Loudness, REPLAYGAIN_REFERENCE_LUFS
+from app.utils.http import get_client
+
+# Opus gain tags are relative to EBU R128's reference (RFC 7845)
+R128_REFERENCE_LUFS = -23.0
+
+# ID3 frames and the Vorbis comments they become in Opus files
+VORBIS_FIELDS = (("TIT2", "TITLE"), ("TPE1", "ARTIST"), ("TALB", "ALBUM"))
+
+# Cover art is fetched here while the track downloads and encodes
+_prepare_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tags")
+
+
+def keep_padding(info: PaddingInfo) -> int:
+    """
+    Padding policy that fills the space the encoder reserved for tags.
+    
+    Keeping the tag the same size means the audio after it is never
+    moved; only if the tags outgrow the space does the file get rewritten.
+    """
+    return info.padding if info.padding >= 0 else info.get_default_padding()
 
 
 class MetadataService:
-    """Service for embedding metadata into MP3 files."""
+    """Service for embedding metadata into MP3 (and Opus) files."""
     
     @staticmethod
-    def embed_metadata(file_path: Path, metadata: TrackMetadata) -> None:
+    def embed_metadata(
+        file_path: Path,
+        metadata: TrackMetadata,
+        loudness: Optional[Loudness] = None,
+        tags: Optional[ID3] = None
+    ) -> None:
         """
         Embed metadata and cover art into an MP3 file.
         
         Args:
             file_path: Path to the MP3 file
             metadata: Track metadata to embed
+            loudness: Loudness measured during the encode, written as
+                ReplayGain track gain/peak
+            tags: Tags already built by prepare_tags(), if any
         """
         try:
-            # Load the MP3 file
-            audio = MP3(file_path, ID3=ID3)
-            
-            # Add ID3 tags if not present
-            if audio.tags is None:
-                audio.add_tags()
-            
-            # Set basic metadata
-            audio.tags.add(TIT2(encoding=3, text=metadata.title))
-            audio.tags.add(TPE1(encoding=3, text=metadata.artist))
-            audio.tags.add(TALB(encoding=3, text=metadata.album))
-            
-            # Download and embed cover art
-            if metadata.cover_art_url:
-                cover_data = MetadataService._download_cover_art(metadata.cover_art_url)
-                if cover_data:
-                    audio.tags.add(
-                        APIC(
-                            encoding=3,
-                            mime='image/jpeg',
-                            type=3,  # Cover (front)
-                            desc='Cover',
-                            data=cover_data
-                        )
-                    )
-            
-            # Save the tags
-            audio.save()
-            
+            MetadataService.write_tags(file_path, tags or MetadataService.prepare_tags(metadata), loudness)
         except Exception as e:
             print(f"Error embedding metadata: {e}")
             raise
     
+    @staticmethod
+    def prepare_tags(metadata: TrackMetadata) -> ID3:
+        """
+        Build the ID3 tag of a track, including its cover art.
+        
+        Nothing is written, so this can run while the track is still
+        downloading or encoding.
+        
+        Args:
+            metadata: Track metadata to embed
+        
+        Returns:
+            Tags ready for write_tags()
+        """
+        tags = ID3()
+        
+        # Set basic metadata
+        tags.add(TIT2(encoding=3, text=metadata.title))
+        tags.add(TPE1(encoding=3, text=metadata.artist))
+        tags.add(TALB(encoding=3, text=metadata.album))
+        
+        # Download and embed cover art
+        if metadata.cover_art_url:
+            cover_data = MetadataService._download_cover_art(metadata.cover_art_url)
+            if cover_data:
+                tags.add(
+                    APIC(
+                        encoding=3,
+                        mime='image/jpeg',
+                        type=3,  # Cover (front)
+                        desc='Cover',
+                        data=cover_data
+                    )
+                )
+        
+        return tags
+    
+    @staticmethod
+    def prepare_tags_async(metadata: TrackMetadata) -> "Future[ID3]":
+        """
+        Start prepare_tags() in the background.
+        
+        Args:
+            metadata: Track metadata to embed
+        
+        Returns:
+            Future resolving to the prepared tags
+        """
+        return _prepare_executor.submit(MetadataService.prepare_tags, metadata)
+    
+    @staticmethod
+    def write_tags(file_path: Path, tags: ID3, loudness: Optional[Loudness] = None) -> None:
+        """
+        Write prepared tags to an MP3 file in a single write.
+        
+        The tag replaces the one the encoder wrote, inside the padding it
+        reserved (settings.tag_padding_kb), so only the tag bytes at the
+        start of the file are rewritten. Opus files get the same tags as
+        Vorbis comments.
+        
+        Args:
+            file_path: Path to the MP3 (or .opus) file
+            tags: Tags from prepare_tags()
+            loudness: Loudness measured during the encode, written as
+                ReplayGain track gain/peak
+        """
+        if Path(file_path).suffix == ".opus":
+            MetadataService._write_opus_tags(file_path, tags, loudness)
+            return
+        
+        # ReplayGain from the encoder's measurement, in the same save
+        if loudness:
+            MetadataService._add_replaygain(tags, "TRACK", loudness.track_gain, loudness.peak)
+        
+        tags.save(file_path, padding=keep_padding)
+    
+    @staticmethod
+    def write_album_gain(files: List[Path]) -> Optional[Dict]:
+        """
+        Write ReplayGain album gain/peak computed from the tracks' tags.
+        
+        Album loudness is the duration-weighted energy mean of the track
+        loudness values, so nothing is decoded again. Tracks without a
+        track gain tag are skipped.
+        
+        Args:
+            files: MP3 files of the album or playlist
+        
+        Returns:
+            Dictionary with 'album_gain', 'album_peak', 'tracks' and
+            'skipped' paths, or None if no track has a track gain
+        """
+        measured, skipped = [], []
+        for file_path in files:
+            try:
+                # Reads the ID3 tag and the first frame header (for the length) only
+                audio = MP3(file_path, ID3=ID3)
+                gain = audio.tags and audio.tags.get("TXXX:REPLAYGAIN_TRACK_GAIN")
+                peak = audio.tags and audio.tags.get("TXXX:REPLAYGAIN_TRACK_PEAK")
+                if not gain or not peak or not audio.info.length:
+                    skipped.append(str(file_path))
+                    continue
+                integrated = REPLAYGAIN_REFERENCE_LUFS - float(gain.text[0].split()[0])
+                measured.append((audio, integrated, float(peak.text[0]), audio.info.length))
+            except Exception as e:
+                print(f"Error reading ReplayGain of {file_path}: {e}")
+                skipped.append(str(file_path))
+        
+        if not measured:
+            return None
+        
+        total_duration = sum(duration for _, _, _, duration in measured)
+        energy = sum(duration * 10 ** (integrated / 10) for _, integrated, _, duration in measured)
+        album_gain = REPLAYGAIN_REFERENCE_LUFS - 10 * math.log10(energy / total_duration)
+        album_peak = max(peak for _, _, peak, _ in measured)
+        
+        for audio, _, _, _ in measured:
+            MetadataService._add_replaygain(audio.tags, "ALBUM", album_gain, album_peak)
+            audio.save(padding=keep_padding)
+        
+        return {
+            "album_gain": round(album_gain, 2),
+            "album_peak": round(album_peak, 6),
+            "tracks": len(measured),
+            "skipped": skipped
+        }
+    
+    @staticmethod
+    def _write_opus_tags(file_path: Path, tags: ID3, loudness: Optional[Loudness] = None) -> None:
+        """Write prepared ID3 tags to an Ogg Opus file as Vorbis comments."""
+        audio = OggOpus(file_path)
+        for frame, field in VORBIS_FIELDS:
+            if frame in tags:
+                audio[field] = [str(text) for text in tags[frame].text]
+        
+        covers = tags.getall("APIC")
+        if covers:
+            picture = Picture()
+            picture.type = covers[0].type
+            picture.mime = covers[0].mime
+            picture.desc = covers[0].desc
+            picture.data = covers[0].data
+            audio["METADATA_BLOCK_PICTURE"] = [base64.b64encode(picture.write()).decode("ascii")]
+        
+        if loudness:
+            # Q7.8 fixed point dB, which players apply on top of the header gain
+            gain = round((R128_REFERENCE_LUFS - loudness.integrated) * 256)
+            audio["R128_TRACK_GAIN"] = [str(max(-32768, min(gain, 32767)))]
+        
+        audio.save()
+    
+    @staticmethod
+    def _add_replaygain(tags: ID3, scope: str, gain: float, peak: float) -> None:
+        """Add REPLAYGAIN_<scope>_GAIN/PEAK frames in the usual TXXX format."""
+        tags.add(TXXX(encoding=3, desc=f"REPLAYGAIN_{scope}_GAIN", text=f"{gain:+.2f} dB"))
+        tags.add(TXXX(encoding=3, desc=f"REPLAYGAIN_{scope}_PEAK", text=f"{peak:.6f}"))
+    
     @staticmethod
     def _download_cover_art(url: str) -> Optional[bytes]:
         """
@@ -68,7 +231,7 @@ class MetadataService:
             Image data as bytes, or None if download fails
         """
         try:
-            response = requests.get(url, timeout=10)
+            response = get_client().get(url, timeout=10)
             response.raise_for_status()
             return response.content
         except Exception as e:
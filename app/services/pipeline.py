@@ -0,0 +1,425 @@
+"""
+Shared track pipeline stages used by the Celery tasks and the standalone engine.
+"""
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from mutagen.id3 import ID3
+
+from app.config import settings
+from app.models import TrackMetadata
+from app.services.library import LibraryIndex, get_library
+from app.services.metadata_service import MetadataService
+from app.services.spotify_service import SpotifyService
+from app.services.youtube_service import YouTubeService
+from app.services.url_parser import URLParser, URLType
+from app.utils.ffmpeg import Loudness, OutputFormat, transcode
+from app.utils.fingerprint import fingerprint_file
+from app.utils.layout import replace_with_link
+from app.utils.storage import store_file
+
+
+class PipelineError(Exception):
+    """A pipeline stage failed in a way that should be reported, not raised."""
+    
+    def __init__(self, message: str, track: str = "Unknown"):
+        super().__init__(message)
+        self.track = track
+
+
+def _noop_step(step: str) -> None:
+    pass
+
+
+def resolve_track(
+    url: str,
+    on_step: Callable[[str], None] = _noop_step
+) -> Tuple[URLType, str, TrackMetadata]:
+    """
+    Resolve a track URL to a YouTube source and its metadata.
+    
+    Args:
+        url: Spotify track URL or YouTube video URL
+        on_step: Called with a description of each stage as it starts
+    
+    Returns:
+        Tuple of (URLType, YouTube URL, TrackMetadata)
+    
+    Raises:
+        PipelineError: If the URL is unsupported or cannot be resolved
+    """
+    url_type, url_id = URLParser.identify_url(url)
+    
+    if url_type == URLType.UNKNOWN:
+        raise PipelineError("Unsupported URL type. Please provide a Spotify or YouTube URL.")
+    
+    on_step("Fetching metadata")
+    
+    youtube_service = YouTubeService()
+    
+    if url_type == URLType.SPOTIFY_TRACK:
+        # Spotify workflow: Get metadata from Spotify, search YouTube
+        spotify_service = SpotifyService()
+        metadata_dict = spotify_service.get_track_metadata(url)
+        
+        metadata = TrackMetadata(
+            title=metadata_dict.get('name', 'Unknown'),
+            artist=metadata_dict.get('artist', 'Unknown Artist'),
+            album=metadata_dict.get('album', 'Unknown Album'),
+            duration_ms=0,  # Not available from web scraping
+            cover_art_url=metadata_dict.get('cover_url', ''),
+            spotify_id=url_id
+        )
+        
+        on_step("Searching YouTube")
+        
+        youtube_url = youtube_service.search_track(metadata)
+        
+        if not youtube_url:
+            raise PipelineError("No matching YouTube video found", track=metadata.title)
+        
+        return url_type, youtube_url, metadata
+    
+    if url_type == URLType.YOUTUBE_VIDEO:
+        # YouTube workflow: Get metadata directly from YouTube
+        metadata = youtube_service.get_video_metadata(url)
+        
+        if not metadata:
+            raise PipelineError("Failed to extract YouTube video metadata")
+        
+        return url_type, url, metadata
+    
+    raise PipelineError(f"Invalid URL type for single track download: {url_type}")
+
+
+def resolve_playlist(
+    url: str,
+    on_step: Callable[[str], None] = _noop_step,
+    library: Optional[LibraryIndex] = None
+) -> Tuple[URLType, List[Dict]]:
+    """
+    Resolve a playlist URL to the YouTube URLs of its tracks.
+    
+    Args:
+        url: Spotify playlist URL or YouTube playlist URL
+        on_step: Called with a description of each stage as it starts
+        library: Library to check tracks against; tracks already in it
+            are not searched and carry the 'file' they were saved to
+    
+    Returns:
+        Tuple of (URLType, list of {"url", "track", "artist"} dictionaries)
+    
+    Raises:
+        PipelineError: If the URL is not a supported playlist
+    """
+    url_type, _ = URLParser.identify_url(url)
+    
+    if url_type not in [URLType.SPOTIFY_PLAYLIST, URLType.YOUTUBE_PLAYLIST]:
+        raise PipelineError("URL must be a Spotify or YouTube playlist")
+    
+    on_step("Fetching playlist")
+    
+    youtube_service = YouTubeService()
+    entries = []
+    
+    if url_type == URLType.SPOTIFY_PLAYLIST:
+        tracks_data = SpotifyService().get_playlist_tracks(url)
+        on_step(f"Processing {len(tracks_data)} tracks")
+        
+        # Playlist scraping doesn't provide track IDs or Spotify URLs,
+        # so search YouTube directly with artist + track name
+        for track_dict in tracks_data:
+            metadata = TrackMetadata(
+                title=track_dict.get('name', 'Unknown'),
+                artist=track_dict.get('artist', 'Unknown'),
+                album=track_dict.get('album', 'Unknown Album'),
+                duration_ms=0,
+                cover_art_url=track_dict.get('cover_url', ''),
+                spotify_id=''
+            )
+            
+            existing = library.find(artist=metadata.artist, title=metadata.title) if library else None
+            if existing:
+                entries.append({
+                    "url": None,
+                    "track": metadata.title,
+                    "artist": metadata.artist,
+                    "file": existing["path"]
+                })
+                continue
+            
+            youtube_url = youtube_service.search_track(metadata)
+            
+            if youtube_url:
+                entries.append({
+                    "url": youtube_url,
+                    "track": metadata.title,
+                    "artist": metadata.artist
+                })
+    
+    else:
+        videos = youtube_service.get_playlist_videos(url)
+        on_step(f"Processing {len(videos)} videos")
+        
+        for video in videos:
+            entry = {
+                "url": video['url'],
+                "track": video['title'],
+                "artist": "YouTube"
+            }
+            existing = library.find_entry(entry) if library else None
+            if existing:
+                entry["file"] = existing["path"]
+            entries.append(entry)
+    
+    return url_type, entries
+
+
+def library_or_none() -> Optional[LibraryIndex]:
+    """Get the library index, or None if it is disabled or unavailable."""
+    if not settings.library_index:
+        return None
+    try:
+        return get_library()
+    except Exception as e:
+        print(f"Error opening library index: {e}")
+        return None
+
+
+def find_downloaded(metadata: TrackMetadata, youtube_url: str) -> Optional[Path]:
+    """
+    Find an earlier download of a resolved track.
+    
+    Args:
+        metadata: Track metadata
+        youtube_url: YouTube URL the track resolved to
+    
+    Returns:
+        Path to the existing MP3 file, or None
+    """
+    library = library_or_none()
+    if not library:
+        return None
+    existing = library.find(
+        spotify_id=metadata.spotify_id or None,
+        youtube_url=youtube_url,
+        artist=metadata.artist,
+        title=metadata.title
+    )
+    return Path(existing["path"]) if existing else None
+
+
+def record_download(
+    output_file: Path,
+    metadata: TrackMetadata,
+    youtube_url: str,
+    fingerprint: Optional[np.ndarray] = None,
+    library: Optional[LibraryIndex] = None
+) -> None:
+    """
+    Add a finished download to the library index.
+    
+    Args:
+        output_file: Path to the tagged MP3 file
+        metadata: Track metadata
+        youtube_url: YouTube URL the audio was downloaded from
+        fingerprint: Acoustic fingerprint of the audio, if computed
+        library: Library to use instead of the configured one
+    """
+    library = library or library_or_none()
+    if not library:
+        return
+    try:
+        library.add(output_file, metadata, youtube_url)
+        if fingerprint is not None and len(fingerprint):
+            library.add_fingerprint(output_file, fingerprint)
+    except Exception as e:
+        print(f"Error recording download in library: {e}")
+
+
+def link_duplicate(
+    audio_file: Path,
+    output_file: Path,
+    library: Optional[LibraryIndex] = None
+) -> Tuple[Optional[Path], Optional[np.ndarray]]:
+    """
+    Replace a download with a link if the library already has the recording.
+    
+    Args:
+        audio_file: Downloaded audio (the MP3, or its source before transcoding)
+        output_file: MP3 path of the new track, linked to the existing copy on a match
+        library: Library to use instead of the configured one
+    
+    Returns:
+        Tuple of (path of the existing copy if output_file was linked to it,
+        fingerprint of audio_file or None if it couldn't be computed)
+    """
+    library = library or library_or_none()
+    if not library or not settings.fingerprint_dedup:
+        return None, None
+    
+    try:
+        fingerprint = fingerprint_file(audio_file)
+        match = library.match_fingerprint(fingerprint, exclude=output_file)
+    except Exception as e:
+        print(f"Error fingerprinting audio: {e}")
+        return None, None
+    
+    if match and replace_with_link(Path(match["path"]), output_file):
+        return Path(match["path"]), fingerprint
+    return None, fingerprint
+
+
+def finish_track(
+    output_file: Path,
+    metadata: TrackMetadata,
+    url_type: URLType,
+    youtube_url: str,
+    fingerprint: Optional[np.ndarray] = None,
+    library: Optional[LibraryIndex] = None,
+    loudness: Optional[Loudness] = None,
+    tags: Optional["Future[ID3]"] = None,
+    extra_files: Sequence[Tuple[OutputFormat, Path]] = ()
+) -> Dict:
+    """
+    Deduplicate, tag and index a downloaded MP3.
+    
+    A file holding a recording that is already in the library is replaced
+    by a hard link to the existing copy and left untagged, since its tags
+    are shared with that copy. Extra formats are always tagged.
+    
+    Args:
+        output_file: Path to the downloaded MP3 file
+        metadata: Track metadata to embed
+        url_type: Type of the submitted URL
+        youtube_url: YouTube URL the audio was downloaded from
+        fingerprint: Fingerprint already computed from the source, if any
+        library: Library to use instead of the configured one
+        loudness: Loudness measured while encoding, written as ReplayGain tags
+        tags: Tags started with MetadataService.prepare_tags_async(), if any
+        extra_files: (format, path) of the extra formats encoded with the MP3
+    
+    Returns:
+        Track result dictionary
+    """
+    prepared = tags.result() if tags else None
+    if prepared is None and extra_files:
+        # Built once for all the files, cover art included
+        prepared = MetadataService.prepare_tags(metadata)
+    for _, path in extra_files:
+        MetadataService.embed_metadata(path, metadata, loudness, prepared)
+    
+    if fingerprint is None:
+        duplicate_of, fingerprint = link_duplicate(output_file, output_file, library)
+        if duplicate_of:
+            record_download(output_file, metadata, youtube_url, library=library)
+            return track_result(
+                output_file, metadata, url_type, duplicate_of=duplicate_of, formats=extra_files,
+                storage_keys=store_track(output_file, extra_files)
+            )
+    
+    MetadataService.embed_metadata(output_file, metadata, loudness, prepared)
+    record_download(output_file, metadata, youtube_url, fingerprint, library)
+    
+    return track_result(
+        output_file, metadata, url_type, formats=extra_files, storage_keys=store_track(output_file, extra_files)
+    )
+
+
+def encode_formats(
+    source: Path,
+    metadata: TrackMetadata,
+    extra_files: Sequence[Tuple[OutputFormat, Path]],
+    cancel_check: Optional[Callable[[], None]] = None
+) -> None:
+    """
+    Encode and tag the missing extra formats of a track that needs no new MP3.
+    
+    Used for tracks already in the library (the source is their MP3) and
+    for downloads that turned out to duplicate a library recording. The
+    source is decoded once for all the formats.
+    
+    Args:
+        source: Library MP3 or downloaded source file
+        metadata: Track metadata to embed
+        extra_files: (format, path) of the formats asked for
+        cancel_check: Called periodically during the encode; raising from it kills ffmpeg
+    """
+    missing = [(fmt, path) for fmt, path in extra_files if not path.exists()]
+    if not missing:
+        return
+    transcode(source, None, cancel_check=cancel_check, extra_outputs=missing)
+    tags = MetadataService.prepare_tags(metadata)
+    for _, path in missing:
+        MetadataService.embed_metadata(path, metadata, tags=tags)
+
+
+def store_track(
+    output_file: Path,
+    formats: Sequence[Tuple[OutputFormat, Path]] = ()
+) -> Dict[str, Optional[str]]:
+    """
+    Store a finished track and its extra formats in the artifact storage.
+    
+    Hashes and possibly uploads every file, so it runs off the event loop.
+    
+    Args:
+        output_file: Path to the MP3 file
+        formats: (format, path) of the extra formats
+    
+    Returns:
+        Storage key by file path, for track_result() (None without a
+        storage backend)
+    
+    Raises:
+        TransientError: If the store is unreachable or throttling
+    """
+    paths = [output_file, *(path for _, path in formats)]
+    return {str(path): store_file(path) for path in paths}
+
+
+def track_result(
+    output_file: Path,
+    metadata: TrackMetadata,
+    url_type: URLType,
+    already_downloaded: bool = False,
+    duplicate_of: Optional[Path] = None,
+    formats: Sequence[Tuple[OutputFormat, Path]] = (),
+    storage_keys: Optional[Dict[str, Optional[str]]] = None
+) -> Dict:
+    """
+    Build the result dictionary of a successfully downloaded track.
+    
+    'storage_key' lets the API serve the file from any host; extra formats
+    are listed under 'formats' by name, each with its 'file' and
+    'storage_key'. Keys come from store_track().
+    """
+    storage_keys = storage_keys or {}
+    return {
+        "success": True,
+        "track": metadata.title,
+        "artist": metadata.artist,
+        "file": str(output_file),
+        "storage_key": storage_keys.get(str(output_file)),
+        "formats": {
+            fmt.name: {"file": str(path), "storage_key": storage_keys.get(str(path))} for fmt, path in formats
+        },
+        "source": url_type,
+        "already_downloaded": already_downloaded,
+        "duplicate_of": str(duplicate_of) if duplicate_of else None
+    }
+
+
+def playlist_result(url_type: URLType, children: List[Dict], existing: Optional[List[Dict]] = None) -> Dict:
+    """Build the result dictionary of a playlist whose missing tracks were queued."""
+    existing = existing or []
+    return {
+        "success": True,
+        "total_tracks": len(children) + len(existing),
+        "queued_tracks": len(children),
+        "tasks": children,
+        "already_downloaded": existing,
+        "source": url_type
+    }
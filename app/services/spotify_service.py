@@ -4,19 +4,18 @@ Spotify metadata service using web scraping (no API key needed).
 import json
 import re
 from typing import Dict, List
-import requests
 from bs4 import BeautifulSoup
 
+from app.utils.http import get_client
+from app.utils.resilience import DependencyError, get_breaker
+
 
 class SpotifyService:
     """Service for fetching Spotify metadata by scraping web pages."""
     
     def __init__(self):
-        """Initialize HTTP session."""
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        """Initialize HTTP session (the process-wide pooled client)."""
+        self.session = get_client()
     
     def get_track_metadata(self, spotify_url: str) -> Dict[str, str]:
         """
@@ -24,13 +23,14 @@ class SpotifyService:
         
         Args:
             spotify_url: Spotify track URL
-            
+        
         Returns:
             Dictionary with track metadata
         """
         try:
-            response = self.session.get(spotify_url, timeout=10)
-            response.raise_for_status()
+            with get_breaker("spotify").guard():
+                response = self.session.get(spotify_url, timeout=10)
+                response.raise_for_status()
             
             soup = BeautifulSoup(response.text, 'html.parser')
             
@@ -115,7 +115,9 @@ class SpotifyService:
                 "year": "",
                 "cover_url": ""
             }
-            
+        
+        except DependencyError:
+            raise
         except Exception as e:
             print(f"DEBUG - Exception: {str(e)}")
             raise Exception(f"Failed to scrape Spotify metadata: {str(e)}")
@@ -126,13 +128,14 @@ class SpotifyService:
         
         Args:
             playlist_url: Spotify playlist URL
-            
+        
         Returns:
             List of track metadata dictionaries
         """
         try:
-            response = self.session.get(playlist_url, timeout=10)
-            response.raise_for_status()
+            with get_breaker("spotify").guard():
+                response = self.session.get(playlist_url, timeout=10)
+                response.raise_for_status()
             
             soup = BeautifulSoup(response.text, 'html.parser')
             tracks = []
@@ -159,5 +162,7 @@ class SpotifyService:
                 raise ValueError("No tracks found in playlist")
             
             return tracks
+        except DependencyError:
+            raise
         except Exception as e:
             raise Exception(f"Failed to scrape playlist: {str(e)}")
\ No newline at end of file
@@ -2,7 +2,7 @@
 Service for parsing and identifying URL types.
 """
 from enum import Enum
-from typing import Optional, Tuple
+from typing import Iterable, List, NamedTuple, Optional, Tuple
 import re
 
 
@@ -15,9 +15,103 @@ class URLType(str, Enum):
     UNKNOWN = "unknown"
 
 
+class ParsedURL(NamedTuple):
+    """A recognized URL and its canonical form."""
+    url_type: URLType
+    id: str
+    url: str  # Canonical URL; equal for every variant of the same track or playlist
+
+
+# Every URL shape we know in one pattern, so a URL is classified (and its
+# video and playlist parameters found, in any order) by a single match
+_URL_PATTERN = re.compile(r"""
+    (?:https?://)?(?:
+        open\.spotify\.com/(?:intl-[A-Za-z-]+/|embed/)?
+        (?P<spotify_type>track|playlist)/(?P<spotify_id>[A-Za-z0-9]{22})(?!\w)
+      | youtu\.be/(?P<short_id>[\w-]{11})(?![\w-])
+      | (?:www\.|m\.|music\.)?youtube\.com/
+        (?:(?:shorts|embed|live|v)/(?P<path_id>[\w-]{11})(?![\w-])|(?:watch|playlist)/?(?=\?))
+    )
+    (?=[^\s#]*?[?&]list=(?P<list_id>[\w-]+))?
+    (?=[^\s#]*?[?&]v=(?P<video_id>[\w-]{11})(?![\w-]))?
+  | spotify:(?P<uri_type>track|playlist):(?P<uri_id>[A-Za-z0-9]{22})(?!\w)
+""", re.VERBOSE)
+
+_SPOTIFY_TYPES = {"track": URLType.SPOTIFY_TRACK, "playlist": URLType.SPOTIFY_PLAYLIST}
+
+
 class URLParser:
     """Service for parsing and identifying music URLs."""
     
+    @staticmethod
+    def parse(url: str) -> Optional[ParsedURL]:
+        """
+        Classify a URL and canonicalize it.
+        
+        Tracking parameters (si=, feature=, t=, ...), locale prefixes and
+        the youtu.be, m., music., shorts and embed variants all map to the
+        same canonical URL, so equal content dedupes by ParsedURL.url.
+        
+        Args:
+            url: The URL to parse
+        
+        Returns:
+            ParsedURL, or None for URLs of no known shape
+        """
+        match = _URL_PATTERN.match(url)
+        if not match:
+            return None
+        spotify_type, spotify_id, short_id, path_id, list_id, video_id, uri_type, uri_id = match.groups()
+        
+        if spotify_type or uri_type:
+            spotify_type = spotify_type or uri_type
+            spotify_id = spotify_id or uri_id
+            return ParsedURL(
+                _SPOTIFY_TYPES[spotify_type], spotify_id, f"https://open.spotify.com/{spotify_type}/{spotify_id}"
+            )
+        
+        video_id = short_id or path_id or video_id
+        # A video opened from a playlist means the playlist, as it always has
+        if list_id:
+            if list_id.startswith("RD") and video_id:
+                # Mixes are generated around a video and have no playlist page
+                return ParsedURL(
+                    URLType.YOUTUBE_PLAYLIST, list_id, f"https://www.youtube.com/watch?v={video_id}&list={list_id}"
+                )
+            return ParsedURL(URLType.YOUTUBE_PLAYLIST, list_id, f"https://www.youtube.com/playlist?list={list_id}")
+        if video_id:
+            return ParsedURL(URLType.YOUTUBE_VIDEO, video_id, f"https://www.youtube.com/watch?v={video_id}")
+        return None
+    
+    @staticmethod
+    def parse_many(urls: Iterable[str]) -> Tuple[List[ParsedURL], List[str], int]:
+        """
+        Parse, canonicalize and dedupe a batch of URLs.
+        
+        Args:
+            urls: URLs in submission order (blank lines are skipped)
+        
+        Returns:
+            Tuple of (unique parsed URLs in first-seen order, URLs that
+            are not supported, number of duplicates dropped)
+        """
+        unique = {}
+        rejected = []
+        duplicates = 0
+        parse = URLParser.parse
+        for url in urls:
+            url = url.strip()
+            if not url:
+                continue
+            parsed = parse(url)
+            if parsed is None:
+                rejected.append(url)
+            elif parsed.url in unique:
+                duplicates += 1
+            else:
+                unique[parsed.url] = parsed
+        return list(unique.values()), rejected, duplicates
+    
     @staticmethod
     def identify_url(url: str) -> Tuple[URLType, Optional[str]]:
         """
@@ -29,6 +123,14 @@ class URLParser:
         Returns:
             Tuple of (URLType, ID or None)
         """
+        parsed = URLParser.parse(url.strip())
+        if parsed:
+            return (parsed.url_type, parsed.id)
+        return URLParser._identify_by_substrings(url)
+    
+    @staticmethod
+    def _identify_by_substrings(url: str) -> Tuple[URLType, Optional[str]]:
+        """Identify URLs of shapes parse() doesn't know by what they contain."""
         url = url.strip()
         
         # Spotify URLs
@@ -1,9 +1,10 @@
 """
 YouTube search service for finding matching audio and extracting metadata.
 """
-import yt_dlp
 from typing import Optional, List, Dict
 from app.models import TrackMetadata
+from app.utils.resilience import TransientError, get_breaker
+from app.utils.ytdl_pool import get_ytdl_pool
 
 
 class YouTubeService:
@@ -18,15 +19,14 @@ class YouTubeService:
         
         Returns:
             TrackMetadata object or None
-        """
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-        }
         
+        Raises:
+            TransientError: If YouTube is unreachable or throttling (worth retrying)
+        """
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(youtube_url, download=False)
+            with get_ytdl_pool().acquire("metadata") as ydl:
+                with get_breaker("youtube").guard():
+                    info = ydl.extract_info(youtube_url, download=False)
                 
                 if not info:
                     return None
@@ -46,7 +46,9 @@ class YouTubeService:
                     cover_art_url=thumbnail,
                     spotify_id=info.get('id', '')  # Using YouTube ID here
                 )
-                
+        
+        except TransientError:
+            raise
         except Exception as e:
             print(f"Error extracting YouTube metadata: {e}")
             return None
@@ -60,18 +62,16 @@ class YouTubeService:
         
         Returns:
             List of video info dictionaries
-        """
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-        }
         
+        Raises:
+            TransientError: If YouTube is unreachable or throttling (worth retrying)
+        """
         videos = []
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                playlist_info = ydl.extract_info(playlist_url, download=False)
+            with get_ytdl_pool().acquire("flat") as ydl:
+                with get_breaker("youtube").guard():
+                    playlist_info = ydl.extract_info(playlist_url, download=False)
                 
                 if playlist_info and 'entries' in playlist_info:
                     for entry in playlist_info['entries']:
@@ -82,6 +82,8 @@ class YouTubeService:
                                 'url': f"https://www.youtube.com/watch?v={entry.get('id')}"
                             })
         
+        except TransientError:
+            raise
         except Exception as e:
             print(f"Error extracting playlist: {e}")
         
@@ -96,21 +98,19 @@ class YouTubeService:
         
         Returns:
             YouTube video URL of best match, or None
+        
+        Raises:
+            TransientError: If YouTube is unreachable or throttling (worth retrying)
         """
         # Build search query
         query = f"{metadata.artist} - {metadata.title}"
         
-        # Configure yt-dlp for search
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-        }
-        
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Flat extraction: search results without resolving each video
+            with get_ytdl_pool().acquire("flat") as ydl:
                 # Search YouTube
-                search_results = ydl.extract_info(f"ytsearch5:{query}", download=False)
+                with get_breaker("youtube").guard():
+                    search_results = ydl.extract_info(f"ytsearch5:{query}", download=False)
                 
                 if not search_results or 'entries' not in search_results:
                     return None
@@ -123,7 +123,9 @@ class YouTubeService:
                 
                 if best_match:
                     return f"https://www.youtube.com/watch?v={best_match['id']}"
-                
+        
+        except TransientError:
+            raise
         except Exception as e:
             print(f"Error searching YouTube: {e}")
             return None
@@ -0,0 +1 @@
+"""Broker-free standalone runtime."""
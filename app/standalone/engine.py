@@ -0,0 +1,347 @@
+"""
+In-process task engine for running without Redis or Celery.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.models import TaskStatus
+from app.services.pipeline import (
+    PipelineError, resolve_track, resolve_playlist, track_result, playlist_result,
+    find_downloaded, record_download, library_or_none, link_duplicate, finish_track, store_track,
+    encode_formats
+)
+from app.services.metadata_service import MetadataService
+from app.utils.downloader import AudioDownloader
+from app.utils.ffmpeg import parse_formats
+from app.utils.http import aclose_clients, close_clients
+from app.utils.transcoder import TranscodeExecutor
+from app.utils.ytdl_pool import get_ytdl_pool
+
+
+@dataclass
+class TaskRecord:
+    """State of a task run by the standalone engine."""
+    task_id: str
+    kind: str
+    url: str
+    status: TaskStatus = TaskStatus.PENDING
+    step: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+
+class TaskStore:
+    """In-memory task state, optionally persisted to SQLite."""
+    
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        Initialize store.
+        
+        Args:
+            db_path: SQLite file to persist tasks to, or None for memory only
+        """
+        self._tasks: Dict[str, TaskRecord] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id TEXT PRIMARY KEY, kind TEXT, url TEXT, status TEXT, step TEXT, "
+                "result TEXT, error TEXT, created_at REAL, updated_at REAL)"
+            )
+            self._load()
+    
+    def create(self, kind: str, url: str) -> TaskRecord:
+        """Create and store a new pending task."""
+        record = TaskRecord(task_id=str(uuid.uuid4()), kind=kind, url=url)
+        with self._lock:
+            self._tasks[record.task_id] = record
+            self._persist(record)
+        return record
+    
+    def update(self, task_id: str, **fields) -> None:
+        """Update fields of a stored task."""
+        with self._lock:
+            record = self._tasks[task_id]
+            for name, value in fields.items():
+                setattr(record, name, value)
+            record.updated_at = time.time()
+            self._persist(record)
+    
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        """Get a task by ID."""
+        return self._tasks.get(task_id)
+    
+    def close(self) -> None:
+        """Close the SQLite connection, if any."""
+        if self._db:
+            self._db.close()
+            self._db = None
+    
+    def _persist(self, record: TaskRecord) -> None:
+        if not self._db:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.task_id, record.kind, record.url, record.status.value, record.step,
+                json.dumps(record.result) if record.result is not None else None,
+                record.error, record.created_at, record.updated_at,
+            )
+        )
+        self._db.commit()
+    
+    def _load(self) -> None:
+        """Load persisted tasks; ones cut off by a shutdown are marked failed."""
+        rows = self._db.execute(
+            "SELECT task_id, kind, url, status, step, result, error, created_at, updated_at FROM tasks"
+        ).fetchall()
+        for task_id, kind, url, status, step, result, error, created_at, updated_at in rows:
+            record = TaskRecord(
+                task_id=task_id, kind=kind, url=url, status=TaskStatus(status), step=step,
+                result=json.loads(result) if result else None, error=error,
+                created_at=created_at, updated_at=updated_at,
+            )
+            if record.status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+                record.status = TaskStatus.FAILED
+                record.error = "Interrupted by shutdown"
+                self._persist(record)
+            self._tasks[task_id] = record
+
+
+class StandaloneEngine:
+    """
+    Runs the scrape/search/download/transcode/tag pipeline in-process.
+    
+    Tasks are scheduled on the asyncio event loop; network stages run in
+    a thread pool and ffmpeg encodes in a process pool, so submitting a
+    task is a direct call instead of a broker round-trip.
+    """
+    
+    def __init__(
+        self,
+        download_dir: Optional[Path] = None,
+        network_workers: Optional[int] = None,
+        max_active_tracks: Optional[int] = None,
+        db_path: Optional[Path] = None
+    ):
+        """
+        Initialize engine.
+        
+        Args:
+            download_dir: Directory to save downloaded files
+            network_workers: Threads for scraping, searching and fetching
+            max_active_tracks: Tracks processed at the same time
+            db_path: SQLite file to persist task state to
+        """
+        self.download_dir = Path(download_dir or settings.download_dir)
+        self.network_workers = network_workers or settings.standalone_network_workers
+        self.max_active_tracks = max_active_tracks or settings.max_workers
+        self.store = TaskStore(db_path or settings.standalone_db)
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._transcoder: Optional[TranscodeExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = set()
+    
+    async def start(self) -> None:
+        """Create the worker pools."""
+        self._threads = ThreadPoolExecutor(
+            max_workers=self.network_workers, thread_name_prefix="network"
+        )
+        if not settings.streaming_transcode:
+            self._transcoder = TranscodeExecutor()
+        self._slots = asyncio.Semaphore(self.max_active_tracks)
+        if settings.worker_prewarm:
+            # Warm yt-dlp in the background; the first task just reuses it
+            self._threads.submit(get_ytdl_pool().prewarm)
+    
+    async def stop(self) -> None:
+        """Cancel running tasks and shut the pools down."""
+        for running in list(self._running):
+            running.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        if self._transcoder:
+            self._transcoder.shutdown(wait=False)
+        if self._threads:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+        close_clients()
+        await aclose_clients()
+        get_ytdl_pool().close()
+        self.store.close()
+    
+    def submit_track(self, url: str, formats: Optional[List[str]] = None) -> str:
+        """
+        Queue a track download.
+        
+        Args:
+            url: Spotify track URL or YouTube video URL
+            formats: Output formats besides the library MP3 (e.g. ["opus", "preview"])
+        
+        Returns:
+            Task ID
+        """
+        record = self.store.create("track", url)
+        self._spawn(self._run_track(record.task_id, url, formats))
+        return record.task_id
+    
+    def submit_playlist(self, url: str) -> str:
+        """
+        Queue a playlist download.
+        
+        Args:
+            url: Spotify playlist URL or YouTube playlist URL
+        
+        Returns:
+            Task ID
+        """
+        record = self.store.create("playlist", url)
+        self._spawn(self._run_playlist(record.task_id, url))
+        return record.task_id
+    
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        """Get the state of a task."""
+        return self.store.get(task_id)
+    
+    def _spawn(self, coroutine) -> None:
+        running = asyncio.get_running_loop().create_task(coroutine)
+        self._running.add(running)
+        running.add_done_callback(self._running.discard)
+    
+    async def _network(self, func, *args, **kwargs):
+        """Run a blocking network stage in the thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._threads, partial(func, *args, **kwargs)
+        )
+    
+    def _step(self, task_id: str, step: str) -> None:
+        self.store.update(task_id, status=TaskStatus.PROCESSING, step=step)
+    
+    async def _run_track(self, task_id: str, url: str, formats: Optional[List[str]] = None) -> None:
+        async with self._slots:
+            try:
+                result = await self._process_track(task_id, url, formats)
+            except PipelineError as e:
+                result = {"success": False, "error": str(e), "track": e.track}
+            except asyncio.CancelledError:
+                self.store.update(task_id, status=TaskStatus.FAILED, error="Cancelled")
+                raise
+            except Exception as e:
+                result = {"success": False, "error": str(e), "track": "Unknown"}
+            self.store.update(task_id, status=TaskStatus.COMPLETED, step=None, result=result)
+    
+    async def _process_track(self, task_id: str, url: str, formats: Optional[List[str]] = None) -> Dict:
+        loop = asyncio.get_running_loop()
+        
+        def on_step(step: str) -> None:
+            loop.call_soon_threadsafe(self._step, task_id, step)
+        
+        extra_formats = parse_formats(formats)
+        url_type, youtube_url, metadata = await self._network(resolve_track, url, on_step)
+        downloader = AudioDownloader(self.download_dir)
+        
+        existing_file = await self._network(find_downloaded, metadata, youtube_url)
+        if existing_file:
+            extra_files = downloader.format_paths(existing_file, extra_formats)
+            if extra_files:
+                # Formats asked for later are encoded from the library copy
+                self._step(task_id, "Encoding formats")
+                await self._network(encode_formats, existing_file, metadata, extra_files)
+            storage_keys = await self._network(store_track, existing_file, extra_files)
+            return track_result(
+                existing_file, metadata, url_type, already_downloaded=True, formats=extra_files,
+                storage_keys=storage_keys
+            )
+        
+        # Fetch the cover art while the audio downloads
+        tags = MetadataService.prepare_tags_async(metadata)
+        
+        self._step(task_id, "Downloading audio")
+        fingerprint = loudness = None
+        extra_files = []
+        if self._transcoder is None:
+            output_file = await self._network(
+                downloader.download_streaming, youtube_url, metadata, formats=extra_formats
+            )
+            if output_file:
+                loudness = downloader.pop_loudness(output_file)
+                extra_files = downloader.format_paths(output_file, extra_formats)
+        else:
+            source_file = await self._network(downloader.fetch, youtube_url, metadata)
+            if source_file:
+                output_file = downloader.output_path(metadata)
+                extra_files = downloader.format_paths(output_file, extra_formats)
+                # A recording that is already in the library needn't be encoded again
+                duplicate_of, fingerprint = await self._network(link_duplicate, source_file, output_file)
+                if duplicate_of:
+                    try:
+                        await self._network(encode_formats, source_file, metadata, extra_files)
+                    finally:
+                        source_file.unlink()
+                    await self._network(record_download, output_file, metadata, youtube_url)
+                    storage_keys = await self._network(store_track, output_file, extra_files)
+                    return track_result(
+                        output_file, metadata, url_type, duplicate_of=duplicate_of, formats=extra_files,
+                        storage_keys=storage_keys
+                    )
+                
+                self._step(task_id, "Transcoding")
+                # submit() blocks while the pool is saturated, so keep it off the loop
+                future = await self._network(
+                    self._transcoder.submit, source_file, output_file, extra_outputs=extra_files
+                )
+                loudness = (await asyncio.wrap_future(future)).loudness
+            else:
+                output_file = None
+        
+        if not output_file:
+            return {"success": False, "error": "Failed to download audio", "track": metadata.title}
+        
+        self._step(task_id, "Embedding metadata")
+        return await self._network(
+            finish_track, output_file, metadata, url_type, youtube_url, fingerprint,
+            loudness=loudness, tags=tags, extra_files=extra_files
+        )
+    
+    async def _run_playlist(self, task_id: str, url: str) -> None:
+        loop = asyncio.get_running_loop()
+        
+        def on_step(step: str) -> None:
+            loop.call_soon_threadsafe(self._step, task_id, step)
+        
+        try:
+            url_type, entries = await self._network(resolve_playlist, url, on_step, library_or_none())
+            children = [
+                {
+                    "task_id": self.submit_track(entry["url"]), "track": entry["track"],
+                    "artist": entry["artist"], "position": position
+                }
+                for position, entry in enumerate(entries) if not entry.get("file")
+            ]
+            existing = [
+                {"track": entry["track"], "artist": entry["artist"], "file": entry["file"], "position": position}
+                for position, entry in enumerate(entries) if entry.get("file")
+            ]
+            result = playlist_result(url_type, children, existing)
+        except asyncio.CancelledError:
+            self.store.update(task_id, status=TaskStatus.FAILED, error="Cancelled")
+            raise
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        self.store.update(task_id, status=TaskStatus.COMPLETED, step=None, result=result)
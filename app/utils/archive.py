@@ -0,0 +1,90 @@
+"""
+ZIP archives streamed as they are written, and M3U playlists.
+"""
+import time
+import zipfile
+from contextlib import closing
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Tuple, Union
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class _Sink:
+    """Write-only file object collecting the bytes zipfile writes until they are drained."""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self) -> None:
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(members: Iterable[Tuple[str, Union[Path, bytes, Callable[[], BinaryIO]]]]) -> Iterator[bytes]:
+    """
+    Stream a ZIP archive without a temporary file or whole files in memory.
+    
+    Entries are stored uncompressed (audio doesn't compress) and written
+    with data descriptors, since the output can't be seeked back into;
+    Zip64 records are added for files and archives beyond 4 GB. Memory
+    stays at about COPY_CHUNK_SIZE whatever the archive's size.
+    
+    Args:
+        members: (name in the archive, source) pairs; a source is a file
+            path, the contents, or a function opening a stored object
+    
+    Yields:
+        Consecutive pieces of the archive
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, strict_timestamps=False) as archive:
+        for name, source in members:
+            if isinstance(source, bytes):
+                archive.writestr(name, source)
+                yield sink.drain()
+                continue
+            
+            if isinstance(source, Path):
+                info = zipfile.ZipInfo.from_file(source, name, strict_timestamps=False)
+                opener, zip64 = partial(open, source, "rb"), False
+            else:
+                # A stored object of unknown size always gets Zip64 sizes
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                opener, zip64 = source, True
+            with closing(opener()) as src, archive.open(info, "w", force_zip64=zip64) as dest:
+                while True:
+                    chunk = src.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    # The central directory
+    yield sink.drain()
+
+
+def m3u_playlist(entries: Iterable[Tuple[str, str]]) -> bytes:
+    """
+    Build an extended M3U playlist.
+    
+    Args:
+        entries: (title, relative path) pairs in playing order
+    
+    Returns:
+        UTF-8 encoded playlist (save as .m3u8)
+    """
+    lines = ["#EXTM3U"]
+    for title, path in entries:
+        lines.append(f"#EXTINF:-1,{title}")
+        lines.append(path)
+    return ("\n".join(lines) + "\n").encode()
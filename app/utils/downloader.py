@@ -1,12 +1,29 @@
 """
 Audio downloader using yt-dlp.
 """
-import yt_dlp
+import glob
+import time
 from pathlib import Path
-from typing import Optional
-import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
+from app.config import settings
 from app.models import TrackMetadata
+from app.utils.ffmpeg import Loudness, OutputFormat, StreamingEncoder, transcode
+from app.utils.formats import AudioFormatSelector
+from app.utils.http import get_client
+from app.utils.layout import PathLayout
+from app.utils.resilience import TransientError, classify, get_breaker
+from app.utils.ytdl_pool import get_ytdl_pool
+from app.utils.parallel_fetch import (
+    connection_budget, ytdlp_parallel_opts, probe_content_length, iter_ranges
+)
+
+# Protocols whose bytes we fetch ourselves and pipe into ffmpeg
+PIPED_PROTOCOLS = ('http', 'https')
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Extra formats live in a hidden tree, which the library scanner and migrations skip
+FORMATS_DIR = ".formats"
 
 
 class AudioDownloader:
@@ -21,72 +38,352 @@ class AudioDownloader:
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.layout = PathLayout(self.output_dir)
+        self._loudness: Dict[Path, Optional[Loudness]] = {}
     
-    def download(self, youtube_url: str, metadata: TrackMetadata) -> Optional[Path]:
+    def download(
+        self,
+        youtube_url: str,
+        metadata: TrackMetadata,
+        stream: Optional[bool] = None,
+        progress_hooks: Optional[List[Callable[[dict], None]]] = None,
+        cancel_check: Optional[Callable[[], None]] = None,
+        formats: Sequence[OutputFormat] = ()
+    ) -> Optional[Path]:
         """
         Download audio from YouTube and convert to MP3.
         
         Args:
             youtube_url: YouTube video URL
             metadata: Track metadata for naming
+            stream: Encode while downloading (defaults to settings.streaming_transcode)
+            progress_hooks: yt-dlp style progress hooks; raising
+                yt_dlp.utils.DownloadCancelled from one aborts the download
+            cancel_check: Called periodically while ffmpeg runs; raising
+                from it kills the encode
+            formats: Extra formats encoded by the same ffmpeg run, written
+                to format_paths() of the MP3
         
         Returns:
             Path to downloaded MP3 file, or None if failed
+        
+        Raises:
+            TransientError: If YouTube is unreachable or throttling (worth retrying)
         """
+        if stream is None:
+            stream = settings.streaming_transcode
+        if stream:
+            return self.download_streaming(youtube_url, metadata, progress_hooks, cancel_check, formats)
+        
         try:
-            # Sanitize filename
-            safe_filename = self._sanitize_filename(
-                f"{metadata.artist} - {metadata.title}"
-            )
-            output_template = str(self.output_dir / f"{safe_filename}.%(ext)s")
+            source_file = self.fetch(youtube_url, metadata, progress_hooks)
+            if not source_file:
+                return None
             
-            # Configure yt-dlp
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'outtmpl': output_template,
-                'quiet': True,
-                'no_warnings': True,
-            }
+            # Encode ourselves rather than with yt-dlp's FFmpegExtractAudio,
+            # so the same ffmpeg run also measures the track's loudness
+            output_file = self.output_path(metadata)
+            try:
+                result = transcode(
+                    source_file, output_file, cancel_check=cancel_check,
+                    extra_outputs=self.format_paths(output_file, formats)
+                )
+            finally:
+                source_file.unlink(missing_ok=True)
+            self._loudness[output_file] = result.loudness
             
-            # Download
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([youtube_url])
+            return output_file
+        
+        except TransientError:
+            raise
+        except Exception as e:
+            print(f"Error downloading audio: {e}")
+            return None
+    
+    def pop_loudness(self, output_file: Path) -> Optional[Loudness]:
+        """
+        Get (and forget) the loudness measured while encoding a file.
+        
+        Args:
+            output_file: Path returned by download() or download_streaming()
+        
+        Returns:
+            Loudness, or None if it wasn't measured
+        """
+        return self._loudness.pop(Path(output_file), None)
+    
+    def fetch(
+        self,
+        youtube_url: str,
+        metadata: TrackMetadata,
+        progress_hooks: Optional[List[Callable[[dict], None]]] = None
+    ) -> Optional[Path]:
+        """
+        Download the source audio without transcoding it.
+        
+        Args:
+            youtube_url: YouTube video URL
+            metadata: Track metadata for naming
+            progress_hooks: yt-dlp style progress hooks
+        
+        Returns:
+            Path to the downloaded source file, or None if failed
+        
+        Raises:
+            TransientError: If YouTube is unreachable or throttling (worth retrying)
+        """
+        output_file = self.output_path(metadata)
+        try:
+            output_template = self._output_template(output_file, ".source")
+            format_selector = self._format_selector()
             
-            # Return path to the MP3 file
-            output_file = self.output_dir / f"{safe_filename}.mp3"
+            with connection_budget.lease(settings.fragment_concurrency) as connections:
+                with get_ytdl_pool().acquire(
+                    "download",
+                    format=format_selector,
+                    outtmpl=output_template,
+                    progress_hooks=progress_hooks or [],
+                    **ytdlp_parallel_opts(connections)
+                ) as ydl:
+                    with get_breaker("youtube").guard():
+                        info = ydl.extract_info(youtube_url, download=True)
+            self._report_format(format_selector, info)
+            
+            downloads = (info or {}).get('requested_downloads') or []
+            if downloads and Path(downloads[0]['filepath']).exists():
+                return Path(downloads[0]['filepath'])
+            return None
+        
+        except TransientError:
+            self._remove_partials(output_file)
+            raise
+        except Exception as e:
+            print(f"Error downloading audio: {e}")
+            self._remove_partials(output_file)
+            return None
+    
+    @staticmethod
+    def _remove_partials(output_file: Path) -> None:
+        """Remove what an aborted source download left next to an MP3 path."""
+        # yt-dlp keeps .part files of aborted downloads for resuming
+        for partial in output_file.parent.glob(glob.escape(output_file.stem) + ".source.*"):
+            partial.unlink(missing_ok=True)
+    
+    def output_path(self, metadata: TrackMetadata) -> Path:
+        """
+        Get the MP3 path a track is written to.
+        
+        The path follows settings.path_template; if another track already
+        holds it, a deterministic suffix is added instead of overwriting.
+        
+        Args:
+            metadata: Track metadata for naming
+        
+        Returns:
+            Path to the MP3 file (its directory is created)
+        """
+        output_file = self.layout.path_for(metadata)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        return output_file
+    
+    def format_paths(self, output_file: Path, formats: Sequence[OutputFormat]) -> List[Tuple[OutputFormat, Path]]:
+        """
+        Get the paths of a track's extra formats.
+        
+        Args:
+            output_file: Path of the track's MP3
+            formats: Extra formats
+        
+        Returns:
+            (format, path) pairs, e.g. .formats/opus/<path of the MP3>.opus
+            (directories are created)
+        """
+        output_file = Path(output_file)
+        # Library files from elsewhere keep only their name
+        relative = (
+            output_file.relative_to(self.output_dir)
+            if output_file.is_relative_to(self.output_dir) else Path(output_file.name)
+        )
+        paths = []
+        for fmt in formats:
+            path = (self.output_dir / FORMATS_DIR / fmt.name / relative).with_suffix(fmt.extension)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            paths.append((fmt, path))
+        return paths
+    
+    @staticmethod
+    def _output_template(output_file: Path, suffix: str = "") -> str:
+        """
+        Build a yt-dlp output template next to an MP3 path.
+        
+        Args:
+            output_file: Target MP3 path
+            suffix: Extra suffix before the extension (e.g. ".source")
+        
+        Returns:
+            Output template with '%' in the file name escaped
+        """
+        stem = str(output_file.with_suffix("")).replace("%", "%%")
+        return f"{stem}{suffix}.%(ext)s"
+    
+    def download_streaming(
+        self,
+        youtube_url: str,
+        metadata: TrackMetadata,
+        progress_hooks: Optional[List[Callable[[dict], None]]] = None,
+        cancel_check: Optional[Callable[[], None]] = None,
+        formats: Sequence[OutputFormat] = ()
+    ) -> Optional[Path]:
+        """
+        Download audio and encode it to MP3 in a single overlapped pass.
+        
+        The source stream is piped into an ffmpeg encoder as it arrives, so
+        the network and the encoder run concurrently and no intermediate
+        file is written. HLS/DASH sources are handed to ffmpeg directly,
+        which fetches and encodes their segments itself.
+        
+        Args:
+            youtube_url: YouTube video URL
+            metadata: Track metadata for naming
+            progress_hooks: yt-dlp style progress hooks, called as bytes arrive
+                (periodically for HLS/DASH); raising from one aborts the encode
+            cancel_check: Called periodically while ffmpeg fetches HLS/DASH
+                sources itself
+            formats: Extra formats encoded from the same stream (see format_paths())
+        
+        Returns:
+            Path to downloaded MP3 file, or None if failed
+        
+        Raises:
+            TransientError: If YouTube is unreachable or throttling (worth retrying)
+        """
+        output_file = self.output_path(metadata)
+        extra_outputs = self.format_paths(output_file, formats)
+        
+        try:
+            format_selector = self._format_selector()
+            with get_ytdl_pool().acquire("download", format=format_selector) as ydl:
+                with get_breaker("youtube").guard():
+                    info = ydl.extract_info(youtube_url, download=False)
+            self._report_format(format_selector, info)
             
-            if output_file.exists():
-                return output_file
-            else:
+            source = self._stream_source(info)
+            if not source:
+                print("Error downloading audio: no streamable format found")
                 return None
+            
+            http_headers = source.get('http_headers') or {}
+            
+            if source.get('protocol') not in PIPED_PROTOCOLS:
+                started = time.monotonic()
+                
+                def poll() -> None:
+                    # ffmpeg fetches the segments itself, so there are no byte
+                    # counts to report, but hooks still get to abort the encode
+                    if cancel_check:
+                        cancel_check()
+                    for hook in progress_hooks or []:
+                        hook({'status': 'downloading', 'elapsed': time.monotonic() - started})
                 
+                with StreamingEncoder(
+                    output_file, source=source['url'], http_headers=http_headers, extra_outputs=extra_outputs
+                ) as encoder:
+                    encoder.finish(poll if cancel_check or progress_hooks else None)
+                    self._loudness[output_file] = encoder.loudness
+                    return output_file
+            
+            with connection_budget.lease(settings.fragment_concurrency) as connections:
+                with StreamingEncoder(output_file, extra_outputs=extra_outputs) as encoder:
+                    total = source.get('filesize') or source.get('filesize_approx')
+                    downloaded = 0
+                    started = time.monotonic()
+                    for chunk in self._iter_source(source['url'], http_headers, connections, source.get('filesize')):
+                        encoder.write(chunk)
+                        downloaded += len(chunk)
+                        for hook in progress_hooks or []:
+                            hook({
+                                'status': 'downloading',
+                                'downloaded_bytes': downloaded,
+                                'total_bytes': total,
+                                'speed': downloaded / max(time.monotonic() - started, 1e-6),
+                            })
+                    encoder.finish()
+                    self._loudness[output_file] = encoder.loudness
+                    return output_file
+        
         except Exception as e:
+            # The media host failing mid-stream is as retryable as the extraction failing
+            error = classify("youtube", e)
+            if isinstance(error, TransientError):
+                raise error from e
             print(f"Error downloading audio: {e}")
             return None
     
     @staticmethod
-    def _sanitize_filename(filename: str) -> str:
+    def _iter_source(
+        url: str,
+        http_headers: dict,
+        connections: int,
+        size: Optional[int] = None
+    ):
         """
-        Sanitize filename by removing invalid characters.
+        Iterate over the bytes of a source URL, in parallel ranges if possible.
         
         Args:
-            filename: Original filename
+            url: Direct media URL
+            http_headers: Headers required by the media host
+            connections: Connections granted to this download
+            size: Known size in bytes, if any
+        
+        Yields:
+            Consecutive chunks of the source
+        """
+        if connections > 1:
+            size = size or probe_content_length(url, http_headers)
+            if size:
+                yield from iter_ranges(url, size, http_headers, connections)
+                return
+        
+        with get_client(http2=False).stream('GET', url, headers=http_headers, timeout=30) as response:
+            response.raise_for_status()
+            yield from response.iter_bytes(chunk_size=STREAM_CHUNK_SIZE)
+    
+    @staticmethod
+    def _format_selector():
+        """
+        Get the yt-dlp format option for source downloads.
         
         Returns:
-            Sanitized filename
+            An AudioFormatSelector, or the plain 'bestaudio/best' spec when
+            efficient selection is disabled
+        """
+        if settings.efficient_format_selection:
+            return AudioFormatSelector()
+        return 'bestaudio/best'
+    
+    @staticmethod
+    def _report_format(format_selector, info: Optional[dict]) -> None:
+        """Log the bandwidth saved by the format selector, if one was used."""
+        if isinstance(format_selector, AudioFormatSelector) and info:
+            format_selector.report(info.get('duration'))
+    
+    @staticmethod
+    def _stream_source(info: dict) -> Optional[dict]:
         """
-        # Remove invalid characters
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
+        Pick the single format dictionary to stream from extracted info.
         
-        # Replace multiple spaces with single space
-        filename = re.sub(r'\s+', ' ', filename)
+        Args:
+            info: yt-dlp info dictionary after format selection
+        
+        Returns:
+            Format dictionary with a 'url', or None
+        """
+        if not info:
+            return None
         
-        # Trim and limit length
-        filename = filename.strip()[:200]
+        # Merged selections (separate video+audio) list their parts here
+        for fmt in info.get('requested_formats') or []:
+            if fmt.get('acodec') not in (None, 'none') and fmt.get('url'):
+                return fmt
         
-        return filename
+        return info if info.get('url') else None
@@ -0,0 +1,425 @@
+"""
+Helpers for running ffmpeg audio encodes.
+"""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+
+FFMPEG_BINARY = shutil.which("ffmpeg") or "ffmpeg"
+
+# ReplayGain 2.0 reference loudness
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+
+# Per-frame measurements go to the verbose log, only the summary to info
+LOUDNESS_FILTER = "ebur128=peak=true:framelog=verbose"
+
+# Seconds between cancellation checks while ffmpeg runs
+CANCEL_POLL_INTERVAL = 0.5
+
+_INTEGRATED = re.compile(r"Integrated loudness:\s*I:\s*(-?[\d.]+|-inf) LUFS")
+_TRUE_PEAK = re.compile(r"True peak:\s*Peak:\s*(-?[\d.]+|-inf) dBFS")
+
+
+@dataclass
+class Loudness:
+    """EBU R128 measurement of a track."""
+    integrated: float  # LUFS
+    true_peak: float  # dBTP
+    
+    @property
+    def track_gain(self) -> float:
+        """ReplayGain track gain in dB."""
+        return REPLAYGAIN_REFERENCE_LUFS - self.integrated
+    
+    @property
+    def peak(self) -> float:
+        """True peak as a linear amplitude (1.0 = full scale)."""
+        return 10 ** (self.true_peak / 20)
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """An extra encode of a track, written by the same ffmpeg run as its MP3."""
+    name: str
+    codec: str
+    bitrate: int  # kbps
+    extension: str
+    muxer: str
+    channels: Optional[int] = None
+
+
+# Formats a download can ask for besides the library MP3 ("mp3")
+OUTPUT_FORMATS = {
+    "opus": OutputFormat("opus", "libopus", 128, ".opus", "opus"),
+    "preview": OutputFormat("preview", "libmp3lame", 64, ".mp3", "mp3", channels=1),
+}
+
+
+def parse_format(spec: str) -> OutputFormat:
+    """
+    Parse an output format name, optionally with a bitrate ("opus@96").
+    
+    Args:
+        spec: Key of OUTPUT_FORMATS, or "<key>@<kbps>"
+    
+    Returns:
+        OutputFormat
+    
+    Raises:
+        ValueError: If the format is unknown or the bitrate invalid
+    """
+    name, _, bitrate = spec.strip().lower().partition("@")
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {spec} (known: mp3, {', '.join(OUTPUT_FORMATS)})")
+    fmt = OUTPUT_FORMATS[name]
+    if bitrate:
+        if not bitrate.isdigit() or not 8 <= int(bitrate) <= 512:
+            raise ValueError(f"Invalid bitrate in output format: {spec}")
+        fmt = replace(fmt, name=f"{name}@{bitrate}", bitrate=int(bitrate))
+    return fmt
+
+
+def parse_formats(specs: Optional[Sequence[str]]) -> List[OutputFormat]:
+    """
+    Parse the output formats a download asked for.
+    
+    Args:
+        specs: Format names; "mp3" (the library file, always written) is skipped
+    
+    Returns:
+        Extra formats, without duplicates
+    
+    Raises:
+        ValueError: If a format is unknown or its bitrate invalid
+    """
+    formats = {}
+    for spec in specs or []:
+        if spec.strip().lower() != "mp3":
+            fmt = parse_format(spec)
+            formats.setdefault(fmt.name, fmt)
+    return list(formats.values())
+
+
+@dataclass
+class EncodeResult:
+    """Outcome of an ffmpeg encode."""
+    seconds: float
+    loudness: Optional[Loudness] = None
+
+
+def parse_loudness(stderr: str) -> Optional[Loudness]:
+    """
+    Parse the summary the ebur128 filter logs at the end of a run.
+    
+    Args:
+        stderr: ffmpeg's log output
+    
+    Returns:
+        Loudness, or None if there is no (finite) measurement
+    """
+    integrated = _INTEGRATED.search(stderr)
+    peak = _TRUE_PEAK.search(stderr)
+    if not integrated or not peak or "inf" in (integrated.group(1), peak.group(1)):
+        return None
+    return Loudness(integrated=float(integrated.group(1)), true_peak=float(peak.group(1)))
+
+
+def log_args(analyze: bool) -> List[str]:
+    """
+    Build the ffmpeg logging arguments.
+    
+    Args:
+        analyze: Whether the loudness summary (logged at info level) is needed
+    
+    Returns:
+        List of ffmpeg arguments
+    """
+    if analyze:
+        return ['-hide_banner', '-nostats', '-loglevel', 'info']
+    return ['-loglevel', 'error']
+
+
+def encode_args(output_file: Path, bitrate: Optional[int] = None, analyze: bool = False) -> List[str]:
+    """
+    Build the ffmpeg output arguments for an MP3 encode.
+    
+    Args:
+        output_file: Path ffmpeg should write to
+        bitrate: Target bitrate in kbps (defaults to settings.audio_bitrate)
+        analyze: Measure loudness in the same pass as the encode
+    
+    Returns:
+        List of ffmpeg arguments
+    """
+    args = ['-vn']
+    if analyze:
+        args += ['-af', LOUDNESS_FILTER]
+    return args + [
+        '-codec:a', 'libmp3lame',
+        '-b:a', f"{bitrate or settings.audio_bitrate}k",
+        # Reserve room in the ID3 header so tagging never moves the audio
+        '-metadata_header_padding', str(settings.tag_padding_kb * 1024),
+        '-f', 'mp3',
+        str(output_file),
+    ]
+
+
+def format_args(fmt: OutputFormat, output_file: Path) -> List[str]:
+    """
+    Build the ffmpeg output arguments of an extra format.
+    
+    Args:
+        fmt: Output format
+        output_file: Path ffmpeg should write to
+    
+    Returns:
+        List of ffmpeg arguments
+    """
+    args = ['-vn', '-codec:a', fmt.codec, '-b:a', f"{fmt.bitrate}k"]
+    if fmt.channels:
+        args += ['-ac', str(fmt.channels)]
+    if fmt.muxer == 'mp3':
+        args += ['-metadata_header_padding', str(settings.tag_padding_kb * 1024)]
+    return args + ['-f', fmt.muxer, str(output_file)]
+
+
+def _partial(output_file: Path) -> Path:
+    return output_file.with_name(output_file.name + ".part")
+
+
+def input_args(source: str, http_headers: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Build the ffmpeg input arguments for a file, URL or stdin.
+    
+    Args:
+        source: Input path, URL or "pipe:0"
+        http_headers: HTTP headers to send when source is a URL
+    
+    Returns:
+        List of ffmpeg arguments
+    """
+    args = []
+    if http_headers and source.startswith(("http://", "https://")):
+        header_block = "".join(f"{key}: {value}\r\n" for key, value in http_headers.items())
+        args += ['-headers', header_block]
+    return args + ['-i', source]
+
+
+def communicate(process: subprocess.Popen, cancel_check: Optional[Callable[[], None]] = None) -> bytes:
+    """
+    Wait for an ffmpeg process and collect its log.
+    
+    Args:
+        process: ffmpeg process started with stderr=PIPE
+        cancel_check: Called every CANCEL_POLL_INTERVAL seconds while ffmpeg
+            runs; if it raises, ffmpeg is killed and the exception propagates
+    
+    Returns:
+        ffmpeg's stderr output
+    """
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=CANCEL_POLL_INTERVAL if cancel_check else None)
+            return stderr or b""
+        except subprocess.TimeoutExpired:
+            try:
+                cancel_check()
+            except BaseException:
+                process.kill()
+                process.communicate()
+                raise
+
+
+def transcode(
+    source: Path,
+    output_file: Optional[Path],
+    bitrate: Optional[int] = None,
+    delete_source: bool = False,
+    analyze: Optional[bool] = None,
+    cancel_check: Optional[Callable[[], None]] = None,
+    extra_outputs: Sequence[Tuple[OutputFormat, Path]] = ()
+) -> EncodeResult:
+    """
+    Encode a downloaded source file to MP3 and any extra formats.
+    
+    The source is decoded once and fed to every encoder of the run. Each
+    output is written to a temporary file that is renamed into place on
+    success, so a failed encode never leaves a truncated file behind.
+    
+    Args:
+        source: Path to the downloaded source file
+        output_file: Path to the final MP3 file (None for extra formats only)
+        bitrate: Target bitrate in kbps
+        delete_source: Remove the source file once the encode succeeds or is cancelled
+        analyze: Measure loudness in the same pass (defaults to settings.loudness_analysis)
+        cancel_check: Called periodically during the encode; raising from
+            it kills ffmpeg (see communicate())
+        extra_outputs: (format, path) of further encodes of the same source
+    
+    Returns:
+        Encode time and, if analyzed, the loudness of the track
+    """
+    if analyze is None:
+        analyze = settings.loudness_analysis
+    # Loudness is measured on the MP3 branch
+    analyze = analyze and output_file is not None
+    started = time.perf_counter()
+    outputs = [Path(path) for _, path in extra_outputs]
+    command = [FFMPEG_BINARY, '-y', '-nostdin'] + log_args(analyze)
+    command += input_args(str(source))
+    if output_file is not None:
+        output_file = Path(output_file)
+        outputs.insert(0, output_file)
+        command += encode_args(_partial(output_file), bitrate, analyze)
+    for fmt, path in extra_outputs:
+        command += format_args(fmt, _partial(Path(path)))
+    
+    try:
+        try:
+            if cancel_check:
+                # An encode that waited in a queue doesn't start for a cancelled task
+                cancel_check()
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            stderr = communicate(process, cancel_check).decode(errors='replace')
+        except BaseException:
+            # Cancelled (or ffmpeg didn't start); nothing of this track is kept
+            if delete_source:
+                Path(source).unlink(missing_ok=True)
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.strip()}")
+        for path in outputs:
+            os.replace(_partial(path), path)
+    finally:
+        for path in outputs:
+            _partial(path).unlink(missing_ok=True)
+    
+    if delete_source:
+        Path(source).unlink(missing_ok=True)
+    
+    return EncodeResult(
+        seconds=time.perf_counter() - started,
+        loudness=parse_loudness(stderr) if analyze else None
+    )
+
+
+class StreamingEncoder:
+    """An ffmpeg MP3 (and extra format) encoder fed incrementally while the source downloads."""
+    
+    def __init__(
+        self,
+        output_file: Path,
+        source: str = "pipe:0",
+        http_headers: Optional[Dict[str, str]] = None,
+        bitrate: Optional[int] = None,
+        analyze: Optional[bool] = None,
+        extra_outputs: Sequence[Tuple[OutputFormat, Path]] = ()
+    ):
+        """
+        Initialize encoder.
+        
+        Args:
+            output_file: Path to the final MP3 file
+            source: "pipe:0" to feed bytes with write(), or a URL ffmpeg
+                fetches itself (HLS/DASH manifests)
+            http_headers: HTTP headers for URL sources
+            bitrate: Target bitrate in kbps
+            analyze: Measure loudness in the same pass (defaults to settings.loudness_analysis)
+            extra_outputs: (format, path) of further encodes of the same stream
+        """
+        self.output_file = Path(output_file)
+        self.partial_file = _partial(self.output_file)
+        self.extra_outputs = [(fmt, Path(path)) for fmt, path in extra_outputs]
+        self.source = source
+        self.http_headers = http_headers
+        self.bitrate = bitrate
+        self.analyze = settings.loudness_analysis if analyze is None else analyze
+        self.loudness: Optional[Loudness] = None
+        self.process: Optional[subprocess.Popen] = None
+        self._stderr_reader: Optional[threading.Thread] = None
+        self._stderr = b""
+    
+    def start(self) -> "StreamingEncoder":
+        """Spawn the ffmpeg process."""
+        command = [FFMPEG_BINARY, '-y', '-nostdin'] + log_args(self.analyze)
+        command += input_args(self.source, self.http_headers)
+        command += encode_args(self.partial_file, self.bitrate, self.analyze)
+        for fmt, path in self.extra_outputs:
+            command += format_args(fmt, _partial(path))
+        
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE if self.source == "pipe:0" else subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        # Drain the log while we write, so a chatty input can't fill the
+        # stderr pipe and stall ffmpeg (and with it our stdin writes)
+        self._stderr_reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_reader.start()
+        return self
+    
+    def _read_stderr(self) -> None:
+        self._stderr = self.process.stderr.read()
+    
+    def write(self, chunk: bytes) -> None:
+        """Feed downloaded bytes to the encoder."""
+        self.process.stdin.write(chunk)
+    
+    def finish(self, cancel_check: Optional[Callable[[], None]] = None) -> Path:
+        """
+        Close the input and wait for the encode to complete.
+        
+        The loudness measured during the encode is left in self.loudness.
+        
+        Args:
+            cancel_check: Called every CANCEL_POLL_INTERVAL seconds while
+                waiting; its exception propagates (and aborts the encode
+                when used as a context manager)
+        
+        Returns:
+            Path to the encoded file
+        """
+        if self.process.stdin:
+            self.process.stdin.close()
+        while True:
+            try:
+                returncode = self.process.wait(timeout=CANCEL_POLL_INTERVAL if cancel_check else None)
+                break
+            except subprocess.TimeoutExpired:
+                cancel_check()
+        self._stderr_reader.join()
+        stderr = self._stderr.decode(errors='replace')
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.strip()}")
+        for _, path in self.extra_outputs:
+            os.replace(_partial(path), path)
+        os.replace(self.partial_file, self.output_file)
+        if self.analyze:
+            self.loudness = parse_loudness(stderr)
+        return self.output_file
+    
+    def abort(self) -> None:
+        """Kill the encoder and remove the partial outputs."""
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.partial_file.unlink(missing_ok=True)
+        for _, path in self.extra_outputs:
+            _partial(path).unlink(missing_ok=True)
+    
+    def __enter__(self) -> "StreamingEncoder":
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
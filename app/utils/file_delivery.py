@@ -0,0 +1,288 @@
+"""
+File responses with byte ranges, conditional requests and proxy offload.
+"""
+import os
+import re
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, RedirectResponse, StreamingResponse
+
+from app.config import settings
+
+# ASGI extension of servers that can sendfile() a descriptor themselves
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+# Offload header per FILE_OFFLOAD mode
+OFFLOAD_HEADERS = {"x-accel-redirect": "X-Accel-Redirect", "x-sendfile": "X-Sendfile"}
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the file."""
+
+
+def etag_for(stat_result: os.stat_result) -> str:
+    """Get the strong ETag of a file version, from its size and modification time."""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a Range header.
+    
+    Only single ranges are served as such; multiple ranges get the whole
+    file, which RFC 9110 allows.
+    
+    Args:
+        header: Range header value
+        size: File size in bytes
+    
+    Returns:
+        Inclusive (start, end) byte positions, or None to send the whole file
+    
+    Raises:
+        RangeNotSatisfiable: If the range starts beyond the end of the file
+    """
+    match = _RANGE.match(header.replace(" ", ""))
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+class RangeFileResponse(FileResponse):
+    """
+    Serve a file without reading it into memory.
+    
+    Answers Range requests with 206 (or 416), If-None-Match with 304 and
+    honours If-Range, so interrupted downloads resume and cached copies
+    revalidate. On servers with the zero-copy send extension the kernel
+    copies the file to the socket; otherwise it streams in chunks. With an
+    offload mode the body is left to a fronting proxy entirely.
+    """
+    
+    chunk_size = 256 * 1024
+    
+    def __init__(
+        self,
+        path: Path,
+        request_headers,
+        offload: Optional[str] = None,
+        offload_root: Optional[Path] = None,
+        offload_prefix: str = "/",
+        method: Optional[str] = None,
+        filename: Optional[str] = None,
+        media_type: Optional[str] = None
+    ):
+        """
+        Initialize response.
+        
+        Args:
+            path: File to send
+            request_headers: Headers of the request being answered
+            offload: "x-accel-redirect" (nginx) or "x-sendfile" (Apache,
+                lighttpd) to let the proxy send the file
+            offload_root: Directory that offload_prefix maps to (X-Accel-Redirect)
+            offload_prefix: Internal proxy location of offload_root
+            method: Request method (HEAD sends headers only)
+            filename: Download name (defaults to the file's name)
+            media_type: Content type (guessed from the name by default)
+        """
+        stat_result = os.stat(path)
+        super().__init__(
+            path,
+            filename=filename or Path(path).name,
+            media_type=media_type,
+            method=method,
+            stat_result=stat_result,
+            headers={"etag": etag_for(stat_result), "accept-ranges": "bytes"}
+        )
+        self.range: Optional[Tuple[int, int]] = None
+        size = stat_result.st_size
+        etag = self.headers["etag"]
+        
+        if offload:
+            # The proxy sends the body and handles ranges and validators itself
+            if offload not in OFFLOAD_HEADERS:
+                raise ValueError(f"Unknown file offload mode: {offload}")
+            target = str(path)
+            if offload == "x-accel-redirect":
+                relative = Path(path).resolve().relative_to(Path(offload_root).resolve())
+                target = offload_prefix.rstrip("/") + "/" + quote(relative.as_posix())
+            self.headers[OFFLOAD_HEADERS[offload]] = target
+            self.headers["content-length"] = "0"
+            self.send_header_only = True
+            return
+        
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            self._not_modified()
+            return
+        
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (
+            if_range is None or if_range == etag or if_range == self.headers["last-modified"]
+        ):
+            try:
+                self.range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                self.send_header_only = True
+                return
+        
+        if self.range:
+            start, end = self.range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+    
+    def _not_modified(self) -> None:
+        self.status_code = 304
+        for header in ("content-length", "content-type", "content-disposition"):
+            if header in self.headers:
+                del self.headers[header]
+        self.send_header_only = True
+    
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        
+        start, end = self.range or (0, self.stat_result.st_size - 1)
+        count = end - start + 1
+        
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": file,
+                    "offset": start,
+                    "count": count,
+                    "more_body": False
+                })
+            return
+        
+        if count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(start)
+            more_body = True
+            while more_body:
+                chunk = await file.read(min(self.chunk_size, count))
+                count -= len(chunk)
+                # An empty read means the file shrank under us; end the body rather than hang
+                more_body = bool(chunk) and count > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+def resolve_download(file: str) -> Optional[Path]:
+    """
+    Resolve a file named in a task result, refusing anything outside the download directory.
+    
+    Args:
+        file: Path stored in the task result
+    
+    Returns:
+        Resolved path, or None if it is missing or outside settings.download_dir
+    """
+    path = Path(file).resolve()
+    if not path.is_relative_to(Path(settings.download_dir).resolve()) or not path.is_file():
+        return None
+    return path
+
+
+def file_response(path: Path, request) -> RangeFileResponse:
+    """
+    Build the response delivering a downloaded file, per the FILE_OFFLOAD settings.
+    
+    Args:
+        path: File below settings.download_dir
+        request: Request being answered
+    
+    Returns:
+        RangeFileResponse
+    """
+    return RangeFileResponse(
+        path,
+        request.headers,
+        offload=settings.file_offload,
+        offload_root=settings.download_dir,
+        offload_prefix=settings.file_offload_prefix,
+        method=request.method
+    )
+
+
+async def stored_file_response(storage, key: str, request, filename: str):
+    """
+    Build the response delivering a file from the artifact storage.
+    
+    Local objects are sent like downloaded files; S3 objects are
+    redirected to a presigned URL (STORAGE_REDIRECT) or proxied, passing
+    Range and If-None-Match through to the store.
+    
+    Args:
+        storage: Backend from get_storage()
+        key: Object key from the task result
+        request: Request being answered
+        filename: Download name
+    
+    Returns:
+        Response
+    
+    Raises:
+        FileNotFoundError: If a local object is missing
+    """
+    path = storage.local_path(key)
+    if path is not None:
+        # Offload only works for objects below the proxy's download location
+        below_download_dir = path.resolve().is_relative_to(Path(settings.download_dir).resolve())
+        return RangeFileResponse(
+            path,
+            request.headers,
+            offload=settings.file_offload if below_download_dir else None,
+            offload_root=settings.download_dir,
+            offload_prefix=settings.file_offload_prefix,
+            method=request.method,
+            filename=filename
+        )
+    
+    if settings.storage_redirect:
+        url = storage.presigned_url(key, filename, settings.storage_url_expires)
+        return RedirectResponse(url, status_code=307)
+    
+    status, headers, body = await run_in_threadpool(storage.get, key, request.headers)
+    headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+    return StreamingResponse(
+        body, status_code=status, headers=headers, media_type=guess_type(filename)[0] or "application/octet-stream"
+    )
@@ -0,0 +1,154 @@
+"""
+Acoustic fingerprints for recognising the same recording across sources.
+"""
+import subprocess
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.utils.ffmpeg import FFMPEG_BINARY
+
+SAMPLE_RATE = 11025
+FINGERPRINT_SECONDS = 120
+FRAME_SIZE = 1024
+HOP_SIZE = 512
+# Adjacent FFT bins are summed pairwise into 256 bands of ~21.5 Hz
+BAND_COUNT = 256
+PEAK_TIME_RADIUS = 10
+PEAK_BAND_RADIUS = 10
+# Peaks must stand this far (log10 power, i.e. 10 dB) above their band's median
+PEAK_MIN_PROMINENCE = 1.0
+FAN_OUT = 3
+MAX_PAIR_FRAMES = 127
+
+# Aligned hash matches needed to call two files the same recording
+MIN_ALIGNED_MATCHES = 20
+MIN_ALIGNED_RATIO = 0.05
+
+
+def decode_pcm(file_path: Path, seconds: int = FINGERPRINT_SECONDS) -> np.ndarray:
+    """
+    Decode the start of an audio file to mono PCM with ffmpeg.
+    
+    Args:
+        file_path: Any audio or video file ffmpeg can read
+        seconds: Maximum duration to decode
+    
+    Returns:
+        Float32 samples at SAMPLE_RATE
+    """
+    command = [
+        FFMPEG_BINARY, '-nostdin', '-loglevel', 'error',
+        '-i', str(file_path), '-t', str(seconds),
+        '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1',
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {file_path}: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768
+
+
+def _max_filter(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(values, pad, mode="constant", constant_values=-np.inf)
+    return sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+
+def fingerprint_samples(samples: np.ndarray) -> np.ndarray:
+    """
+    Compute the fingerprint of mono PCM samples.
+    
+    Spectrogram peaks (local maxima of the log band energies) are paired
+    with the next few peaks after them; each pair hashes its two bands and
+    their time distance, which survives re-encoding, volume changes and
+    different lead-in lengths.
+    
+    Args:
+        samples: Mono samples at SAMPLE_RATE
+    
+    Returns:
+        Array of shape (n, 2) with a 23-bit hash and the anchor's frame offset
+    """
+    if len(samples) < FRAME_SIZE:
+        return np.empty((0, 2), dtype=np.int64)
+    
+    frames = sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE] * np.hanning(FRAME_SIZE)
+    power = np.abs(np.fft.rfft(frames, axis=1)[:, :2 * BAND_COUNT]) ** 2
+    bands = np.log10(power.reshape(len(frames), BAND_COUNT, 2).sum(axis=2) + 1e-10)
+    
+    neighbourhood = _max_filter(_max_filter(bands, PEAK_TIME_RADIUS, 0), PEAK_BAND_RADIUS, 1)
+    # Ignore maxima in silence and in quiet, noise-dominated regions
+    is_peak = (bands == neighbourhood) & (bands > np.median(bands, axis=0) + PEAK_MIN_PROMINENCE)
+    times, freqs = np.nonzero(is_peak)
+    
+    hashes, offsets = [], []
+    for distance in range(1, FAN_OUT + 1):
+        dt = times[distance:] - times[:-distance]
+        valid = (dt > 0) & (dt <= MAX_PAIR_FRAMES)
+        anchor_freqs = freqs[:-distance][valid]
+        target_freqs = freqs[distance:][valid]
+        hashes.append((anchor_freqs << 15) | (target_freqs << 7) | dt[valid])
+        offsets.append(times[:-distance][valid])
+    
+    if not hashes:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.column_stack([np.concatenate(hashes), np.concatenate(offsets)]).astype(np.int64), axis=0)
+
+
+def fingerprint_file(file_path: Path) -> np.ndarray:
+    """
+    Compute the fingerprint of an audio file.
+    
+    Args:
+        file_path: Any audio or video file ffmpeg can read
+    
+    Returns:
+        Fingerprint array as returned by fingerprint_samples
+    """
+    return fingerprint_samples(decode_pcm(file_path))
+
+
+def best_alignment(
+    fingerprint: np.ndarray,
+    candidates: Iterable[Tuple[int, int, int]]
+) -> Optional[Tuple[int, int]]:
+    """
+    Find the candidate track sharing the most time-aligned hashes.
+    
+    Hashes of the same recording match at one (nearly) constant offset
+    difference, while chance matches of unrelated tracks scatter over many.
+    
+    Args:
+        fingerprint: Query fingerprint
+        candidates: (hash, track_id, offset) rows whose hash occurs in the query
+    
+    Returns:
+        Tuple of (track_id, aligned matches) if they pass the match thresholds, else None
+    """
+    query_offsets = defaultdict(list)
+    for hash_value, offset in fingerprint:
+        query_offsets[int(hash_value)].append(int(offset))
+    
+    alignments = Counter()
+    for hash_value, track_id, offset in candidates:
+        for query_offset in query_offsets.get(hash_value, ()):
+            alignments[(track_id, offset - query_offset)] += 1
+    
+    if not alignments:
+        return None
+    
+    # Peaks of a re-encode drift by a frame, so count neighbouring offsets too
+    (track_id, _), matches = max(
+        (
+            (key, sum(alignments.get((key[0], key[1] + shift), 0) for shift in (-1, 0, 1)))
+            for key in alignments
+        ),
+        key=lambda item: item[1]
+    )
+    if matches < max(MIN_ALIGNED_MATCHES, MIN_ALIGNED_RATIO * len(fingerprint)):
+        return None
+    return track_id, matches
@@ -0,0 +1,159 @@
+"""
+Bandwidth-efficient source format selection for yt-dlp.
+"""
+from typing import Dict, Iterator, List, Optional
+
+from app.config import settings
+
+# How many MP3 kbps one kbps of each source codec is worth when re-encoding
+CODEC_EFFICIENCY = {
+    'opus': 1.5,
+    'mp4a': 1.3,
+    'aac': 1.3,
+    'vorbis': 1.3,
+    'mp3': 1.0,
+}
+
+
+def _codec_family(acodec: Optional[str]) -> str:
+    return (acodec or '').split('.')[0].lower()
+
+
+def effective_kbps(fmt: Dict) -> float:
+    """
+    Estimate the MP3-equivalent audio quality of a format.
+    
+    Args:
+        fmt: yt-dlp format dictionary
+    
+    Returns:
+        Audio bitrate scaled by codec efficiency, in kbps
+    """
+    abr = fmt.get('abr') or fmt.get('tbr') or 0
+    return abr * CODEC_EFFICIENCY.get(_codec_family(fmt.get('acodec')), 1.0)
+
+
+def estimate_bytes(fmt: Optional[Dict], duration: Optional[float]) -> Optional[int]:
+    """
+    Estimate the download size of a format.
+    
+    Args:
+        fmt: yt-dlp format dictionary
+        duration: Media duration in seconds
+    
+    Returns:
+        Size in bytes, or None if it cannot be estimated
+    """
+    if not fmt:
+        return None
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    bitrate = fmt.get('tbr') or fmt.get('abr')
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return None
+
+
+def _is_audio_only(fmt: Dict) -> bool:
+    return fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none'
+
+
+def _has_audio(fmt: Dict) -> bool:
+    return fmt.get('acodec') not in (None, 'none')
+
+
+class AudioFormatSelector:
+    """
+    yt-dlp format selector that picks the smallest adequate audio stream.
+    
+    Passed as the 'format' option, it chooses the smallest audio-only
+    format whose codec-adjusted bitrate meets the target MP3 bitrate,
+    falls back to the best audio-only format below the target, and only
+    uses a muxed video format (the smallest one) when no audio-only
+    format exists.
+    """
+    
+    def __init__(self, target_kbps: Optional[int] = None):
+        """
+        Initialize selector.
+        
+        Args:
+            target_kbps: MP3 output bitrate the source must support
+        """
+        self.target_kbps = target_kbps or settings.audio_bitrate
+        self.selected: Optional[Dict] = None
+        self.baseline: Optional[Dict] = None
+    
+    def __call__(self, ctx: Dict) -> Iterator[Dict]:
+        formats = [f for f in ctx.get('formats', []) if not f.get('has_drm')]
+        self.baseline = self._bestaudio_best(formats)
+        self.selected = self.select(formats)
+        if self.selected:
+            yield self.selected
+    
+    def select(self, formats: List[Dict]) -> Optional[Dict]:
+        """
+        Choose the format to download.
+        
+        Args:
+            formats: yt-dlp format dictionaries (worst to best)
+        
+        Returns:
+            Chosen format dictionary, or None
+        """
+        audio_only = [f for f in formats if _is_audio_only(f)]
+        
+        if audio_only:
+            adequate = [f for f in audio_only if effective_kbps(f) >= self.target_kbps]
+            if adequate:
+                return min(adequate, key=lambda f: (self._size_key(f), -effective_kbps(f)))
+            return max(audio_only, key=lambda f: (effective_kbps(f), -self._size_key(f)[0]))
+        
+        muxed = [f for f in formats if _has_audio(f)]
+        if muxed:
+            return min(muxed, key=self._size_key)
+        
+        return formats[-1] if formats else None
+    
+    def report(self, duration: Optional[float]) -> Optional[int]:
+        """
+        Log the bytes saved against the 'bestaudio/best' choice.
+        
+        Args:
+            duration: Media duration in seconds
+        
+        Returns:
+            Estimated bytes saved, or None if unknown
+        """
+        if not self.selected:
+            return None
+        
+        chosen = estimate_bytes(self.selected, duration)
+        baseline = estimate_bytes(self.baseline, duration)
+        saved = baseline - chosen if chosen is not None and baseline is not None else None
+        
+        print(
+            f"Format selection: {self.selected.get('format_id')} "
+            f"({self.selected.get('acodec')} {self.selected.get('abr') or '?'}kbps, "
+            f"~{chosen or '?'} bytes) instead of {self.baseline.get('format_id') if self.baseline else '?'} "
+            f"(~{baseline or '?'} bytes), saved ~{saved if saved is not None else '?'} bytes"
+        )
+        return saved
+    
+    @staticmethod
+    def _size_key(fmt: Dict) -> tuple:
+        """Sort key ordering formats by size; bitrate compares across formats of one video."""
+        return (
+            fmt.get('tbr') or fmt.get('abr') or float('inf'),
+            fmt.get('filesize') or fmt.get('filesize_approx') or float('inf'),
+        )
+    
+    @staticmethod
+    def _bestaudio_best(formats: List[Dict]) -> Optional[Dict]:
+        """The format yt-dlp's 'bestaudio/best' spec would pick."""
+        audio_only = [f for f in formats if _is_audio_only(f)]
+        if audio_only:
+            return audio_only[-1]
+        muxed = [f for f in formats if _has_audio(f) and f.get('vcodec') != 'none']
+        return muxed[-1] if muxed else None
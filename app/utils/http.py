@@ -0,0 +1,295 @@
+"""
+Process-wide pooled HTTP clients shared by all services.
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+# Idempotent requests are retried on these statuses and on transport errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = ("GET", "HEAD", "OPTIONS")
+MAX_RETRY_DELAY = 30.0
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+COUNTERS = ("requests", "connections", "tls_handshakes", "http2_requests", "retries")
+
+
+def summarize(counts: Dict) -> Dict:
+    """
+    Complete a set of counters with the connection reuse ratio.
+    
+    Args:
+        counts: Counter values by name (missing ones are zero)
+    
+    Returns:
+        Dictionary with 'requests', 'connections', 'tls_handshakes',
+        'http2_requests', 'retries' and the share of requests that
+        reused a pooled connection ('reuse_ratio')
+    """
+    stats = {name: int(counts.get(name, 0)) for name in COUNTERS}
+    requests = stats["requests"]
+    stats["reuse_ratio"] = round(1 - stats["connections"] / requests, 3) if requests else None
+    return stats
+
+
+class HttpMetrics:
+    """Request and connection counters of this process's HTTP clients."""
+    
+    def __init__(self):
+        """Initialize counters."""
+        self._counts = Counter()
+        self._lock = threading.Lock()
+    
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increment a counter."""
+        with self._lock:
+            self._counts[name] += amount
+    
+    def snapshot(self) -> Dict:
+        """Get the current counters, as returned by summarize()."""
+        with self._lock:
+            counts = dict(self._counts)
+        return summarize(counts)
+    
+    def drain(self) -> Dict[str, int]:
+        """Get the counts since the last drain and clear them."""
+        with self._lock:
+            counts = dict(self._counts)
+            self._counts.clear()
+        return counts
+    
+    def reset(self) -> None:
+        """Clear all counters."""
+        with self._lock:
+            self._counts.clear()
+
+
+metrics = HttpMetrics()
+
+
+def _trace(event: str, info: dict) -> None:
+    """httpcore trace hook; new connections show up as connect/TLS events."""
+    if event == "connection.connect_tcp.complete":
+        metrics.count("connections")
+    elif event == "connection.start_tls.complete":
+        metrics.count("tls_handshakes")
+    elif event == "http2.send_request_headers.started":
+        metrics.count("http2_requests")
+
+
+async def _atrace(event: str, info: dict) -> None:
+    _trace(event, info)
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response], backoff: float) -> float:
+    """Exponential backoff, or the server's Retry-After if it gives seconds."""
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return min(float(retry_after), MAX_RETRY_DELAY)
+    return min(backoff * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Transport that counts requests and retries idempotent ones."""
+    
+    def __init__(self, transport: httpx.BaseTransport, retries: int, backoff: float = 0.5):
+        """
+        Initialize transport.
+        
+        Args:
+            transport: Transport that sends the requests
+            retries: Extra attempts after a failed one
+            backoff: Delay before the first retry in seconds, doubled for each further one
+        """
+        self._transport = transport
+        self.retries = retries
+        self.backoff = backoff
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = _trace
+        retries = self.retries if request.method in RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            metrics.count("requests")
+            response = None
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                response.close()
+            attempt += 1
+            metrics.count("retries")
+            time.sleep(_retry_delay(attempt, response, self.backoff))
+    
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async twin of RetryTransport."""
+    
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int, backoff: float = 0.5):
+        """
+        Initialize transport.
+        
+        Args:
+            transport: Transport that sends the requests
+            retries: Extra attempts after a failed one
+            backoff: Delay before the first retry in seconds, doubled for each further one
+        """
+        self._transport = transport
+        self.retries = retries
+        self.backoff = backoff
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = _atrace
+        retries = self.retries if request.method in RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            metrics.count("requests")
+            response = None
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                await response.aclose()
+            attempt += 1
+            metrics.count("retries")
+            await asyncio.sleep(_retry_delay(attempt, response, self.backoff))
+    
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _client_options() -> Dict:
+    return {
+        "headers": DEFAULT_HEADERS,
+        "timeout": httpx.Timeout(settings.http_timeout),
+        "follow_redirects": True,
+    }
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+
+
+def _use_http2(http2: Optional[bool]) -> bool:
+    return HTTP2_AVAILABLE and (settings.http2 if http2 is None else http2)
+
+
+_clients: Dict[bool, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[bool, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def get_client(http2: Optional[bool] = None) -> httpx.Client:
+    """
+    Get the process-wide HTTP client, creating it on first use.
+    
+    The client is thread-safe and keeps connections alive between
+    requests, so every service reuses the same TCP/TLS connections.
+    
+    Args:
+        http2: Negotiate HTTP/2 (defaults to settings.http2). Parallel range
+            downloads pass False, since they want separate connections
+            rather than streams multiplexed over one.
+    
+    Returns:
+        Shared httpx.Client
+    """
+    http2 = _use_http2(http2)
+    with _lock:
+        client = _clients.get(http2)
+        if client is None:
+            transport = RetryTransport(
+                httpx.HTTPTransport(http2=http2, limits=_limits()), settings.http_retries
+            )
+            client = _clients[http2] = httpx.Client(transport=transport, **_client_options())
+        return client
+
+
+def get_async_client(http2: Optional[bool] = None) -> httpx.AsyncClient:
+    """
+    Get the HTTP client for async code running on the current event loop.
+    
+    Async connections belong to the loop that opened them, so each loop
+    gets its own pooled client, with the same retries and counters as
+    the sync one.
+    
+    Args:
+        http2: Negotiate HTTP/2 (defaults to settings.http2)
+    
+    Returns:
+        Shared httpx.AsyncClient of the running loop
+    """
+    http2 = _use_http2(http2)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(http2)
+        if client is None:
+            transport = AsyncRetryTransport(
+                httpx.AsyncHTTPTransport(http2=http2, limits=_limits()), settings.http_retries
+            )
+            client = clients[http2] = httpx.AsyncClient(transport=transport, **_client_options())
+        return client
+
+
+def close_clients() -> None:
+    """Close the sync clients and their pooled connections."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+async def aclose_clients() -> None:
+    """Close the async clients of the running loop."""
+    with _lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        await client.aclose()
+
+
+def _forget_clients() -> None:
+    # A forked child must not share the parent's sockets
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _async_clients.clear()
+    metrics._lock = threading.Lock()
+    metrics.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_clients)
@@ -0,0 +1,96 @@
+"""
+Append-only job journal for resumable bulk runs.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class JobJournal:
+    """
+    Records every completed pipeline stage as one JSON line.
+    
+    Each entry is flushed and fsynced before the next stage starts, so an
+    interrupted run can be replayed to find exactly where every job
+    stopped. A torn final line from a crash is ignored on load.
+    """
+    
+    def __init__(self, path: Path):
+        """
+        Open (or create) a journal.
+        
+        Args:
+            path: Journal file path
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # Terminate a torn last line so new entries start on their own line
+            self._file.write("\n")
+            self._file.flush()
+    
+    def record(self, key: str, stage: str, **data) -> None:
+        """
+        Append a completed stage for a job.
+        
+        Args:
+            key: Job key (canonical source ID)
+            stage: Stage name
+            **data: JSON-serializable stage output
+        """
+        entry = {"key": key, "stage": stage, "ts": time.time(), **data}
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._apply(entry)
+    
+    def state(self, key: str) -> Optional[Dict]:
+        """
+        Get the accumulated state of a job.
+        
+        Args:
+            key: Job key
+        
+        Returns:
+            Dictionary with the last 'stage' and all recorded data, or None
+        """
+        return self._state.get(key)
+    
+    def close(self) -> None:
+        """Close the journal file."""
+        self._file.close()
+    
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as journal:
+            journal.seek(-1, os.SEEK_END)
+            return journal.read(1) == b"\n"
+    
+    def _apply(self, entry: Dict) -> None:
+        state = self._state.setdefault(entry["key"], {})
+        state.update(entry)
+    
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    # Torn write from an interrupted run
+                    continue
+    
+    def __enter__(self) -> "JobJournal":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,187 @@
+"""
+On-disk layout of downloaded files.
+"""
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from mutagen.id3 import ID3
+
+from app.config import settings
+from app.models import TrackMetadata
+
+MAX_COMPONENT_LENGTH = 200
+COLLISION_HASH_LENGTH = 8
+
+
+def sanitize_component(value: str) -> str:
+    """
+    Make a string safe to use as a single path component.
+    
+    Args:
+        value: Original string
+    
+    Returns:
+        String without path separators, invalid characters or leading dots
+    """
+    # Remove invalid characters
+    value = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '', value or '')
+    
+    # Replace multiple spaces with single space
+    value = re.sub(r'\s+', ' ', value)
+    
+    # Trim, limit length and never produce "." / ".." or hidden entries
+    return value.strip()[:MAX_COMPONENT_LENGTH].strip().lstrip('.')
+
+
+def template_fields(artist: str, title: str, album: Optional[str]) -> Dict[str, str]:
+    """
+    Build the fields available to path templates.
+    
+    Args:
+        artist: Artist name
+        title: Track title
+        album: Album name
+    
+    Returns:
+        Dictionary with artist, title, album, initial and hash fields
+    """
+    artist = sanitize_component(artist) or "Unknown Artist"
+    title = sanitize_component(title) or "Unknown"
+    initial = next((c.upper() for c in artist if c.isalnum()), "_")
+    return {
+        "artist": artist,
+        "title": title,
+        "album": sanitize_component(album) or "Unknown Album",
+        "initial": initial if initial.isascii() else "_",
+        "hash": hashlib.sha1(f"{artist}|{title}".lower().encode()).hexdigest(),
+    }
+
+
+def _tag_identity(file_path: Path) -> Optional[str]:
+    """Get the artist/title identity stored in an MP3's tags."""
+    try:
+        tags = ID3(file_path)
+    except Exception:
+        return None
+    if "TPE1" not in tags or "TIT2" not in tags:
+        return None
+    return f"{tags['TPE1'].text[0]}|{tags['TIT2'].text[0]}".lower()
+
+
+def replace_with_link(existing: Path, target: Path) -> bool:
+    """
+    Make target a hard link to existing, so both names share one copy.
+    
+    Args:
+        existing: File to keep
+        target: File to replace (created if missing)
+    
+    Returns:
+        True if linked, False if the filesystem can't link these paths
+    """
+    temporary = target.with_name(target.name + ".link")
+    try:
+        if os.path.exists(target) and os.path.samefile(existing, target):
+            return True
+        os.link(existing, temporary)
+        os.replace(temporary, target)
+        return True
+    except OSError as e:
+        print(f"Error linking {target} to {existing}: {e}")
+        if os.path.lexists(temporary):
+            os.unlink(temporary)
+        return False
+
+
+class PathLayout:
+    """
+    Maps tracks to paths below the download directory.
+    
+    The template is a str.format pattern over the fields of
+    template_fields(); '/' separates directories. Examples:
+        
+        "{artist} - {title}"                       flat (default)
+        "{artist}/{album}/{artist} - {title}"      artist/album folders
+        "{initial}/{artist}/{artist} - {title}"    A-Z buckets
+        "{hash:.2}/{hash:.4}/{artist} - {title}"   hash-prefix shards
+    """
+    
+    def __init__(self, root: Path, template: Optional[str] = None, extension: str = ".mp3"):
+        """
+        Initialize layout.
+        
+        Args:
+            root: Download directory
+            template: Path template (defaults to settings.path_template)
+            extension: File extension of the audio files
+        """
+        self.root = Path(root)
+        self.template = template or settings.path_template
+        self.extension = extension
+    
+    def relative_path(self, artist: str, title: str, album: Optional[str] = None) -> Path:
+        """
+        Get the templated path of a track, relative to the root.
+        
+        Args:
+            artist: Artist name
+            title: Track title
+            album: Album name
+        
+        Returns:
+            Relative path including the extension
+        """
+        rendered = self.template.format(**template_fields(artist, title, album))
+        parts = [sanitize_component(part) for part in rendered.split("/")]
+        parts = [part for part in parts if part] or ["Unknown"]
+        parts[-1] += self.extension
+        return Path(*parts)
+    
+    def path_for(self, metadata: TrackMetadata, identity: Optional[str] = None) -> Path:
+        """
+        Get the path to write a track to, without overwriting a different track.
+        
+        Args:
+            metadata: Track metadata
+            identity: Stable ID of the track used to derive a collision
+                suffix (defaults to the Spotify/YouTube ID or artist+title)
+        
+        Returns:
+            Absolute path of the file
+        """
+        path = self.root / self.relative_path(metadata.artist, metadata.title, metadata.album)
+        return self.resolve_collision(
+            path,
+            identity or metadata.spotify_id or f"{metadata.artist}|{metadata.title}",
+            f"{metadata.artist}|{metadata.title}".lower()
+        )
+    
+    def resolve_collision(self, path: Path, identity: str, tag_identity: Optional[str] = None) -> Path:
+        """
+        Pick a deterministic alternative when a path holds another track.
+        
+        An existing file whose tags name the same artist and title is the
+        same track, so its path is reused. Otherwise the track goes to
+        "<name> [<hash of identity>]<ext>", which is the same every time
+        the same track collides.
+        
+        Args:
+            path: Preferred path
+            identity: Stable ID of the track
+            tag_identity: Lowercase "artist|title" of the track, if known
+        
+        Returns:
+            Path that is free or already holds this track
+        """
+        if not path.exists() or (tag_identity and _tag_identity(path) == tag_identity):
+            return path
+        return self.collision_path(path, identity)
+    
+    @staticmethod
+    def collision_path(path: Path, identity: str) -> Path:
+        """Get the suffixed path used when a different track holds path."""
+        digest = hashlib.sha1(identity.encode()).hexdigest()[:COLLISION_HASH_LENGTH]
+        return path.with_name(f"{path.stem} [{digest}]{path.suffix}")
@@ -0,0 +1,176 @@
+"""
+Parallel fragment/range downloading with a per-worker connection budget.
+"""
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import httpx
+
+from app.config import settings
+from app.utils.http import get_client
+
+
+class ConnectionBudget:
+    """
+    Connections shared by all downloads running in one worker process.
+    
+    Each download leases as many connections as it would like, but gets
+    only what is left of the budget (always at least one), so a single
+    long download can't starve the other tasks of the worker.
+    """
+    
+    def __init__(self, limit: int):
+        """
+        Initialize budget.
+        
+        Args:
+            limit: Maximum concurrent connections across all downloads
+        """
+        self.limit = max(1, limit)
+        self._in_use = 0
+        self._condition = threading.Condition()
+    
+    @contextmanager
+    def lease(self, wanted: int) -> Iterator[int]:
+        """
+        Lease connections for one download.
+        
+        Blocks until at least one connection is free.
+        
+        Args:
+            wanted: Connections the download would like to use
+        
+        Yields:
+            Number of connections granted
+        """
+        with self._condition:
+            while self._in_use >= self.limit:
+                self._condition.wait()
+            granted = max(1, min(wanted, self.limit - self._in_use))
+            self._in_use += granted
+        try:
+            yield granted
+        finally:
+            with self._condition:
+                self._in_use -= granted
+                self._condition.notify_all()
+    
+    @property
+    def in_use(self) -> int:
+        """Connections currently leased."""
+        return self._in_use
+
+
+connection_budget = ConnectionBudget(settings.worker_connection_limit)
+
+
+def ytdlp_parallel_opts(connections: int) -> Dict:
+    """
+    Build yt-dlp options that spread one download over several connections.
+    
+    Args:
+        connections: Connections granted to the download
+    
+    Returns:
+        Dictionary of yt-dlp options
+    """
+    opts = {'concurrent_fragment_downloads': connections}
+    
+    if settings.external_downloader and connections > 1:
+        downloader = settings.external_downloader
+        opts['external_downloader'] = {'http': downloader}
+        if downloader == 'aria2c':
+            opts['external_downloader_args'] = {'aria2c': [
+                '-x', str(connections),
+                '-s', str(connections),
+                '-k', str(settings.range_chunk_size),
+            ]}
+    
+    return opts
+
+
+def probe_content_length(url: str, headers: Optional[Dict[str, str]] = None) -> Optional[int]:
+    """
+    Find the size of a resource that supports HTTP range requests.
+    
+    Args:
+        url: Resource URL
+        headers: Request headers
+    
+    Returns:
+        Size in bytes, or None if ranges are not supported
+    """
+    try:
+        # Only the headers are read; closing returns the connection to the pool
+        with get_client(http2=False).stream(
+            'GET', url, headers={**(headers or {}), 'Range': 'bytes=0-0'}, timeout=10
+        ) as response:
+            pass
+    except httpx.HTTPError:
+        return None
+    
+    match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+    if response.status_code == 206 and match:
+        return int(match.group(1))
+    return None
+
+
+def iter_ranges(
+    url: str,
+    size: int,
+    headers: Optional[Dict[str, str]] = None,
+    connections: int = 4,
+    chunk_size: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Download a resource as parallel HTTP range requests, yielding in order.
+    
+    At most `connections` ranges are in flight; each yielded chunk is the
+    next range of the file, so the output can be piped straight into an
+    encoder.
+    
+    Args:
+        url: Resource URL
+        size: Resource size in bytes
+        headers: Request headers
+        connections: Parallel range requests
+        chunk_size: Bytes per range request
+    
+    Yields:
+        Consecutive chunks of the resource
+    """
+    chunk_size = chunk_size or settings.range_chunk_size
+    ranges = deque((start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size))
+    # HTTP/1.1, so each range in flight gets its own (pooled) connection
+    client = get_client(http2=False)
+    
+    def fetch(byte_range) -> bytes:
+        start, end = byte_range
+        response = client.get(
+            url, headers={**(headers or {}), 'Range': f'bytes={start}-{end}'}, timeout=30
+        )
+        response.raise_for_status()
+        if response.status_code != 206 or len(response.content) != end - start + 1:
+            raise IOError(f"Range request {start}-{end} returned an unexpected response")
+        return response.content
+    
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        pending = deque()
+        
+        def fill():
+            while ranges and len(pending) < connections:
+                pending.append(executor.submit(fetch, ranges.popleft()))
+        
+        try:
+            fill()
+            while pending:
+                chunk = pending.popleft().result()
+                fill()
+                yield chunk
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,187 @@
+"""
+Sampled cProfile capture for worker tasks.
+"""
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import random
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+# Message header that forces profiling of a single task
+PROFILE_HEADER = "profile"
+
+
+class TaskProfiler:
+    """Profile a sample of tasks and store compressed stats on disk."""
+    
+    def __init__(
+        self,
+        profiles_dir: Optional[Path] = None,
+        sample_rate: Optional[int] = None,
+        keep: Optional[int] = None
+    ):
+        """
+        Initialize profiler.
+        
+        Args:
+            profiles_dir: Directory for stored profiles
+            sample_rate: Profile 1 in N tasks (0 disables sampling)
+            keep: Number of most recent profiles to keep
+        """
+        self.profiles_dir = Path(
+            profiles_dir or settings.profiles_dir or settings.download_dir / ".profiles"
+        )
+        self.sample_rate = settings.profile_sample_rate if sample_rate is None else sample_rate
+        self.keep = settings.profiles_keep if keep is None else keep
+        self._active: Dict[str, tuple] = {}
+    
+    def should_profile(self, headers: Optional[dict] = None) -> bool:
+        """
+        Decide whether the current task should be profiled.
+        
+        Args:
+            headers: Custom message headers of the task
+        
+        Returns:
+            True if the task was flagged or falls in the sample
+        """
+        if headers and headers.get(PROFILE_HEADER):
+            return True
+        if self.sample_rate <= 0:
+            return False
+        return random.randrange(self.sample_rate) == 0
+    
+    def start(self, task_id: str) -> None:
+        """Start profiling a task."""
+        profiler = cProfile.Profile()
+        self._active[task_id] = (profiler, time.time(), time.perf_counter())
+        profiler.enable()
+    
+    def stop(self, task_id: str, task_name: str = "", state: str = "") -> Optional[Path]:
+        """
+        Stop profiling a task and store its stats.
+        
+        Args:
+            task_id: ID of the profiled task
+            task_name: Registered task name
+            state: Final task state
+        
+        Returns:
+            Path to the stored profile, or None if the task was not profiled
+        """
+        entry = self._active.pop(task_id, None)
+        if entry is None:
+            return None
+        
+        profiler, started_at, started = entry
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        
+        try:
+            self.profiles_dir.mkdir(parents=True, exist_ok=True)
+            profiler.create_stats()
+            data = zlib.compress(marshal.dumps(profiler.stats), 6)
+            
+            profile_file = self.profiles_dir / f"{task_id}.prof.z"
+            profile_file.write_bytes(data)
+            (self.profiles_dir / f"{task_id}.json").write_text(json.dumps({
+                "task_id": task_id,
+                "task": task_name,
+                "state": state,
+                "started_at": started_at,
+                "duration_s": round(elapsed, 4),
+                "size_bytes": len(data),
+            }))
+            
+            self._prune()
+            return profile_file
+        except Exception as e:
+            print(f"Error storing profile: {e}")
+            return None
+    
+    def list_profiles(self, limit: int = 50) -> List[Dict]:
+        """
+        List the most recent stored profiles.
+        
+        Args:
+            limit: Maximum number of profiles to return
+        
+        Returns:
+            List of profile info dictionaries, newest first
+        """
+        if not self.profiles_dir.exists():
+            return []
+        
+        profiles = []
+        for info_file in self.profiles_dir.glob("*.json"):
+            try:
+                profiles.append(json.loads(info_file.read_text()))
+            except (OSError, ValueError):
+                continue
+        
+        profiles.sort(key=lambda p: p.get("started_at", 0), reverse=True)
+        return profiles[:limit]
+    
+    def load_raw(self, task_id: str) -> Optional[bytes]:
+        """
+        Load a stored profile in pstats dump format.
+        
+        Args:
+            task_id: ID of the profiled task
+        
+        Returns:
+            Decompressed profile data, or None if not found
+        """
+        profile_file = self.profiles_dir / f"{Path(task_id).name}.prof.z"
+        if not profile_file.exists():
+            return None
+        return zlib.decompress(profile_file.read_bytes())
+    
+    def render(self, task_id: str, sort: str = "cumulative", limit: int = 40) -> Optional[str]:
+        """
+        Render a stored profile as a pstats text report.
+        
+        Args:
+            task_id: ID of the profiled task
+            sort: pstats sort key
+            limit: Number of functions to include
+        
+        Returns:
+            Text report, or None if not found
+        """
+        raw = self.load_raw(task_id)
+        if raw is None:
+            return None
+        
+        stream = io.StringIO()
+        stats = pstats.Stats(_StatsSource(marshal.loads(raw)), stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+    
+    def _prune(self) -> None:
+        """Delete profiles beyond the configured limit."""
+        if self.keep <= 0:
+            return
+        for info in self.list_profiles(limit=10**9)[self.keep:]:
+            for suffix in (".prof.z", ".json"):
+                (self.profiles_dir / f"{info['task_id']}{suffix}").unlink(missing_ok=True)
+
+
+class _StatsSource:
+    """Adapter so pstats.Stats can load an in-memory stats dict."""
+    
+    def __init__(self, stats: dict):
+        self.stats = stats
+    
+    def create_stats(self) -> None:
+        pass
+
+
+profiler = TaskProfiler()
@@ -0,0 +1,350 @@
+"""
+Error classification, retry backoff and circuit breakers for external dependencies.
+"""
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+import httpx
+from yt_dlp.utils import DownloadCancelled
+
+from app.config import settings
+
+# Dependencies guarded by a breaker
+SERVICES = ("spotify", "youtube", "storage")
+
+# yt-dlp (and the storage client) report failures as messages; checked in this order
+_THROTTLED = re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit|not a bot|SlowDown", re.IGNORECASE)
+_PERMANENT = re.compile(
+    r"Video unavailable|This video is (?:unavailable|private)|Private video|has been removed|"
+    r"not available in your country|copyright|members.only|Join this channel|confirm your age|"
+    r"HTTP Error (?:400|403|404|410)|Unsupported URL|not a valid URL|Incomplete YouTube ID",
+    re.IGNORECASE
+)
+_TRANSIENT = re.compile(
+    r"timed? ?out|Connection (?:reset|refused|aborted)|Remote end closed|IncompleteRead|"
+    r"name resolution|Name or service not known|HTTP Error 5\d\d|Unable to download|SSL|"
+    r"Temporary failure|ServiceUnavailable|RequestTimeout|Could not connect to the endpoint",
+    re.IGNORECASE
+)
+
+
+class DependencyError(Exception):
+    """A call to an external dependency failed."""
+    
+    def __init__(self, service: str, message: str):
+        super().__init__(f"{service}: {message}")
+        self.service = service
+
+
+class TransientError(DependencyError):
+    """A failure that is likely to go away; worth retrying later."""
+
+
+class ThrottledError(TransientError):
+    """The dependency is rate limiting us."""
+    
+    def __init__(self, service: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(service, message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ThrottledError):
+    """The dependency's breaker is open, so the call was not made."""
+
+
+class PermanentError(DependencyError):
+    """A failure retrying won't fix, such as a removed video."""
+
+
+def classify(service: str, error: BaseException) -> Optional[DependencyError]:
+    """
+    Classify an exception raised while calling a dependency.
+    
+    Args:
+        service: Name of the dependency
+        error: Raised exception
+    
+    Returns:
+        TransientError, ThrottledError or PermanentError, or None if the
+        exception says nothing about the dependency's health (such as a
+        cancelled download or a bug on our side)
+    """
+    if isinstance(error, DependencyError):
+        return error
+    if isinstance(error, DownloadCancelled):
+        return None
+    
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 429:
+            retry_after = error.response.headers.get("Retry-After", "")
+            return ThrottledError(
+                service, f"HTTP {status}", float(retry_after) if retry_after.isdigit() else None
+            )
+        if status >= 500:
+            return TransientError(service, f"HTTP {status}")
+        return PermanentError(service, f"HTTP {status}")
+    if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return TransientError(service, str(error) or type(error).__name__)
+    
+    message = str(error)
+    if _THROTTLED.search(message):
+        return ThrottledError(service, message)
+    if _PERMANENT.search(message):
+        return PermanentError(service, message)
+    if _TRANSIENT.search(message):
+        return TransientError(service, message)
+    return None
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """
+    Get the jittered, exponentially growing delay before retrying a task.
+    
+    Args:
+        attempt: Retries made so far (0 for the first retry)
+        error: Error that caused the retry; a throttled dependency's
+            Retry-After (or an open breaker's remaining time) is waited
+            out at least
+    
+    Returns:
+        Seconds to wait
+    """
+    ceiling = min(settings.task_retry_backoff * 2 ** attempt, settings.task_retry_backoff_max)
+    delay = random.uniform(ceiling / 2, ceiling)
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        # Spread the retries of everyone that hit the same wall
+        delay = max(delay, retry_after + random.uniform(0, settings.task_retry_backoff))
+    return delay
+
+
+class LocalBreakerStore:
+    """Breaker state of this process only."""
+    
+    def __init__(self):
+        """Initialize store."""
+        self._state: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, name: str) -> Tuple[int, Optional[float]]:
+        """Get the consecutive failures and the time the breaker opened."""
+        with self._lock:
+            state = self._state.get(name, {})
+            return int(state.get("failures", 0)), state.get("opened_at")
+    
+    def add_failure(self, name: str) -> int:
+        """Count a failure and get the consecutive failures."""
+        with self._lock:
+            state = self._state.setdefault(name, {})
+            state["failures"] = state.get("failures", 0) + 1
+            return int(state["failures"])
+    
+    def open(self, name: str, now: float) -> None:
+        """Open the breaker."""
+        with self._lock:
+            state = self._state.setdefault(name, {})
+            state["opened_at"] = now
+            state.pop("probe_until", None)
+    
+    def claim_probe(self, name: str, now: float, ttl: float) -> bool:
+        """Let exactly one caller through a half-open breaker."""
+        with self._lock:
+            state = self._state.setdefault(name, {})
+            if state.get("probe_until", 0) > now:
+                return False
+            state["probe_until"] = now + ttl
+            return True
+    
+    def reset(self, name: str) -> None:
+        """Close the breaker."""
+        with self._lock:
+            self._state.pop(name, None)
+
+
+class RedisBreakerStore:
+    """
+    Breaker state shared by every process through Redis (same methods as LocalBreakerStore).
+    
+    All workers then fail fast as soon as any of them has seen the
+    dependency go down. If Redis itself is unreachable, breakers stay
+    closed rather than failing calls.
+    """
+    
+    def __init__(self, client, prefix: str = "breaker:"):
+        """
+        Initialize store.
+        
+        Args:
+            client: redis.Redis client
+            prefix: Key prefix of the breaker hashes
+        """
+        self.client = client
+        self.prefix = prefix
+    
+    def get(self, name: str) -> Tuple[int, Optional[float]]:
+        try:
+            failures, opened_at = self.client.hmget(self.prefix + name, "failures", "opened_at")
+        except Exception:
+            return 0, None
+        return int(failures or 0), float(opened_at) if opened_at else None
+    
+    def add_failure(self, name: str) -> int:
+        try:
+            return self.client.hincrby(self.prefix + name, "failures", 1)
+        except Exception:
+            return 0
+    
+    def open(self, name: str, now: float) -> None:
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.hset(self.prefix + name, "opened_at", now)
+                pipe.delete(self.prefix + name + ":probe")
+                pipe.execute()
+        except Exception:
+            pass
+    
+    def claim_probe(self, name: str, now: float, ttl: float) -> bool:
+        try:
+            return bool(self.client.set(self.prefix + name + ":probe", now, nx=True, px=int(ttl * 1000)))
+        except Exception:
+            return True
+    
+    def reset(self, name: str) -> None:
+        try:
+            self.client.delete(self.prefix + name, self.prefix + name + ":probe")
+        except Exception:
+            pass
+
+
+_store = LocalBreakerStore()
+
+
+def use_breaker_store(store) -> None:
+    """Keep breaker state in another store (e.g. RedisBreakerStore for all workers)."""
+    global _store
+    _store = store
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a dependency fast while it is down.
+    
+    After failure_threshold consecutive transient failures the breaker
+    opens and calls raise CircuitOpenError without being made. Once
+    reset_timeout has passed it is half-open: one call goes through as a
+    probe, and closes the breaker on success or opens it again on failure.
+    Permanent errors (a removed video) don't count; they say nothing about
+    the dependency's health.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        store=None,
+        clock=time.time
+    ):
+        """
+        Initialize breaker.
+        
+        Args:
+            name: Dependency name
+            failure_threshold: Defaults to settings.breaker_failure_threshold
+            reset_timeout: Defaults to settings.breaker_reset_timeout
+            store: State store (defaults to the process-wide one, see use_breaker_store())
+            clock: Wall clock, shared by all processes of a Redis store
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.breaker_failure_threshold
+        self.reset_timeout = reset_timeout or settings.breaker_reset_timeout
+        self._store = store
+        self.clock = clock
+    
+    @property
+    def store(self):
+        return self._store or _store
+    
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Run a call to the dependency through the breaker.
+        
+        Exceptions from the block are re-raised as the DependencyError
+        classify() makes of them, or unchanged if it can't tell.
+        
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        failures, opened_at = self._before_call()
+        try:
+            yield
+        except Exception as e:
+            error = classify(self.name, e)
+            if error is None:
+                raise
+            if isinstance(error, TransientError):
+                self._record_failure()
+            if error is e:
+                raise
+            raise error from e
+        if failures or opened_at is not None:
+            self.store.reset(self.name)
+    
+    def snapshot(self) -> Dict:
+        """
+        Get the breaker's state.
+        
+        Returns:
+            Dictionary with 'state' (closed, open or half_open),
+            'failures' and, while open, 'retry_in' seconds
+        """
+        failures, opened_at = self.store.get(self.name)
+        snapshot = {"state": "closed", "failures": failures}
+        if opened_at is not None:
+            remaining = opened_at + self.reset_timeout - self.clock()
+            snapshot["state"] = "open" if remaining > 0 else "half_open"
+            if remaining > 0:
+                snapshot["retry_in"] = round(remaining, 1)
+        return snapshot
+    
+    def _before_call(self) -> Tuple[int, Optional[float]]:
+        failures, opened_at = self.store.get(self.name)
+        if opened_at is None:
+            return failures, opened_at
+        now = self.clock()
+        remaining = opened_at + self.reset_timeout - now
+        if remaining > 0:
+            raise CircuitOpenError(self.name, f"circuit open, retry in {remaining:.0f}s", remaining)
+        if not self.store.claim_probe(self.name, now, self.reset_timeout):
+            raise CircuitOpenError(self.name, "circuit half-open, probe in progress", self.reset_timeout)
+        return failures, opened_at
+    
+    def _record_failure(self) -> None:
+        failures = self.store.add_failure(self.name)
+        _, opened_at = self.store.get(self.name)
+        # A failed probe opens the breaker again straight away
+        if failures >= self.failure_threshold or opened_at is not None:
+            self.store.open(self.name, self.clock())
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Get the process-wide breaker of a dependency, creating it on first use."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states() -> Dict[str, Dict]:
+    """Get the state of every dependency's breaker."""
+    return {name: get_breaker(name).snapshot() for name in SERVICES}
@@ -0,0 +1,344 @@
+"""
+Artifact storage for finished files, so the API can serve tracks from any worker.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import mutagen
+from mutagen.easyid3 import EasyID3
+
+from app.config import settings
+from app.services.library import audio_hash
+from app.utils.resilience import get_breaker
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # Optional; only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+HASH_CHUNK_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Keys are made by content_key(); anything else is refused
+_KEY = re.compile(r"[\w.-]+(?:/[\w.-]+)*")
+
+
+def content_key(path: Path, prefix: str = "") -> str:
+    """
+    Get the content-addressed key of a file.
+    
+    The key hashes the audio only, not the ID3 tags, so the same encode
+    gets the same key on every node however it is tagged. A track that two
+    workers downloaded, a fingerprint duplicate hard-linked to an existing
+    copy, or a copy with updated tags is stored once.
+    
+    Args:
+        path: File to store
+        prefix: Key prefix
+    
+    Returns:
+        Key like '<prefix>audio/ab/ab12...ef.mp3'
+    """
+    hex_digest = audio_hash(path)
+    return f"{prefix}audio/{hex_digest[:2]}/{hex_digest}{Path(path).suffix.lower()}"
+
+
+def object_metadata(path: Path) -> Dict[str, str]:
+    """
+    Get the tags of a file to store as its object's metadata.
+    
+    Values are percent-encoded, since S3 metadata must be ASCII.
+    
+    Args:
+        path: Tagged MP3 or Opus file
+    
+    Returns:
+        Dictionary of 'title', 'artist' and 'album' (those that are set)
+    """
+    try:
+        # ID3 tags are read without parsing the audio, like audio_hash()
+        tags = EasyID3(path) if Path(path).suffix.lower() == ".mp3" else mutagen.File(path, easy=True)
+    except Exception:
+        return {}
+    if not tags:
+        return {}
+    return {name: quote(tags[name][0]) for name in ("title", "artist", "album") if tags.get(name)}
+
+
+def _check_key(key: str) -> str:
+    if not _KEY.fullmatch(key) or ".." in key.split("/"):
+        raise ValueError(f"Invalid storage key: {key}")
+    return key
+
+
+class LocalStorage:
+    """
+    Objects in a directory, e.g. a shared mount or the API host's disk.
+    
+    Objects are written to a temporary file and renamed into place, so
+    readers never see a partial object.
+    """
+    
+    def __init__(self, root: Path):
+        """
+        Initialize storage.
+        
+        Args:
+            root: Directory holding the objects
+        """
+        self.root = Path(root)
+    
+    def local_path(self, key: str) -> Path:
+        """Get the path of an object."""
+        return self.root / _check_key(key)
+    
+    def exists(self, key: str) -> bool:
+        return self.local_path(key).is_file()
+    
+    def put(self, path: Path, key: str, metadata: Optional[Dict[str, str]] = None) -> None:
+        target = self.local_path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # The metadata goes first, so an object never exists without it
+        self._write(self._metadata_path(target), json.dumps(metadata or {}).encode())
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as dest, open(path, "rb") as src:
+                shutil.copyfileobj(src, dest, HASH_CHUNK_SIZE)
+            os.replace(tmp, target)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+    
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+    
+    def metadata(self, key: str) -> Dict[str, str]:
+        """Get the metadata an object was stored with, decoded."""
+        try:
+            metadata = json.loads(self._metadata_path(self.local_path(key)).read_bytes())
+        except FileNotFoundError:
+            return {}
+        return {name: unquote(value) for name, value in metadata.items()}
+    
+    @staticmethod
+    def _metadata_path(target: Path) -> Path:
+        return target.with_name(target.name + ".json")
+    
+    @staticmethod
+    def _write(target: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as dest:
+                dest.write(data)
+            os.replace(tmp, target)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+class S3Storage:
+    """
+    Objects in an S3-compatible bucket (AWS S3, MinIO, ...).
+    
+    Files are streamed from disk in multipart uploads, several parts at a
+    time. Downloads are redirected to presigned URLs, or proxied with
+    their Range and If-None-Match headers passed through.
+    """
+    
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        part_size: int = 8 * 1024 * 1024
+    ):
+        """
+        Initialize storage.
+        
+        Args:
+            bucket: Bucket name
+            endpoint_url: Endpoint of an S3-compatible service (None for AWS)
+            region: Bucket region
+            access_key: Access key ID (None for the default credential chain)
+            secret_key: Secret access key
+            part_size: Multipart upload part size in bytes
+        
+        Raises:
+            RuntimeError: If boto3 is not installed
+        """
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs the boto3 package")
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=settings.fragment_concurrency
+        )
+    
+    def local_path(self, key: str) -> None:
+        """Objects have no local path."""
+        return None
+    
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=_check_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+    
+    def put(self, path: Path, key: str, metadata: Optional[Dict[str, str]] = None) -> None:
+        self.client.upload_file(
+            str(path), self.bucket, _check_key(key),
+            ExtraArgs={
+                "ContentType": "audio/mpeg" if key.endswith(".mp3") else "application/octet-stream",
+                "Metadata": metadata or {}
+            },
+            Config=self.transfer_config
+        )
+    
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=_check_key(key))["Body"]
+    
+    def metadata(self, key: str) -> Dict[str, str]:
+        """Get the metadata an object was stored with, decoded."""
+        response = self.client.head_object(Bucket=self.bucket, Key=_check_key(key))
+        return {name: unquote(value) for name, value in response.get("Metadata", {}).items()}
+    
+    def presigned_url(self, key: str, filename: str, expires: int) -> str:
+        """
+        Get a time-limited download URL of an object.
+        
+        Args:
+            key: Object key
+            filename: Download name sent by the storage service
+            expires: Seconds the URL stays valid
+        
+        Returns:
+            URL
+        """
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": _check_key(key),
+                "ResponseContentDisposition": f"attachment; filename*=utf-8''{quote(filename)}"
+            },
+            ExpiresIn=expires
+        )
+    
+    def get(self, key: str, request_headers) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """
+        Read an object for proxying, honouring Range and If-None-Match.
+        
+        Args:
+            key: Object key
+            request_headers: Headers of the request being answered
+        
+        Returns:
+            Tuple of (status code, response headers, body chunks)
+        """
+        params = {"Bucket": self.bucket, "Key": _check_key(key)}
+        if request_headers.get("range"):
+            params["Range"] = request_headers["range"]
+        if request_headers.get("if-none-match"):
+            params["IfNoneMatch"] = request_headers["if-none-match"]
+        
+        try:
+            response = self.client.get_object(**params)
+        except ClientError as e:
+            status = int(e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0))
+            if status in (304, 416):
+                return status, {}, iter(())
+            raise
+        
+        headers = {"accept-ranges": "bytes", "content-length": str(response["ContentLength"])}
+        if response.get("ETag"):
+            headers["etag"] = response["ETag"]
+        if response.get("ContentRange"):
+            headers["content-range"] = response["ContentRange"]
+        status = 206 if response.get("ContentRange") else 200
+        return status, headers, response["Body"].iter_chunks(STREAM_CHUNK_SIZE)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    Get this process's artifact storage, per the STORAGE_BACKEND setting.
+    
+    Returns:
+        LocalStorage, S3Storage, or None when files stay in download_dir
+    
+    Raises:
+        ValueError: If STORAGE_BACKEND names an unknown backend
+    """
+    global _storage
+    if not settings.storage_backend:
+        return None
+    with _storage_lock:
+        if _storage is None:
+            if settings.storage_backend == "local":
+                _storage = LocalStorage(settings.storage_dir or settings.download_dir / ".objects")
+            elif settings.storage_backend == "s3":
+                _storage = S3Storage(
+                    settings.s3_bucket,
+                    endpoint_url=settings.s3_endpoint_url,
+                    region=settings.s3_region,
+                    access_key=settings.s3_access_key,
+                    secret_key=settings.s3_secret_key,
+                    part_size=settings.storage_part_size_mb * 1024 * 1024
+                )
+            else:
+                raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+        return _storage
+
+
+def store_file(path: Path) -> Optional[str]:
+    """
+    Store a finished file unless one with the same audio is stored already.
+    
+    The file's tags are kept as the object's metadata. A copy that only
+    differs in its tags maps to the stored object, which keeps the tags
+    it was first stored with.
+    
+    Args:
+        path: File to store
+    
+    Returns:
+        The object's key, or None when no storage backend is configured
+    
+    Raises:
+        TransientError: If the store is unreachable or throttling
+    """
+    storage = get_storage()
+    if storage is None:
+        return None
+    
+    key = content_key(path, settings.storage_prefix)
+    # An unreachable store fails (and retries) the task like any other dependency
+    with get_breaker("storage").guard():
+        if not storage.exists(key):
+            storage.put(path, key, object_metadata(path))
+    return key
@@ -0,0 +1,191 @@
+"""
+Node-local process pool for ffmpeg transcodes.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.utils.ffmpeg import OutputFormat, transcode
+
+
+class TranscodeQueueFull(Exception):
+    """Raised when the transcode queue stays full past the submit timeout."""
+
+
+def pool_size() -> Tuple[int, int]:
+    """
+    Get the size of the node's transcode pool, as get_transcode_executor() creates it.
+    
+    Returns:
+        Tuple of (encoder processes, jobs allowed to wait beyond them)
+    """
+    workers = settings.transcode_workers or os.cpu_count() or 1
+    queue = workers * 2 if settings.transcode_queue_size is None else settings.transcode_queue_size
+    return workers, queue
+
+
+def fetch_threads() -> int:
+    """
+    Get the number of worker threads that share the transcode pool.
+    
+    A thread waits for its track's encode, so up to every running and
+    queued encode holds one; another transcode_workers threads keep
+    fetching while the pool is saturated.
+    
+    Returns:
+        settings.fetch_threads, or the default derived from pool_size()
+    """
+    workers, queue = pool_size()
+    return settings.fetch_threads or 2 * workers + queue
+
+
+class TranscodeExecutor:
+    """Bounded process pool that runs ffmpeg encodes off the fetch path."""
+    
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        """
+        Initialize executor.
+        
+        Args:
+            max_workers: Number of encoder processes (defaults to CPU cores)
+            max_queue: Jobs allowed to wait beyond the running ones
+        """
+        self.max_workers = max_workers or settings.transcode_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        
+        # Spawned children don't inherit the worker's threads or sockets
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+    
+    def submit(
+        self,
+        source: Path,
+        output_file: Path,
+        bitrate: Optional[int] = None,
+        timeout: Optional[float] = None,
+        cancel_check: Optional[Callable[[], None]] = None,
+        extra_outputs: Sequence[Tuple[OutputFormat, Path]] = ()
+    ) -> Future:
+        """
+        Queue a source file for encoding.
+        
+        Blocks while the pool and its queue are full, so fetch stages slow
+        down instead of piling raw files onto the disk.
+        
+        Args:
+            source: Downloaded source file (deleted after a successful encode)
+            output_file: Path to the final MP3 file
+            bitrate: Target bitrate in kbps
+            timeout: Maximum seconds to wait for a free slot
+            cancel_check: Picklable callable the encoder process calls
+                periodically; raising from it kills the encode
+            extra_outputs: (format, path) of further encodes from the same decode
+        
+        Returns:
+            Future resolving to an EncodeResult
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TranscodeQueueFull(
+                f"Transcode queue full ({self.max_workers} running, {self.max_queue} queued)"
+            )
+        
+        with self._lock:
+            self._in_flight += 1
+            self._submitted += 1
+        
+        try:
+            future = self._executor.submit(
+                transcode, source, output_file, bitrate, True,
+                cancel_check=cancel_check, extra_outputs=list(extra_outputs)
+            )
+        except Exception:
+            self._release(failed=True, busy=0.0)
+            raise
+        
+        future.add_done_callback(self._on_done)
+        return future
+    
+    def stats(self) -> Dict:
+        """
+        Report queue depth and utilization.
+        
+        Returns:
+            Dictionary of executor statistics
+        """
+        with self._lock:
+            running = min(self._in_flight, self.max_workers)
+            uptime = time.monotonic() - self._started
+            return {
+                "workers": self.max_workers,
+                "queue_capacity": self.max_queue,
+                "running": running,
+                "queue_depth": self._in_flight - running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "utilization": round(running / self.max_workers, 3),
+                "avg_utilization": round(
+                    self._busy_seconds / (self.max_workers * uptime), 3
+                ) if uptime > 0 else 0.0,
+                "avg_encode_seconds": round(
+                    self._busy_seconds / self._completed, 3
+                ) if self._completed else 0.0,
+            }
+    
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool, optionally waiting for queued encodes."""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+    
+    def _on_done(self, future: Future) -> None:
+        """Release the slot of a finished job and record its outcome."""
+        if future.cancelled() or future.exception() is not None:
+            self._release(failed=True, busy=0.0)
+        else:
+            self._release(failed=False, busy=future.result().seconds)
+    
+    def _release(self, failed: bool, busy: float) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._busy_seconds += busy
+        self._slots.release()
+
+
+_executor: Optional[TranscodeExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_transcode_executor() -> TranscodeExecutor:
+    """Get the process-wide transcode executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = TranscodeExecutor(max_queue=settings.transcode_queue_size)
+        return _executor
+
+
+def shutdown_transcode_executor() -> None:
+    """Drain and stop the process-wide transcode executor if it was started."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,165 @@
+"""
+Per-process pool of long-lived yt-dlp instances.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import yt_dlp
+
+from app.config import settings
+
+# Option profiles instances are created with; everything else is a per-call override
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "metadata": {'quiet': True, 'no_warnings': True},
+    "flat": {'quiet': True, 'no_warnings': True, 'extract_flat': True},
+    "download": {'quiet': True, 'no_warnings': True},
+}
+
+# Extractors loaded ahead of the first task
+PREWARM_EXTRACTORS = ('Youtube', 'YoutubeSearch', 'YoutubeTab')
+
+
+class YoutubeDLPool:
+    """
+    Reusable YoutubeDL instances, kept idle per option profile.
+    
+    Creating a YoutubeDL and initializing its extractors costs far more
+    than the options that differ between calls, and extractors cache
+    state (such as YouTube's player code) that later calls benefit from.
+    An instance is used by one caller at a time; per-call overrides are
+    applied on checkout and undone on return, and an instance that raised
+    is closed rather than reused.
+    """
+    
+    def __init__(self, max_idle: int = 4):
+        """
+        Initialize pool.
+        
+        Args:
+            max_idle: Idle instances kept per profile
+        """
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[yt_dlp.YoutubeDL]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+    
+    @contextmanager
+    def acquire(self, profile: str = "metadata", **overrides) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        Check out an instance of a profile.
+        
+        Args:
+            profile: Key of PROFILES
+            **overrides: yt-dlp options for this call only, e.g. format,
+                outtmpl, progress_hooks or concurrent_fragment_downloads
+        
+        Yields:
+            YoutubeDL instance, exclusively owned until the block exits
+        """
+        ydl = self._checkout(profile)
+        restore = self._apply(ydl, overrides)
+        try:
+            yield ydl
+        except BaseException:
+            ydl.close()
+            raise
+        restore()
+        self._checkin(profile, ydl)
+    
+    def prewarm(self, profiles: Iterable[str] = PROFILES) -> float:
+        """
+        Create an instance of each profile and load the YouTube extractors.
+        
+        Args:
+            profiles: Profiles to warm
+        
+        Returns:
+            Seconds spent
+        """
+        started = time.perf_counter()
+        for profile in profiles:
+            with self.acquire(profile) as ydl:
+                for name in PREWARM_EXTRACTORS:
+                    ydl.get_info_extractor(name)
+        return time.perf_counter() - started
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the number of created and reused instances."""
+        with self._lock:
+            return {
+                "created": self._counts["created"],
+                "reused": self._counts["reused"],
+                "idle": sum(len(idle) for idle in self._idle.values()),
+            }
+    
+    def close(self) -> None:
+        """Close all idle instances."""
+        with self._lock:
+            idle = [ydl for instances in self._idle.values() for ydl in instances]
+            self._idle.clear()
+        for ydl in idle:
+            ydl.close()
+    
+    def _checkout(self, profile: str) -> yt_dlp.YoutubeDL:
+        with self._lock:
+            if self._idle[profile]:
+                self._counts["reused"] += 1
+                return self._idle[profile].pop()
+            self._counts["created"] += 1
+        return yt_dlp.YoutubeDL(dict(PROFILES[profile]))
+    
+    def _checkin(self, profile: str, ydl: yt_dlp.YoutubeDL) -> None:
+        with self._lock:
+            if len(self._idle[profile]) < self.max_idle:
+                self._idle[profile].append(ydl)
+                return
+        ydl.close()
+    
+    @staticmethod
+    def _apply(ydl: yt_dlp.YoutubeDL, overrides: Dict[str, Any]):
+        """Apply per-call options and return a function that undoes them."""
+        params = ydl.params
+        saved = {key: params[key] for key in overrides if key in params}
+        format_selector = ydl.format_selector
+        progress_hooks = list(ydl._progress_hooks)
+        
+        for key, value in overrides.items():
+            if key == 'progress_hooks':
+                for hook in value or []:
+                    ydl.add_progress_hook(hook)
+            elif key == 'outtmpl':
+                # YoutubeDL keeps output templates as a dict by type
+                params['outtmpl'] = {**params['outtmpl'], 'default': value}
+            elif key == 'format':
+                params['format'] = value
+                ydl.format_selector = value if callable(value) else ydl.build_format_selector(value)
+            else:
+                params[key] = value
+        
+        def restore() -> None:
+            for key in overrides:
+                if key in saved:
+                    params[key] = saved[key]
+                else:
+                    params.pop(key, None)
+            ydl.format_selector = format_selector
+            ydl._progress_hooks[:] = progress_hooks
+            ydl._num_downloads = 0
+        
+        return restore
+
+
+_pool: Optional[YoutubeDLPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ytdl_pool() -> YoutubeDLPool:
+    """Get the process-wide YoutubeDL pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = YoutubeDLPool(max_idle=settings.ytdl_pool_size)
+        return _pool
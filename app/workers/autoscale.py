@@ -0,0 +1,258 @@
+"""
+Queue-driven autoscaling of the worker pool.
+"""
+import math
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from celery.worker import state
+from celery.worker.autoscale import Autoscaler
+
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class ScalingPolicy:
+    """How eagerly a kind of work grows and shrinks the pool."""
+    name: str
+    backlog_per_process: float  # Waiting tasks one extra process is expected to absorb
+    max_wait: float  # Seconds a reserved task may wait before the pool must grow
+    min_cpu_idle: float  # Don't grow while less CPU than this is idle (0-1)
+    min_memory_free: float  # Don't grow while less memory than this is available (0-1)
+    max_step_up: int
+    max_step_down: int
+    up_cooldown: float  # Seconds between two resizes when growing
+    down_cooldown: float  # Seconds after the last resize before shrinking
+    cpu_bound: bool  # Never run more processes than CPU cores
+
+
+# Downloads mostly wait on the network, so processes are cheap to add
+NETWORK_POLICY = ScalingPolicy(
+    name="network", backlog_per_process=2, max_wait=10.0, min_cpu_idle=0.10, min_memory_free=0.15,
+    max_step_up=4, max_step_down=1, up_cooldown=10.0, down_cooldown=120.0, cpu_bound=False
+)
+
+# In-task encodes saturate a core each, so grow one at a time up to the core count
+TRANSCODE_POLICY = ScalingPolicy(
+    name="transcode", backlog_per_process=1, max_wait=30.0, min_cpu_idle=0.25, min_memory_free=0.15,
+    max_step_up=1, max_step_down=1, up_cooldown=30.0, down_cooldown=120.0, cpu_bound=True
+)
+
+POLICIES = {policy.name: policy for policy in (NETWORK_POLICY, TRANSCODE_POLICY)}
+
+
+def select_policy(name: Optional[str] = None) -> ScalingPolicy:
+    """
+    Get the scaling policy for this worker.
+    
+    Args:
+        name: Policy name (defaults to settings.autoscale_policy); "auto"
+            is the transcode policy, since autoscaled prefork workers
+            always encode in their tasks (TRANSCODE_POOL workers run
+            threads and don't autoscale)
+    
+    Returns:
+        Scaling policy
+    """
+    name = name or settings.autoscale_policy
+    if name == "auto":
+        return TRANSCODE_POLICY
+    return POLICIES[name]
+
+
+@dataclass
+class ScalingSignals:
+    """What the pool size is decided from."""
+    queue_depth: int  # Tasks waiting in the broker and reserved but not started here
+    busy: int  # Tasks running on this worker
+    max_wait: float = 0.0  # Longest time a reserved task has waited to start
+    cpu_idle: Optional[float] = None  # Idle CPU fraction of the host, if known
+    memory_free: Optional[float] = None  # Available memory fraction of the host, if known
+
+
+def host_headroom() -> Tuple[Optional[float], Optional[float]]:
+    """
+    Measure the idle CPU and available memory of the host.
+    
+    Returns:
+        Tuple of (idle CPU fraction from the 1-minute load average,
+        available memory fraction); None where the platform can't tell
+    """
+    cpu_idle = None
+    try:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        cpu_idle = max(0.0, 1.0 - os.getloadavg()[0] / cores)
+    except OSError:
+        pass
+    
+    memory_free = None
+    try:
+        with open("/proc/meminfo") as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) for line in f if ":" in line}
+        memory_free = meminfo["MemAvailable"] / meminfo["MemTotal"]
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        pass
+    
+    return cpu_idle, memory_free
+
+
+class ScalingController:
+    """
+    Decides the pool size from scaling signals.
+    
+    The pool grows towards busy + backlog / backlog_per_process when tasks
+    are waiting and the host has CPU and memory to spare, by at most
+    max_step_up per resize and no more often than up_cooldown. It shrinks
+    by max_step_down once it has not been resized for down_cooldown, so a
+    short lull between playlist batches doesn't throw processes away.
+    """
+    
+    def __init__(
+        self,
+        policy: ScalingPolicy,
+        clock: Callable[[], float] = time.monotonic,
+        cpu_count: Optional[int] = None
+    ):
+        """
+        Initialize controller.
+        
+        Args:
+            policy: Scaling policy
+            clock: Monotonic clock (replaceable in tests)
+            cpu_count: Cores available to the pool (defaults to os.cpu_count())
+        """
+        self.policy = policy
+        self.clock = clock
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self._created = clock()
+        self._last_resize: Optional[float] = None
+    
+    def desired(self, signals: ScalingSignals, min_processes: int, max_processes: int) -> int:
+        """Get the pool size the signals ask for, ignoring cooldowns and steps."""
+        demand = signals.busy + math.ceil(signals.queue_depth / self.policy.backlog_per_process)
+        if self.policy.cpu_bound:
+            demand = min(demand, self.cpu_count)
+        return max(min_processes, min(max_processes, demand))
+    
+    def decide(self, current: int, signals: ScalingSignals, min_processes: int, max_processes: int) -> int:
+        """
+        Get the pool size to resize to now.
+        
+        Args:
+            current: Current number of processes
+            signals: Current scaling signals
+            min_processes: Lower bound of the pool
+            max_processes: Upper bound of the pool
+        
+        Returns:
+            New pool size (current if nothing should change yet)
+        """
+        policy = self.policy
+        now = self.clock()
+        since_resize = now - self._last_resize if self._last_resize is not None else math.inf
+        # Celery starts the pool at its maximum, so shrinking also waits a cooldown after start
+        since_change = min(since_resize, now - self._created)
+        desired = self.desired(signals, min_processes, max_processes)
+        
+        # Bounds changed at runtime are applied right away
+        if current < min_processes or current > max_processes:
+            return self._resized(now, max(min_processes, min(max_processes, current)))
+        
+        if desired > current:
+            waiting = signals.queue_depth > 0 or signals.max_wait > policy.max_wait
+            has_headroom = (
+                (signals.cpu_idle is None or signals.cpu_idle >= policy.min_cpu_idle)
+                and (signals.memory_free is None or signals.memory_free >= policy.min_memory_free)
+            )
+            if waiting and has_headroom and since_resize >= policy.up_cooldown:
+                return self._resized(now, current + min(policy.max_step_up, desired - current))
+        elif desired < current and since_change >= policy.down_cooldown:
+            return self._resized(now, current - min(policy.max_step_down, current - desired))
+        
+        return current
+    
+    def _resized(self, now: float, size: int) -> int:
+        self._last_resize = now
+        return size
+
+
+class QueueAutoscaler(Autoscaler):
+    """
+    Celery autoscaler driven by broker queue depth, wait time and host load.
+    
+    Celery's own autoscaler only sees the tasks this worker has reserved,
+    which worker_prefetch_multiplier=1 keeps at about the pool size, so it
+    never notices a backlog in the broker. This one counts the broker
+    queues the worker consumes from (checked every
+    settings.autoscale_queue_interval seconds) and leaves the decision to
+    a ScalingController. Every replica counts the shared backlog, so
+    together they may briefly overshoot; the cooldowns and the host
+    headroom checks bound that.
+    
+    Enable it by starting the worker with --autoscale=MAX,MIN.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.controller = ScalingController(select_policy())
+        self._first_seen: Dict[str, float] = {}
+        self._broker_depth = 0
+        self._broker_checked: Optional[float] = None
+        self._last_signals: Optional[ScalingSignals] = None
+    
+    def _maybe_scale(self, req=None):
+        signals = self._last_signals = self.signals()
+        procs = self.processes
+        target = self.controller.decide(procs, signals, self.min_concurrency, self.max_concurrency)
+        if target > procs:
+            self._grow(target - procs)
+            return True
+        if target < procs:
+            self._shrink(procs - target)
+            return True
+    
+    def signals(self) -> ScalingSignals:
+        """Collect the current scaling signals."""
+        now = time.monotonic()
+        active = {request.id for request in state.active_requests}
+        waiting = [request.id for request in state.reserved_requests if request.id not in active]
+        
+        # Reserved requests carry no receive time, so remember when they were first seen
+        self._first_seen = {task_id: self._first_seen.get(task_id, now) for task_id in waiting}
+        max_wait = max((now - seen for seen in self._first_seen.values()), default=0.0)
+        
+        cpu_idle, memory_free = host_headroom()
+        return ScalingSignals(
+            queue_depth=self.broker_depth(now) + len(waiting),
+            busy=len(active),
+            max_wait=max_wait,
+            cpu_idle=cpu_idle,
+            memory_free=memory_free,
+        )
+    
+    def broker_depth(self, now: float) -> int:
+        """Get the messages waiting in the consumed queues, refreshed periodically."""
+        if self._broker_checked is not None and now - self._broker_checked < settings.autoscale_queue_interval:
+            return self._broker_depth
+        self._broker_checked = now
+        
+        try:
+            queues = [queue.name for queue in self.worker.consumer.task_consumer.queues]
+            with self.worker.app.connection_for_read() as connection:
+                channel = connection.default_channel
+                self._broker_depth = sum(
+                    channel.queue_declare(queue=name, passive=True).message_count for name in queues
+                )
+        except Exception as e:
+            # Keep scaling on the last known depth
+            print(f"Error reading broker queue depth: {e}")
+        return self._broker_depth
+    
+    def info(self):
+        info = super().info()
+        info["policy"] = self.controller.policy.name
+        if self._last_signals:
+            info["signals"] = asdict(self._last_signals)
+        return info
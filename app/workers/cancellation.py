@@ -0,0 +1,181 @@
+"""
+Cancellation of queued and running download tasks.
+"""
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Iterable, List, Optional
+
+import redis
+from celery.app.task import Context
+from yt_dlp.utils import DownloadCancelled
+
+from app.config import settings
+from app.workers.results import iter_children
+
+CANCEL_KEY_PREFIX = "cancel:"
+CHECK_INTERVAL = 0.5  # Seconds between flag lookups of one running task
+REVOKE_BATCH_SIZE = 500  # Task IDs per revoke broadcast
+
+
+class TaskCancelled(DownloadCancelled):
+    """Raised inside a task whose cancellation was requested."""
+
+
+_client: Optional[redis.Redis] = None
+_client_lock = threading.Lock()
+
+
+def _redis() -> redis.Redis:
+    """Get this process's Redis client for cancellation flags."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db)
+        return _client
+
+
+def request_cancel(task_ids: Iterable[str]) -> None:
+    """
+    Flag tasks as cancelled.
+    
+    The flags live as long as track results, so a task that was queued
+    behind a long backlog still sees its flag when it finally starts.
+    
+    Args:
+        task_ids: IDs of the tasks to cancel
+    """
+    with _redis().pipeline(transaction=False) as pipe:
+        for task_id in task_ids:
+            pipe.set(CANCEL_KEY_PREFIX + task_id, 1, ex=settings.result_expires_track)
+        pipe.execute()
+
+
+def is_cancelled(task_id: str) -> bool:
+    """Check whether cancellation of a task was requested."""
+    try:
+        return bool(_redis().exists(CANCEL_KEY_PREFIX + task_id))
+    except redis.RedisError:
+        # Without Redis nobody can have asked; keep the task running
+        return False
+
+
+def raise_if_cancelled(task_id: str) -> None:
+    """
+    Raise TaskCancelled if cancellation of a task was requested.
+    
+    A module-level function, so partial(raise_if_cancelled, task_id) can
+    be handed to the transcode pool's encoder processes.
+    
+    Args:
+        task_id: ID of the task
+    """
+    if is_cancelled(task_id):
+        raise TaskCancelled(f"Task {task_id} was cancelled")
+
+
+class CancelToken:
+    """
+    Cooperative cancellation check of one running task.
+    
+    Lookups are throttled to one per interval, so the check can sit in a
+    yt-dlp progress hook that fires for every downloaded block.
+    """
+    
+    def __init__(
+        self,
+        task_id: str,
+        interval: float = CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        lookup: Callable[[str], bool] = is_cancelled
+    ):
+        """
+        Initialize token.
+        
+        Args:
+            task_id: ID of the running task
+            interval: Minimum seconds between flag lookups
+            clock: Monotonic clock (replaceable in tests)
+            lookup: Function telling whether a task ID is flagged
+        """
+        self.task_id = task_id
+        self.interval = interval
+        self.clock = clock
+        self.lookup = lookup
+        self._checked: Optional[float] = None
+        self._cancelled = False
+    
+    @property
+    def cancelled(self) -> bool:
+        """Whether the task was cancelled (looked up at most once per interval)."""
+        now = self.clock()
+        if not self._cancelled and (self._checked is None or now - self._checked >= self.interval):
+            self._checked = now
+            self._cancelled = self.lookup(self.task_id)
+        return self._cancelled
+    
+    def check(self, fresh: bool = False) -> None:
+        """
+        Raise TaskCancelled if the task was cancelled.
+        
+        Args:
+            fresh: Look the flag up now rather than trust a lookup from the
+                last interval (before storing a final result)
+        """
+        if fresh:
+            self._checked = None
+        if self.cancelled:
+            raise TaskCancelled(f"Task {self.task_id} was cancelled")
+    
+    def hook(self, progress: dict) -> None:
+        """yt-dlp progress hook that aborts the download once cancelled."""
+        self.check()
+    
+    def remote_check(self) -> Callable[[], None]:
+        """Get a picklable check for the transcode pool's encoder processes."""
+        return partial(raise_if_cancelled, self.task_id)
+
+
+def cancel_tasks(app, task_ids: List[str]) -> None:
+    """
+    Cancel tasks wherever they are.
+    
+    Queued tasks are revoked, so workers drop them unstarted; running ones
+    see their flag within CHECK_INTERVAL, abort the download or kill
+    ffmpeg, remove their partial files and free the worker slot.
+    
+    Args:
+        app: Celery app
+        task_ids: IDs of the tasks to cancel
+    """
+    for start in range(0, len(task_ids), REVOKE_BATCH_SIZE):
+        batch = task_ids[start:start + REVOKE_BATCH_SIZE]
+        request_cancel(batch)
+        app.control.revoke(batch)
+
+
+def mark_cancelled(backend, task_id: str, task_name: str) -> None:
+    """
+    Store the REVOKED state of a cancelled task.
+    
+    Args:
+        backend: Result backend
+        task_id: ID of the task
+        task_name: Registered task name, which decides the result's expiry
+    """
+    backend.mark_as_revoked(task_id, "Cancelled", request=Context(id=task_id, task=task_name))
+
+
+def child_task_ids(backend, task_id: str, result: Any) -> List[str]:
+    """
+    Get the IDs of the track tasks a playlist task created.
+    
+    Args:
+        backend: Result backend the playlist result came from
+        task_id: ID of the playlist task
+        result: Playlist task result (inline or paged)
+    
+    Returns:
+        Child task IDs
+    """
+    return [child["task_id"] for child in iter_children(backend, task_id, result, "tasks")]
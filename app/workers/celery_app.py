@@ -1,14 +1,22 @@
 """
 Celery application configuration.
 """
+import redis
 from celery import Celery
 from app.config import settings
+from app.utils.resilience import RedisBreakerStore, use_breaker_store
+from app.utils.transcoder import fetch_threads
+from app.workers.results import SERIALIZER
 
 # Create Celery instance
 celery_app = Celery(
     "music_download_worker",
     broker=f"redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}",
-    backend=f"redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}",
+    # Redis backend with compact encoding, per-task expiry and paged playlist children
+    backend=(
+        "app.workers.results:CompactRedisBackend+"
+        f"redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}"
+    ),
     include=["app.workers.tasks"]
 )
 
@@ -16,11 +24,34 @@ celery_app = Celery(
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
-    result_serializer="json",
+    result_serializer=SERIALIZER,
+    result_accept_content=[SERIALIZER, "json"],
+    result_expires=settings.result_expires,
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
     task_time_limit=3600,  # 1 hour max per task
     worker_prefetch_multiplier=1,
-    worker_max_tasks_per_child=50,
+    worker_max_tasks_per_child=settings.worker_max_tasks_per_child or None,
+    worker_autoscaler="app.workers.autoscale:QueueAutoscaler",  # Used with --autoscale
 )
+
+if settings.transcode_pool:
+    # Fetch threads of one process share the node's transcode pool; prefork
+    # children would each start their own (see signals.check_worker_pool)
+    celery_app.conf.worker_pool = "threads"
+    # A thread waits for its track's encode, so the task itself stores the
+    # result (or fails) rather than a callback nobody redelivers. Waiting
+    # threads don't fetch, so the thread count is sized from the pool, not
+    # the cores: one per running and queued encode plus transcode_workers
+    # more that keep downloading. Idle threads are cheap; too few leave the
+    # network idle while every thread waits on the encoders.
+    celery_app.conf.worker_concurrency = fetch_threads()
+
+# Workers and the API share circuit breaker state, so one outage opens the breaker everywhere
+use_breaker_store(RedisBreakerStore(redis.Redis(
+    host=settings.redis_host, port=settings.redis_port, db=settings.redis_db
+)))
+
+# Register signal handlers and remote control commands
+from app.workers import signals, control  # noqa: E402,F401
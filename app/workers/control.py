@@ -0,0 +1,64 @@
+"""
+Custom Celery remote control commands.
+"""
+from typing import Dict
+
+from celery.worker.control import inspect_command
+
+from app.config import settings
+from app.utils.http import metrics as http_metrics, summarize
+from app.utils.transcoder import get_transcode_executor
+
+# Redis hash per node summing the HTTP counters of its worker processes
+HTTP_STATS_KEY_PREFIX = "http-stats:"
+
+
+def flush_http_stats(client, hostname: str) -> None:
+    """
+    Add this process's HTTP counters to its node's totals in Redis.
+    
+    Worker processes make the requests, but remote control commands are
+    answered by the main process, so the counts are summed in Redis.
+    
+    Args:
+        client: redis.Redis client
+        hostname: Worker node name
+    """
+    counts = {name: amount for name, amount in http_metrics.drain().items() if amount}
+    if not counts:
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for name, amount in counts.items():
+                pipe.hincrby(HTTP_STATS_KEY_PREFIX + hostname, name, amount)
+            pipe.execute()
+    except Exception as e:
+        print(f"Error flushing HTTP stats: {e}")
+        # Keep the counts for the next flush
+        for name, amount in counts.items():
+            http_metrics.count(name, amount)
+
+
+def read_http_stats(client, hostname: str) -> Dict:
+    """Get a node's HTTP counters as summed by flush_http_stats()."""
+    counts = client.hgetall(HTTP_STATS_KEY_PREFIX + hostname)
+    return summarize({
+        name.decode() if isinstance(name, bytes) else name: int(amount) for name, amount in counts.items()
+    })
+
+
+@inspect_command()
+def transcode_stats(state):
+    """Report the queue depth and utilization of this node's transcode pool."""
+    if not settings.transcode_pool:
+        return {"enabled": False}
+    return {"enabled": True, **get_transcode_executor().stats()}
+
+
+@inspect_command()
+def http_stats(state):
+    """Report request and connection reuse counters of this node's worker processes."""
+    # Counters of tasks run in this process (thread pools) are flushed first
+    client = state.consumer.app.backend.client
+    flush_http_stats(client, state.consumer.hostname)
+    return read_http_stats(client, state.consumer.hostname)
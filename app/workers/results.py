@@ -0,0 +1,332 @@
+"""
+Compact, expiring task results in the Redis result backend.
+"""
+import json
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from celery import states
+from celery.backends.redis import RedisBackend
+from kombu.serialization import register
+from kombu.utils.encoding import bytes_to_str
+
+from app.config import settings
+
+try:
+    import msgpack
+except ImportError:  # Optional; results fall back to JSON
+    msgpack = None
+
+SERIALIZER = "compact"
+CONTENT_TYPE = "application/x-compact-result"
+
+# First byte of an encoded result
+_MSGPACK = b"M"
+_JSON = b"J"
+_ZLIB = b"Z"  # zlib-compressed, followed by one of the above
+_LEGACY_JSON = b"{"  # Plain JSON meta stored before results were encoded compactly
+
+# Result lists of a playlist kept out of its result, as Redis lists
+CHILD_LISTS = ("tasks", "already_downloaded")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode a result compactly.
+    
+    msgpack is used when installed, JSON otherwise; payloads above
+    settings.result_compress_threshold are zlib-compressed when that
+    makes them smaller.
+    
+    Args:
+        obj: Result meta-data
+    
+    Returns:
+        Encoded bytes
+    """
+    if msgpack is not None:
+        data = _MSGPACK + msgpack.packb(obj, default=str, use_bin_type=True)
+    else:
+        data = _JSON + json.dumps(obj, default=str, separators=(",", ":")).encode()
+    
+    if len(data) > settings.result_compress_threshold:
+        compressed = _ZLIB + zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def loads(data: bytes) -> Any:
+    """
+    Decode a result encoded by dumps(), or a plain JSON one stored before.
+    
+    The backend decodes every stored result with this serializer, so
+    results from before the switch are recognised here.
+    
+    Args:
+        data: Encoded bytes
+    
+    Returns:
+        Result meta-data
+    """
+    if isinstance(data, str):
+        data = data.encode("latin-1")
+    if data[:1] == _ZLIB:
+        data = zlib.decompress(data[1:])
+    if data[:1] == _MSGPACK:
+        if msgpack is None:
+            raise ValueError("Result was encoded with msgpack, which is not installed")
+        return msgpack.unpackb(data[1:], raw=False)
+    if data[:1] == _JSON:
+        return json.loads(data[1:])
+    if data[:1] == _LEGACY_JSON:
+        return json.loads(data)
+    raise ValueError("Unknown result encoding")
+
+
+register(SERIALIZER, dumps, loads, content_type=CONTENT_TYPE, content_encoding="binary")
+
+
+def result_expires(task_name: Optional[str]) -> int:
+    """
+    Get the time to live of a task type's results.
+    
+    Args:
+        task_name: Registered task name, if known
+    
+    Returns:
+        Seconds until the result expires
+    """
+    return {
+        "tasks.download_track": settings.result_expires_track,
+        "tasks.download_playlist": settings.result_expires_playlist,
+    }.get(task_name, settings.result_expires)
+
+
+class CompactRedisBackend(RedisBackend):
+    """
+    Redis result backend with per-task-type expiry and paged child lists.
+    
+    Results record the task name so they can be attributed, and expire
+    after result_expires(name). A playlist's child lists live in Redis
+    lists next to its result (see store_children()), so the result itself
+    stays small and the lists can be read a page at a time.
+    """
+    
+    def _store_result(self, task_id, result, state, traceback=None, request=None, **kwargs):
+        meta = self._get_result_meta(result=result, state=state, traceback=traceback, request=request)
+        meta["task_id"] = bytes_to_str(task_id)
+        task_name = getattr(request, "task", None)
+        if task_name:
+            meta["name"] = task_name
+        if isinstance(result, dict) and result.get("paged"):
+            # The child task IDs are in the paged lists already
+            meta["children"] = []
+        
+        # A successful result is never overwritten (see KeyValueStoreBackend)
+        if self._get_task_meta_for(task_id)["status"] == states.SUCCESS:
+            return result
+        
+        self.ensure(
+            self._set_expiring,
+            (self.get_key_for_task(task_id), self.encode(meta), result_expires(task_name))
+        )
+        return result
+    
+    def _set_expiring(self, key, value, ttl: int) -> None:
+        with self.client.pipeline() as pipe:
+            pipe.setex(key, ttl, value)
+            pipe.publish(key, value)
+            pipe.execute()
+    
+    def mark_queued(self, task_id: str, task_name: Optional[str] = None) -> None:
+        """
+        Store a PENDING result for a task that was just queued.
+        
+        Celery reports unknown task IDs as PENDING too; the stored result
+        tells them apart. A state a worker stored first is kept.
+        
+        Args:
+            task_id: ID of the queued task
+            task_name: Registered task name, which decides the result's expiry
+        """
+        meta = self._get_result_meta(result=None, state=states.PENDING, traceback=None, request=None)
+        meta["task_id"] = bytes_to_str(task_id)
+        if task_name:
+            meta["name"] = task_name
+        self.client.set(
+            self.get_key_for_task(task_id), self.encode(meta), ex=result_expires(task_name), nx=True
+        )
+    
+    def is_known(self, task_id: str) -> bool:
+        """Check whether a task was queued (see mark_queued()) or has stored a state."""
+        return bool(self.client.exists(self.get_key_for_task(task_id)))
+    
+    def children_key(self, task_id: str, name: str) -> str:
+        """Get the Redis key of a child list of a task."""
+        return bytes_to_str(self.get_key_for_task(task_id, key=f":{name}"))
+    
+    def store_children(self, task_id: str, result: Dict, task_name: Optional[str] = None) -> Dict:
+        """
+        Move a playlist result's child lists into Redis lists.
+        
+        Args:
+            task_id: ID of the playlist task
+            result: Result with CHILD_LISTS entries
+            task_name: Task name that decides the lists' time to live
+        
+        Returns:
+            The result without the lists, marked as paged
+        """
+        ttl = result_expires(task_name)
+        compact = dict(result)
+        with self.client.pipeline() as pipe:
+            for name in CHILD_LISTS:
+                items = compact.pop(name, None) or []
+                key = self.children_key(task_id, name)
+                pipe.delete(key)
+                if items:
+                    pipe.rpush(key, *(dumps(item) for item in items))
+                    pipe.expire(key, ttl)
+            pipe.execute()
+        compact["paged"] = True
+        return compact
+    
+    def children_page(self, task_id: str, name: str, offset: int = 0, limit: int = 100) -> Tuple[List[Dict], int]:
+        """
+        Read a page of a task's child list.
+        
+        Args:
+            task_id: ID of the playlist task
+            name: One of CHILD_LISTS
+            offset: Index of the first item
+            limit: Maximum number of items
+        
+        Returns:
+            Tuple of (items, total length of the list)
+        """
+        key = self.children_key(task_id, name)
+        with self.client.pipeline() as pipe:
+            pipe.lrange(key, offset, offset + limit - 1)
+            pipe.llen(key)
+            items, total = pipe.execute()
+        return [loads(item) for item in items], total
+
+
+def expand_result(backend, task_id: str, result: Any, offset: int = 0, limit: int = 100) -> Any:
+    """
+    Fill a paged playlist result with one page of its child lists.
+    
+    Args:
+        backend: Result backend the task's result came from
+        task_id: ID of the task
+        result: Task result
+        offset: Index of the first child returned
+        limit: Maximum number of children returned per list
+    
+    Returns:
+        Result with 'tasks' and 'already_downloaded' pages and the paging
+        fields 'offset', 'limit' and '<list>_total'; other results unchanged
+    """
+    if not (isinstance(result, dict) and result.get("paged") and isinstance(backend, CompactRedisBackend)):
+        return result
+    
+    expanded = {key: value for key, value in result.items() if key != "paged"}
+    for name in CHILD_LISTS:
+        items, total = backend.children_page(task_id, name, offset, limit)
+        expanded[name] = items
+        expanded[f"{name}_total"] = total
+    expanded["offset"] = offset
+    expanded["limit"] = limit
+    return expanded
+
+
+def iter_children(backend, task_id: str, result: Any, name: str, page_size: int = 1000) -> Iterator[Dict]:
+    """
+    Iterate over all items of a playlist result's child list, inline or paged.
+    
+    Args:
+        backend: Result backend the task's result came from
+        task_id: ID of the playlist task
+        result: Playlist task result
+        name: One of CHILD_LISTS
+        page_size: Items read per Redis round trip
+    
+    Yields:
+        Child items in stored order
+    """
+    if not isinstance(result, dict):
+        return
+    if not result.get("paged"):
+        yield from result.get(name) or []
+        return
+    if not isinstance(backend, CompactRedisBackend):
+        return
+    
+    offset = 0
+    while True:
+        items, total = backend.children_page(task_id, name, offset, page_size)
+        yield from items
+        offset += len(items)
+        if not items or offset >= total:
+            return
+
+
+def memory_report(backend: CompactRedisBackend, batch_size: int = 500) -> Dict[str, Dict[str, int]]:
+    """
+    Measure the Redis memory used by task results, per task type.
+    
+    Args:
+        backend: Result backend to inspect
+        batch_size: Keys measured per pipeline round trip
+    
+    Returns:
+        Dictionary of task type to 'keys' and 'bytes'; child lists are
+        reported as '<task type> children', results without a recorded
+        name as 'unknown'
+    """
+    client = backend.client
+    prefix = bytes_to_str(backend.task_keyprefix)
+    report: Dict[str, Dict[str, int]] = {}
+    
+    def account(kind: str, size: Optional[int]) -> None:
+        entry = report.setdefault(kind, {"keys": 0, "bytes": 0})
+        entry["keys"] += 1
+        entry["bytes"] += size or 0
+    
+    keys = []
+    for key in client.scan_iter(match=f"{prefix}*", count=batch_size):
+        keys.append(bytes_to_str(key))
+        if len(keys) >= batch_size:
+            _measure(client, keys, account)
+            keys = []
+    if keys:
+        _measure(client, keys, account)
+    return report
+
+
+def _measure(client, keys: List[str], account) -> None:
+    with client.pipeline() as pipe:
+        for key in keys:
+            pipe.memory_usage(key)
+            pipe.type(key)
+        replies = pipe.execute()
+    
+    results = []
+    for key, size, kind in zip(keys, replies[::2], replies[1::2]):
+        if bytes_to_str(kind) == "list":
+            # Only playlist results have child lists
+            account("tasks.download_playlist children", size)
+        else:
+            results.append((key, size))
+    
+    with client.pipeline() as pipe:
+        for key, _ in results:
+            pipe.get(key)
+        values = pipe.execute()
+    for (key, size), value in zip(results, values):
+        try:
+            task_name = loads(value)["name"]
+        except Exception:
+            task_name = "unknown"
+        account(task_name, size)
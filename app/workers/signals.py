@@ -0,0 +1,105 @@
+"""
+Celery signal handlers for worker tasks.
+"""
+from celery import concurrency
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import (
+    after_task_publish, task_prerun, task_postrun, worker_init, worker_process_init, worker_ready,
+    worker_shutdown
+)
+
+from app.config import settings
+from app.utils.http import close_clients
+from app.utils.profiling import profiler
+from app.utils.transcoder import shutdown_transcode_executor
+from app.utils.ytdl_pool import get_ytdl_pool
+from app.workers.control import HTTP_STATS_KEY_PREFIX, flush_http_stats
+from app.workers.results import CompactRedisBackend
+
+
+@worker_init.connect
+def check_worker_pool(sender=None, **kwargs):
+    """
+    Refuse to start a worker the transcode pool can't run in.
+    
+    Each prefork child would start a pool of its own, oversubscribing the
+    host, and the stats and shutdown drain would only see the main
+    process's (unused) pool. The thread pool it needs can't be resized,
+    so --autoscale is refused as well.
+    
+    Raises:
+        SystemExit: If TRANSCODE_POOL is on and the worker forks its tasks
+            or autoscales
+    """
+    if not settings.transcode_pool or sender is None:
+        return
+    # Celery logs and ignores exceptions from signal handlers, but not SystemExit
+    if issubclass(concurrency.get_implementation(sender.pool_cls), PreforkPool):
+        raise SystemExit("TRANSCODE_POOL needs the worker to run with --pool=threads")
+    if sender.options.get("autoscale"):
+        raise SystemExit("TRANSCODE_POOL workers can't autoscale; set FETCH_THREADS instead of --autoscale")
+
+
+@worker_process_init.connect
+def prewarm_worker_process(**kwargs):
+    """Load the yt-dlp extractors once per process instead of in the first task."""
+    if not settings.worker_prewarm:
+        return
+    try:
+        seconds = get_ytdl_pool().prewarm()
+    except Exception as e:
+        print(f"Error prewarming worker: {e}")
+        return
+    print(f"Worker process prewarmed in {seconds:.2f}s")
+
+
+@after_task_publish.connect
+def record_queued_task(sender=None, headers=None, **kwargs):
+    """Store a PENDING result for every queued task, so cancelling can refuse unknown IDs."""
+    from app.workers.celery_app import celery_app
+    
+    if not headers or not isinstance(celery_app.backend, CompactRedisBackend):
+        return
+    try:
+        celery_app.backend.mark_queued(headers["id"], sender)
+    except Exception as e:
+        print(f"Error recording queued task: {e}")
+
+
+@task_prerun.connect
+def start_task_profile(task_id=None, task=None, **kwargs):
+    """Start profiling the task if it is flagged or sampled."""
+    headers = getattr(task.request, "headers", None) or {}
+    if profiler.should_profile(headers):
+        profiler.start(task_id)
+
+
+@task_postrun.connect
+def stop_task_profile(task_id=None, task=None, state=None, **kwargs):
+    """Store the profile of a profiled task."""
+    profiler.stop(task_id, task_name=task.name if task else "", state=state or "")
+
+
+@task_postrun.connect
+def publish_http_stats(task=None, **kwargs):
+    """Add the HTTP counters of the task's process to its node's totals."""
+    if task is None or not task.request.hostname:
+        return
+    flush_http_stats(task.app.backend.client, task.request.hostname)
+
+
+@worker_ready.connect
+def reset_http_stats(sender=None, **kwargs):
+    """Start the node's HTTP counters from zero, like its processes' own counters."""
+    try:
+        sender.app.backend.client.delete(HTTP_STATS_KEY_PREFIX + sender.hostname)
+    except Exception as e:
+        print(f"Error resetting HTTP stats: {e}")
+
+
+@worker_shutdown.connect
+def drain_transcode_pool(**kwargs):
+    """Let queued encodes finish before the worker exits."""
+    shutdown_transcode_executor()
+    close_clients()
+    get_ytdl_pool().close()
@@ -1,131 +1,203 @@
 """
 Celery tasks for downloading and processing audio.
 """
-from pathlib import Path
-from typing import Dict, List
-from celery import group
+from typing import Dict, List, Optional
+from celery.exceptions import Ignore
 
 from app.workers.celery_app import celery_app
-from app.services.spotify_service import SpotifyService
-from app.services.youtube_service import YouTubeService
+from app.workers.results import CompactRedisBackend
+from app.workers.cancellation import CancelToken, TaskCancelled, cancel_tasks, mark_cancelled
+from app.services.pipeline import (
+    PipelineError, resolve_track, resolve_playlist, track_result, playlist_result,
+    find_downloaded, record_download, library_or_none, link_duplicate, finish_track, encode_formats,
+    store_track
+)
 from app.services.metadata_service import MetadataService
-from app.services.url_parser import URLParser, URLType
 from app.utils.downloader import AudioDownloader
+from app.utils.ffmpeg import parse_formats
+from app.utils.resilience import TransientError, backoff_delay
+from app.utils.transcoder import get_transcode_executor
 from app.config import settings
 
 
 @celery_app.task(bind=True, name="tasks.download_track")
-def download_track_task(self, url: str) -> Dict:
+def download_track_task(self, url: str, formats: Optional[List[str]] = None) -> Dict:
     """
     Download a single track from Spotify or YouTube URL.
     
     Args:
         url: Spotify track URL or YouTube video URL
+        formats: Output formats besides the library MP3 (e.g. ["opus", "preview"]),
+            encoded by the same ffmpeg run
     
     Returns:
         Dictionary with download result
     """
+    # Checked from the download's progress hooks and while ffmpeg runs
+    token = CancelToken(self.request.id)
+    
     try:
-        # Identify URL type
-        url_type, url_id = URLParser.identify_url(url)
+        result = _download_track(self, url, formats, token)
+        # A cancel that arrived while the track was finishing has stored
+        # REVOKED already; keep that instead of the result
+        token.check(fresh=True)
+        return result
+    
+    except TaskCancelled:
+        mark_cancelled(self.backend, self.request.id, self.name)
+        raise Ignore()
+    except TransientError as e:
+        # YouTube or Spotify is down or throttling; come back later instead of failing now
+        if self.request.retries < settings.task_max_retries:
+            raise self.retry(
+                exc=e, countdown=backoff_delay(self.request.retries, e), max_retries=settings.task_max_retries
+            )
+        return {
+            "success": False,
+            "error": str(e),
+            "track": "Unknown"
+        }
+    except PipelineError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "track": e.track
+        }
+    except Ignore:
+        raise
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "track": "Unknown"
+        }
+
+
+def _download_track(task, url: str, formats: Optional[List[str]], token: CancelToken) -> Dict:
+    """
+    Run a track download for download_track_task.
+    
+    Args:
+        task: The bound download task
+        url: Spotify track URL or YouTube video URL
+        formats: Output formats besides the library MP3
+        token: Cancellation check of the task
+    
+    Returns:
+        Dictionary with download result
+    """
+    def on_step(step: str) -> None:
+        task.update_state(state="PROGRESS", meta={"step": step})
+    
+    # Revocations expire from the workers; the flag catches long-queued tasks
+    token.check()
+    extra_formats = parse_formats(formats)
+    url_type, youtube_url, metadata = resolve_track(url, on_step)
+    downloader = AudioDownloader(settings.download_dir)
+    
+    # Don't download (or overwrite) a track that is already in the library
+    existing_file = find_downloaded(metadata, youtube_url)
+    if existing_file:
+        extra_files = downloader.format_paths(existing_file, extra_formats)
+        if extra_files:
+            # Formats asked for later are encoded from the library copy
+            task.update_state(state="PROGRESS", meta={"step": "Encoding formats"})
+            encode_formats(existing_file, metadata, extra_files, token.check)
+        return track_result(
+            existing_file, metadata, url_type, already_downloaded=True, formats=extra_files,
+            storage_keys=store_track(existing_file, extra_files)
+        )
+    
+    # Update task state
+    task.update_state(state="PROGRESS", meta={"step": "Downloading audio"})
+    
+    # Fetch the cover art while the audio downloads
+    tags = MetadataService.prepare_tags_async(metadata)
+    
+    if settings.transcode_pool:
+        # Fetch only and leave the encode to the node's transcode pool,
+        # which runs at most one ffmpeg per core however many fetch
+        # threads are waiting on it
+        source_file = downloader.fetch(youtube_url, metadata, [token.hook])
         
-        if url_type == URLType.UNKNOWN:
+        if not source_file:
+            token.check()
             return {
                 "success": False,
-                "error": "Unsupported URL type. Please provide a Spotify or YouTube URL.",
-                "track": "Unknown"
+                "error": "Failed to download audio",
+                "track": metadata.title
             }
         
-        # Update task state
-        self.update_state(state="PROGRESS", meta={"step": "Fetching metadata"})
-        
-        youtube_service = YouTubeService()
+        output_file = downloader.output_path(metadata)
+        extra_files = downloader.format_paths(output_file, extra_formats)
         
-        # Handle based on URL type
-        if url_type == URLType.SPOTIFY_TRACK:
-            # Spotify workflow: Get metadata from Spotify, search YouTube
-            from app.models import TrackMetadata
-            
-            spotify_service = SpotifyService()
-            metadata_dict = spotify_service.get_track_metadata(url)
-            
-            # Convert dict to TrackMetadata object
-            metadata = TrackMetadata(
-                title=metadata_dict.get('name', 'Unknown'),
-                artist=metadata_dict.get('artist', 'Unknown Artist'),
-                album=metadata_dict.get('album', 'Unknown Album'),
-                duration_ms=0,  # Not available from web scraping
-                cover_art_url=metadata_dict.get('cover_url', ''),
-                spotify_id=url_id
+        # A recording that is already in the library needn't be encoded again
+        duplicate_of, fingerprint = link_duplicate(source_file, output_file)
+        if duplicate_of:
+            try:
+                encode_formats(source_file, metadata, extra_files, token.check)
+            finally:
+                source_file.unlink()
+            record_download(output_file, metadata, youtube_url)
+            return track_result(
+                output_file, metadata, url_type, duplicate_of=duplicate_of, formats=extra_files,
+                storage_keys=store_track(output_file, extra_files)
             )
-            
-            # Update task state
-            self.update_state(state="PROGRESS", meta={"step": "Searching YouTube"})
-            
-            # Search YouTube
-            youtube_url = youtube_service.search_track(metadata)
-            
-            if not youtube_url:
-                return {
-                    "success": False,
-                    "error": "No matching YouTube video found",
-                    "track": metadata.title
-                }
         
-        elif url_type == URLType.YOUTUBE_VIDEO:
-            # YouTube workflow: Get metadata directly from YouTube
-            youtube_url = url
-            metadata = youtube_service.get_video_metadata(youtube_url)
-            
-            if not metadata:
-                return {
-                    "success": False,
-                    "error": "Failed to extract YouTube video metadata",
-                    "track": "Unknown"
-                }
+        future = get_transcode_executor().submit(
+            source_file, output_file, cancel_check=token.remote_check(), extra_outputs=extra_files
+        )
+        task.update_state(state="PROGRESS", meta={"step": "Transcoding"})
         
-        else:
+        # Wait here rather than finishing from a callback, so the result is
+        # stored by the task (or the task is redelivered) if the worker stops
+        try:
+            encoded = future.result()
+        except TaskCancelled:
+            # The encoder removed its partial output and the source
+            raise
+        except Exception as e:
             return {
                 "success": False,
-                "error": f"Invalid URL type for single track download: {url_type}",
-                "track": "Unknown"
-            }
-        
-        # Update task state
-        self.update_state(state="PROGRESS", meta={"step": "Downloading audio"})
-        
-        # Download audio
-        downloader = AudioDownloader(settings.download_dir)
-        output_file = downloader.download(youtube_url, metadata)
-        
-        if not output_file:
-            return {
-                "success": False,
-                "error": "Failed to download audio",
+                "error": f"Failed to transcode audio: {e}",
                 "track": metadata.title
             }
         
-        # Update task state
-        self.update_state(state="PROGRESS", meta={"step": "Embedding metadata"})
-        
-        # Embed metadata
-        metadata_service = MetadataService()
-        metadata_service.embed_metadata(output_file, metadata)
-        
-        return {
-            "success": True,
-            "track": metadata.title,
-            "artist": metadata.artist,
-            "file": str(output_file),
-            "source": url_type
-        }
-        
-    except Exception as e:
+        task.update_state(state="PROGRESS", meta={"step": "Embedding metadata"})
+        return finish_track(
+            output_file, metadata, url_type, youtube_url, fingerprint,
+            loudness=encoded.loudness, tags=tags, extra_files=extra_files
+        )
+    
+    # Download audio
+    output_file = downloader.download(
+        youtube_url, metadata, progress_hooks=[token.hook], cancel_check=token.check,
+        formats=extra_formats
+    )
+    
+    if not output_file:
+        token.check()
         return {
             "success": False,
-            "error": str(e),
-            "track": "Unknown"
+            "error": "Failed to download audio",
+            "track": metadata.title
         }
+    
+    extra_files = downloader.format_paths(output_file, extra_formats)
+    if token.cancelled:
+        output_file.unlink(missing_ok=True)
+        for _, path in extra_files:
+            path.unlink(missing_ok=True)
+        token.check()
+    
+    # Update task state
+    task.update_state(state="PROGRESS", meta={"step": "Embedding metadata"})
+    
+    # Link duplicates of library tracks, otherwise embed metadata
+    return finish_track(
+        output_file, metadata, url_type, youtube_url,
+        loudness=downloader.pop_loudness(output_file), tags=tags, extra_files=extra_files
+    )
 
 
 @celery_app.task(bind=True, name="tasks.download_playlist")
@@ -139,77 +211,60 @@ def download_playlist_task(self, url: str) -> Dict:
     Returns:
         Dictionary with download results
     """
+    def on_step(step: str) -> None:
+        self.update_state(state="PROGRESS", meta={"step": step})
+    
+    token = CancelToken(self.request.id)
+    results = []
+    
     try:
-        # Identify URL type
-        url_type, url_id = URLParser.identify_url(url)
-        
-        if url_type not in [URLType.SPOTIFY_PLAYLIST, URLType.YOUTUBE_PLAYLIST]:
-            return {
-                "success": False,
-                "error": "URL must be a Spotify or YouTube playlist"
-            }
-        
-        # Update task state
-        self.update_state(state="PROGRESS", meta={"step": "Fetching playlist"})
+        token.check()
+        url_type, entries = resolve_playlist(url, on_step, library_or_none())
         
-        results = []
-        
-        if url_type == URLType.SPOTIFY_PLAYLIST:
-            # Spotify playlist workflow
-            from app.models import TrackMetadata
-            
-            spotify_service = SpotifyService()
-            tracks_data = spotify_service.get_playlist_tracks(url)
-            
-            # Update task state
-            self.update_state(
-                state="PROGRESS",
-                meta={"step": f"Processing {len(tracks_data)} tracks"}
-            )
-            
-            # Create subtasks for each track
-            for track_dict in tracks_data:
-                # Note: playlist scraping doesn't provide track IDs or Spotify URLs
-                # So we'll search YouTube directly with artist + track name
-                youtube_service = YouTubeService()
-                search_query = f"{track_dict.get('artist', 'Unknown')} {track_dict.get('name', 'Unknown')}"
-                youtube_url = youtube_service.search(search_query)
-                
-                if youtube_url:
-                    result = download_track_task.delay(youtube_url)
-                    results.append({
-                        "task_id": result.id,
-                        "track": track_dict.get('name', 'Unknown'),
-                        "artist": track_dict.get('artist', 'Unknown')
-                    })
-        
-        elif url_type == URLType.YOUTUBE_PLAYLIST:
-            # YouTube playlist workflow
-            youtube_service = YouTubeService()
-            videos = youtube_service.get_playlist_videos(url)
-            
-            # Update task state
-            self.update_state(
-                state="PROGRESS",
-                meta={"step": f"Processing {len(videos)} videos"}
-            )
-            
-            # Create subtasks for each video
-            for video in videos:
-                result = download_track_task.delay(video['url'])
-                results.append({
-                    "task_id": result.id,
-                    "track": video['title'],
-                    "artist": "YouTube"
+        # Create subtasks only for tracks that aren't in the library yet
+        # Both lists record each track's position in the playlist, so its order can be restored
+        existing = []
+        for position, entry in enumerate(entries):
+            # Stop queueing once cancelled; the children queued so far are cancelled below
+            token.check()
+            if entry.get("file"):
+                existing.append({
+                    "track": entry["track"],
+                    "artist": entry["artist"],
+                    "file": entry["file"],
+                    "position": position
                 })
+                continue
+            result = download_track_task.delay(entry["url"])
+            results.append({
+                "task_id": result.id,
+                "track": entry["track"],
+                "artist": entry["artist"],
+                "position": position
+            })
         
+        result = playlist_result(url_type, results, existing)
+        # A cancel that arrived after the last check must still reach the queued tracks
+        token.check(fresh=True)
+        if isinstance(self.backend, CompactRedisBackend):
+            # Keep the child lists out of the result, readable page by page
+            result = self.backend.store_children(self.request.id, result, self.name)
+        return result
+    
+    except TaskCancelled:
+        cancel_tasks(celery_app, [child["task_id"] for child in results])
+        mark_cancelled(self.backend, self.request.id, self.name)
+        raise Ignore()
+    except TransientError as e:
+        # Raised while resolving, before any track was queued, so a retry queues nothing twice
+        if self.request.retries < settings.task_max_retries:
+            raise self.retry(
+                exc=e, countdown=backoff_delay(self.request.retries, e), max_retries=settings.task_max_retries
+            )
         return {
-            "success": True,
-            "total_tracks": len(results),
-            "tasks": results,
-            "source": url_type
+            "success": False,
+            "error": str(e)
         }
-        
     except Exception as e:
         return {
             "success": False,
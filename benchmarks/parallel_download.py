@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark sequential vs parallel range downloading against a local
+HTTP server that throttles every connection.
+
+Usage:
+    python benchmarks/parallel_download.py [--size-mb 16] [--rate-kb 2048] [--connections 4]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.parallel_fetch import iter_ranges, probe_content_length  # noqa: E402
+
+
+def make_handler(payload: bytes, rate: int):
+    """Build a request handler serving payload at `rate` bytes/s per connection."""
+    
+    class ThrottledHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def log_message(self, *args):
+            pass
+        
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            range_header = self.headers.get("Range")
+            if range_header:
+                first, last = range_header.split("=", 1)[1].split("-")
+                start, end = int(first), min(int(last or end), end)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            
+            block = max(1, rate // 20)
+            position = start
+            while position <= end:
+                piece = payload[position:min(position + block, end + 1)]
+                self.wfile.write(piece)
+                position += len(piece)
+                time.sleep(len(piece) / rate)
+    
+    return ThrottledHandler
+
+
+def timed(label: str, chunks) -> float:
+    started = time.perf_counter()
+    total = sum(len(chunk) for chunk in chunks)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {total / 1e6:7.1f} MB in {elapsed:6.2f}s  ({total / 1e6 / elapsed:6.2f} MB/s)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--rate-kb", type=int, default=2048, help="Per-connection throttle in KB/s")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    args = parser.parse_args()
+    
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(payload, args.rate_kb * 1024))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/audio.webm"
+    
+    try:
+        with requests.get(url, stream=True) as response:
+            sequential = timed("sequential (1 connection)", response.iter_content(256 * 1024))
+        
+        size = probe_content_length(url)
+        parallel = timed(
+            f"ranged ({args.connections} connections)",
+            iter_ranges(url, size, connections=args.connections, chunk_size=args.chunk_kb * 1024)
+        )
+        print(f"speedup: {sequential / parallel:.2f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark tagging a freshly encoded MP3: the old load-and-rewrite path
+against writing prepared tags into the padding reserved by the encoder.
+
+Usage:
+    python benchmarks/tagging.py [--size-mb 100] [--cover-kb 200] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TSSE
+from mutagen.mp3 import MP3
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.metadata_service import MetadataService  # noqa: E402
+from app.utils.ffmpeg import Loudness  # noqa: E402
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz frame
+FRAME_HEADER = b"\xff\xfb\x90\x64"
+FRAME_SIZE = 417
+
+
+def write_encoded(path: Path, size: int, padding: int) -> None:
+    """Write a file shaped like ffmpeg's output: a small tag, padding, then audio."""
+    frame = FRAME_HEADER + os.urandom(FRAME_SIZE - len(FRAME_HEADER))
+    with open(path, "wb") as f:
+        for _ in range(size // FRAME_SIZE):
+            f.write(frame)
+    tags = ID3()
+    tags.add(TSSE(encoding=3, text="Lavf"))
+    tags.save(path, padding=lambda info: padding)
+
+
+def build_tags(cover: bytes) -> ID3:
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text="Title"))
+    tags.add(TPE1(encoding=3, text="Artist"))
+    tags.add(TALB(encoding=3, text="Album"))
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=cover))
+    return tags
+
+
+def rewrite_tagging(path: Path, cover: bytes) -> None:
+    """The previous path: parse the MP3, add frames and save."""
+    audio = MP3(path, ID3=ID3)
+    for frame in build_tags(cover).values():
+        audio.tags.add(frame)
+    audio.save()
+
+
+def single_write_tagging(path: Path, cover: bytes) -> None:
+    MetadataService.write_tags(path, build_tags(cover), Loudness(-12.0, -0.5))
+
+
+def run(label: str, tag, directory: Path, size: int, padding: int, cover: bytes, runs: int) -> float:
+    times = []
+    for index in range(runs):
+        path = directory / f"{label}-{index}.mp3"
+        write_encoded(path, size, padding)
+        # Tagging happens right after the encode, with the file in the page cache
+        started = time.perf_counter()
+        tag(path, cover)
+        times.append(time.perf_counter() - started)
+        path.unlink()
+    median = statistics.median(times)
+    print(f"{label:<34} median {median * 1000:8.1f} ms  (min {min(times) * 1000:.1f} ms)")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--cover-kb", type=int, default=200)
+    parser.add_argument("--padding-kb", type=int, default=256, help="Padding the encoder reserves")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--dir", help="Directory for the test files (default: a temporary directory)")
+    args = parser.parse_args()
+    
+    size = args.size_mb * 1024 * 1024
+    cover = os.urandom(args.cover_kb * 1024)
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        directory = Path(directory)
+        print(f"{args.size_mb} MB MP3, {args.cover_kb} KB cover, {args.runs} runs")
+        # ffmpeg's default padding is 10 bytes, so the old path always rewrote the file
+        rewrite = run("load + rewrite (no padding)", rewrite_tagging, directory, size, 10, cover, args.runs)
+        single = run(f"single write ({args.padding_kb} KB padding)", single_write_tagging,
+                     directory, size, args.padding_kb * 1024, cover, args.runs)
+    print(f"Speedup: {rewrite / single:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark the yt-dlp setup a track task pays: a fresh YoutubeDL per call
+(and extractor initialization in each) against the per-process pool.
+
+No network access is needed; only construction and extractor setup are
+timed, which is the part the pool removes.
+
+Usage:
+    python benchmarks/ytdl_setup.py [--tasks 200]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import yt_dlp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.ytdl_pool import PROFILES, YoutubeDLPool  # noqa: E402
+
+# The YoutubeDL contexts one Spotify track task opens: search, then download
+TASK_CALLS = (("flat", "YoutubeSearch"), ("download", "Youtube"))
+
+
+def fresh_task() -> None:
+    for profile, extractor in TASK_CALLS:
+        with yt_dlp.YoutubeDL(dict(PROFILES[profile])) as ydl:
+            ydl.get_info_extractor(extractor)
+
+
+def pooled_task(pool: YoutubeDLPool) -> None:
+    for profile, extractor in TASK_CALLS:
+        overrides = {"format": "bestaudio/best", "outtmpl": "/tmp/x.%(ext)s"} if profile == "download" else {}
+        with pool.acquire(profile, **overrides) as ydl:
+            ydl.get_info_extractor(extractor)
+
+
+def timed(label: str, task, count: int) -> float:
+    times = []
+    for _ in range(count):
+        started = time.perf_counter()
+        task()
+        times.append(time.perf_counter() - started)
+    median = statistics.median(times)
+    print(f"{label:<30} first {times[0] * 1000:8.1f} ms  median {median * 1000:7.2f} ms  "
+          f"total {sum(times):6.2f}s")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    args = parser.parse_args()
+    
+    # Import costs land in whichever variant runs first, so pay them up front
+    fresh_task()
+    
+    fresh = timed("fresh YoutubeDL per call", fresh_task, args.tasks)
+    pool = YoutubeDLPool()
+    prewarm = pool.prewarm()
+    print(f"{'pool prewarm (once per process)':<30} {prewarm * 1000:8.1f} ms")
+    pooled = timed("pooled (prewarmed)", lambda: pooled_task(pool), args.tasks)
+    print(f"Per-task setup: {fresh * 1000:.2f} ms -> {pooled * 1000:.2f} ms ({fresh / pooled:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Headless bulk downloader - run without Docker, Redis or a browser.
+
+Examples:
+    python cli.py download URL [URL ...]
+    python cli.py download --input urls.txt --concurrency 8
+"""
+import sys
+from pathlib import Path
+
+# Add app directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+if __name__ == "__main__":
+    from app.cli import main
+    sys.exit(main())
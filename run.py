@@ -11,6 +11,11 @@ from pathlib import Path
 # Add app directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+# Save downloads to the user's Music folder unless configured otherwise
+download_dir = Path(os.environ.setdefault(
+    "DOWNLOAD_DIR", str(Path.home() / "Music" / "Music Downloader")
+))
+
 from app.main_standalone import app
 import uvicorn
 
@@ -20,7 +25,6 @@ if __name__ == "__main__":
     print("=" * 60)
     
     # Create downloads folder
-    download_dir = Path.home() / "Music" / "Music Downloader"
     download_dir.mkdir(parents=True, exist_ok=True)
     print(f"📁 Downloads will be saved to: {download_dir}")
     
@@ -22,4 +22,133 @@ def test_health_check():
     assert response.json()["status"] == "healthy"
 
 
+def test_standalone_track_lifecycle():
+    """Test the standalone engine runs a task without Redis or Celery."""
+    import time
+    from app.main_standalone import app as standalone_app
+    
+    with TestClient(standalone_app) as standalone_client:
+        response = standalone_client.post("/api/v1/tracks/download", json={"url": "https://example.com/song"})
+        assert response.status_code == 200
+        task_id = response.json()["task_id"]
+        
+        for _ in range(50):
+            status = standalone_client.get(f"/api/v1/tracks/status/{task_id}").json()
+            if status["status"] == "completed":
+                break
+            time.sleep(0.05)
+        
+        assert status["status"] == "completed"
+        assert status["result"]["success"] is False
+
+
+def test_standalone_import_leaves_persisted_tasks_alone(tmp_path, monkeypatch):
+    """Test spawned encoder processes, which re-import the entry point, don't touch the task database."""
+    import importlib
+    import multiprocessing
+    import sqlite3
+    from app.models import TaskStatus
+    from app.standalone.engine import TaskStore
+    
+    db_path = tmp_path / "tasks.db"
+    store = TaskStore(db_path)
+    record = store.create("track", "https://example.com/song")
+    store.update(record.task_id, status=TaskStatus.PROCESSING)
+    
+    # Spawned children read the same settings as the server
+    monkeypatch.setenv("STANDALONE_DB", str(db_path))
+    child = multiprocessing.get_context("spawn").Process(
+        target=importlib.import_module, args=("app.main_standalone",)
+    )
+    child.start()
+    child.join(timeout=60)
+    assert child.exitcode == 0
+    
+    with sqlite3.connect(str(db_path)) as db:
+        status, = db.execute("SELECT status FROM tasks WHERE task_id = ?", (record.task_id,)).fetchone()
+    assert status == TaskStatus.PROCESSING.value
+    store.close()
+
+
+def test_standalone_track_formats(tmp_path, monkeypatch):
+    """Test the standalone engine encodes extra formats instead of refusing them."""
+    import time
+    from app.main_standalone import app as standalone_app
+    from app.models import TrackMetadata
+    from app.services.url_parser import URLType
+    from app.standalone import engine as standalone_engine
+    
+    song_file = tmp_path / "Artist - Song.mp3"
+    song_file.write_bytes(b"mp3")
+    metadata = TrackMetadata(title="Song", artist="Artist", album="", duration_ms=0, spotify_id="")
+    encoded = []
+    
+    def fake_encode(source, metadata, extra_files, cancel_check=None):
+        for _, path in extra_files:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"opus")
+            encoded.append(path)
+    
+    monkeypatch.setattr(
+        standalone_engine, "resolve_track",
+        lambda url, on_step=None: (URLType.YOUTUBE_VIDEO, url, metadata)
+    )
+    monkeypatch.setattr(standalone_engine, "find_downloaded", lambda metadata, youtube_url: song_file)
+    monkeypatch.setattr(standalone_engine, "encode_formats", fake_encode)
+    monkeypatch.setattr(standalone_engine, "store_track", lambda output_file, formats=(): {})
+    
+    with TestClient(standalone_app) as standalone_client:
+        response = standalone_client.post(
+            "/api/v1/tracks/download", json={"url": "https://example.com/song", "formats": ["flac"]}
+        )
+        assert response.status_code == 400
+        
+        response = standalone_client.post(
+            "/api/v1/tracks/download", json={"url": "https://example.com/song", "formats": ["opus"]}
+        )
+        assert response.status_code == 200
+        task_id = response.json()["task_id"]
+        
+        for _ in range(50):
+            status = standalone_client.get(f"/api/v1/tracks/status/{task_id}").json()
+            if status["status"] == "completed":
+                break
+            time.sleep(0.05)
+    
+    assert status["status"] == "completed"
+    assert status["result"]["already_downloaded"] is True
+    assert status["result"]["formats"]["opus"]["file"] == str(encoded[0])
+
+
+def test_cancel_unknown_task_is_not_found(monkeypatch):
+    """Test cancelling a task ID that was never queued is refused instead of stored as revoked."""
+    from app.workers.results import CompactRedisBackend
+    
+    monkeypatch.setattr(CompactRedisBackend, "is_known", lambda self, task_id: False)
+    for endpoint in ("/api/v1/tracks/no-such-task", "/api/v1/playlists/no-such-task"):
+        response = client.delete(endpoint)
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Task not found"
+
+
+def test_bulk_download_rejects_unsupported_urls():
+    """Test bulk submissions report unsupported URLs and refuse malformed JSON."""
+    response = client.post(
+        "/api/v1/bulk/download",
+        content=b"https://example.com/a\n\nhttps://example.com/b",
+        headers={"Content-Type": "text/plain"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "tasks": [],
+        "duplicates": 0,
+        "rejected": ["https://example.com/a", "https://example.com/b"]
+    }
+    
+    response = client.post(
+        "/api/v1/bulk/download", content=b"[not json", headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 400
+
+
 # Add more tests as needed
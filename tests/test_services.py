@@ -19,4 +19,977 @@ def test_duration_match():
     assert duration_match(180000, 190, tolerance=0.1) is True
 
 
+def test_task_profiler_roundtrip(tmp_path):
+    """Test profiles are stored compressed and can be listed and rendered."""
+    from app.utils.profiling import TaskProfiler, PROFILE_HEADER
+    
+    profiler = TaskProfiler(profiles_dir=tmp_path, sample_rate=0, keep=1)
+    assert profiler.should_profile({PROFILE_HEADER: True}) is True
+    assert profiler.should_profile({}) is False
+    
+    for task_id in ("first", "second"):
+        profiler.start(task_id)
+        sorted(range(1000))
+        assert profiler.stop(task_id, task_name="tasks.test", state="SUCCESS").exists()
+    
+    profiles = profiler.list_profiles()
+    assert [p["task_id"] for p in profiles] == ["second"]
+    assert "function calls" in profiler.render("second")
+    assert profiler.load_raw("first") is None
+
+
+def test_audio_format_selector():
+    """Test the smallest adequate audio-only format is chosen over video."""
+    from app.utils.formats import AudioFormatSelector
+    
+    formats = [
+        {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a.40.2', 'tbr': 500},
+        {'format_id': '249', 'vcodec': 'none', 'acodec': 'opus', 'abr': 50},
+        {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 160},
+        {'format_id': '251', 'vcodec': 'none', 'acodec': 'opus', 'abr': 135},
+        {'format_id': '774', 'vcodec': 'none', 'acodec': 'opus', 'abr': 256},
+        {'format_id': '22', 'vcodec': 'avc1', 'acodec': 'mp4a.40.2', 'tbr': 1500},
+    ]
+    
+    selector = AudioFormatSelector(target_kbps=192)
+    assert [f['format_id'] for f in selector({'formats': formats})] == ['251']
+    assert selector.report(duration=200) == (256 - 135) * 1000 // 8 * 200
+    
+    # Below target: best available audio-only format, never video
+    assert AudioFormatSelector(target_kbps=320).select(formats)['format_id'] == '774'
+    
+    # Video only when there is no audio-only format
+    assert AudioFormatSelector().select([formats[5], formats[0]])['format_id'] == '18'
+
+
+def test_connection_budget():
+    """Test downloads share a bounded number of connections."""
+    from app.utils.parallel_fetch import ConnectionBudget
+    
+    budget = ConnectionBudget(limit=6)
+    with budget.lease(4) as first:
+        with budget.lease(4) as second:
+            assert (first, second) == (4, 2)
+            assert budget.in_use == 6
+    assert budget.in_use == 0
+
+
+def test_job_journal_resume(tmp_path):
+    """Test the journal replays completed stages and tolerates a torn line."""
+    from app.utils.journal import JobJournal
+    
+    path = tmp_path / "journal.jsonl"
+    with JobJournal(path) as journal:
+        journal.record("spotify_track:abc", "resolved", youtube_url="https://youtu.be/x")
+        journal.record("spotify_track:abc", "downloaded", file="/music/a.mp3")
+    with open(path, "a") as f:
+        f.write('{"key": "spotify_track:abc", "stage": "tag')
+    
+    with JobJournal(path) as journal:
+        state = journal.state("spotify_track:abc")
+        assert state["stage"] == "downloaded"
+        assert state["youtube_url"] == "https://youtu.be/x"
+        journal.record("spotify_track:abc", "tagged")
+    
+    assert JobJournal(path).state("spotify_track:abc")["stage"] == "tagged"
+
+
+def test_bulk_download_skips_library_tracks(tmp_path, monkeypatch):
+    """Test the download command skips tracks its output directory's library already has."""
+    from app import cli
+    from app.config import settings
+    from app.models import TrackMetadata
+    from app.services.library import LibraryIndex
+    from app.services.url_parser import URLType
+    from app.utils.journal import JobJournal
+    
+    youtube_url = "https://www.youtube.com/watch?v=abcdefghijk"
+    metadata = TrackMetadata(title="Song", artist="Artist", album="", duration_ms=0, spotify_id="")
+    song = tmp_path / "Artist - Song.mp3"
+    song.write_bytes(b"\xff\xfb" * 100)
+    library = LibraryIndex(tmp_path / ".library.sqlite3")
+    library.add(song, metadata, youtube_url)
+    library.close()
+    
+    def no_download(*args, **kwargs):
+        raise AssertionError("a track in the library was downloaded again")
+    
+    monkeypatch.setattr(settings, "library_index", True)
+    monkeypatch.setattr(cli, "resolve_track", lambda url: (URLType.YOUTUBE_VIDEO, url, metadata))
+    monkeypatch.setattr(cli.AudioDownloader, "download", no_download)
+    
+    assert cli.main(["download", youtube_url, "-o", str(tmp_path), "-j", "1"]) == 0
+    state = JobJournal(tmp_path / ".bulk-journal.jsonl").state("youtube_video:abcdefghijk")
+    assert state["stage"] == "tagged" and state["file"] == str(song.resolve())
+
+
+def test_library_index(tmp_path):
+    """Test the library finds tracks by ID or normalized name and diffs playlists."""
+    from app.models import TrackMetadata
+    from app.services.library import LibraryIndex, audio_hash
+    
+    song = tmp_path / "Artist - Song.mp3"
+    song.write_bytes(b"ID3\x04\x00\x00\x00\x00\x00\x02ab" + b"\xff\xfb" * 100)
+    retagged = tmp_path / "copy.mp3"
+    retagged.write_bytes(b"ID3\x04\x00\x00\x00\x00\x00\x04abcd" + b"\xff\xfb" * 100)
+    assert audio_hash(song) == audio_hash(retagged)
+    
+    library = LibraryIndex(tmp_path / "library.sqlite3")
+    metadata = TrackMetadata(title="Song", artist="Artist", album="Album", duration_ms=0, spotify_id="sp1")
+    library.add(song, metadata, "https://www.youtube.com/watch?v=abcdefghijk")
+    
+    assert library.find(spotify_id="sp1")["path"] == str(song.resolve())
+    assert library.find(artist="ARTIST", title="Song (Official Video)")
+    
+    missing, present = library.missing([
+        {"url": "https://youtu.be/abcdefghijk", "track": "Whatever", "artist": "YouTube"},
+        {"url": "https://youtu.be/zzzzzzzzzzz", "track": "Artist - Other Song", "artist": "YouTube"},
+    ])
+    assert [entry["track"] for entry in missing] == ["Artist - Other Song"]
+    assert present[0]["file"] == str(song.resolve())
+    
+    song.unlink()
+    assert library.find(spotify_id="sp1") is None
+    assert library.count() == 0
+
+
+def test_library_scanner_incremental(tmp_path):
+    """Test rescans skip unchanged files and pick up changes and deletions."""
+    from app.services.library import LibraryIndex
+    from app.services.library_scanner import LibraryScanner
+    
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "Artist - One.mp3").write_bytes(b"\xff\xfb" * 100)
+    (tmp_path / "Artist - Two.mp3").write_bytes(b"\xff\xfa" * 100)
+    (tmp_path / "Artist - Two.source.webm").write_bytes(b"partial")
+    
+    library = LibraryIndex(tmp_path / ".library.sqlite3")
+    scanner = LibraryScanner(library, workers=1)
+    
+    stats = scanner.scan(tmp_path)
+    assert (stats["files"], stats["indexed"]) == (2, 2)
+    assert library.find(artist="Artist", title="One")
+    
+    assert scanner.scan(tmp_path)["unchanged"] == 2
+    
+    (tmp_path / "Artist - Two.mp3").unlink()
+    (tmp_path / "A" / "Artist - One.mp3").write_bytes(b"\xff\xfb" * 200)
+    stats = scanner.scan(tmp_path)
+    assert (stats["indexed"], stats["removed"]) == (1, 1)
+    assert library.count() == 1
+
+
+def test_layout_migration(tmp_path):
+    """Test migration shards files, resolves collisions and is idempotent."""
+    from app.services.layout_migration import LayoutMigrator
+    from app.utils.layout import PathLayout
+    
+    (tmp_path / "Artist - Song.mp3").write_bytes(b"\xff\xfb" * 10)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "Artist - Song.mp3").write_bytes(b"\xff\xfb" * 20)
+    (tmp_path / "Other - Tune.mp3").write_bytes(b"\xff\xfb" * 30)
+    
+    layout = PathLayout(tmp_path, "{initial}/{artist}/{artist} - {title}")
+    assert layout.relative_path("Artist", "Song").as_posix() == "A/Artist/Artist - Song.mp3"
+    
+    stats = LayoutMigrator(layout, workers=2).migrate()
+    assert (stats["moved"], stats["failed"]) == (3, 0)
+    files = sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*.mp3"))
+    assert len(files) == 3
+    assert "A/Artist/Artist - Song.mp3" in files and "O/Other/Other - Tune.mp3" in files
+    assert not (tmp_path / "sub").exists()
+    
+    stats = LayoutMigrator(layout, workers=2).migrate()
+    assert (stats["moved"], stats["in_place"]) == (0, 3)
+
+
+def test_fingerprint_matching(tmp_path):
+    """Test a shifted, noisy copy matches its recording and other music doesn't."""
+    import numpy as np
+    from app.models import TrackMetadata
+    from app.services.library import LibraryIndex
+    from app.utils.fingerprint import SAMPLE_RATE, fingerprint_samples
+    
+    def song(seed, seconds=60):
+        rng = np.random.default_rng(seed)
+        t = np.arange(SAMPLE_RATE // 4) / SAMPLE_RATE
+        notes = [
+            sum(np.sin(2 * np.pi * f * t) for f in rng.uniform(100, 4000, 3)) * rng.uniform(0.2, 1)
+            for _ in range(seconds * 4)
+        ]
+        return np.concatenate(notes).astype(np.float32) / 3
+    
+    original = song(1)
+    copy = np.concatenate([np.zeros(int(1.37 * SAMPLE_RATE)), original * 0.5])[:len(original)]
+    copy = copy + np.random.default_rng(5).normal(0, 0.05, len(copy))
+    
+    library = LibraryIndex(tmp_path / "library.sqlite3")
+    song_file = tmp_path / "Artist - Song.mp3"
+    song_file.write_bytes(b"\xff\xfb" * 10)
+    library.add(song_file, TrackMetadata(title="Song", artist="Artist", album="", duration_ms=0, spotify_id=""))
+    library.add_fingerprint(song_file, fingerprint_samples(original))
+    
+    match = library.match_fingerprint(fingerprint_samples(copy.astype(np.float32)))
+    assert match and match["path"] == str(song_file.resolve())
+    assert library.match_fingerprint(fingerprint_samples(song(2))) is None
+    assert library.unfingerprinted() == []
+
+
+def test_replaygain_from_encoder_loudness(tmp_path):
+    """Test the ebur128 summary is parsed and album gain weights tracks by duration."""
+    from mutagen.id3 import ID3
+    from app.models import TrackMetadata
+    from app.services.metadata_service import MetadataService
+    from app.utils.ffmpeg import Loudness, parse_loudness
+    
+    summary = """[Parsed_ebur128_0 @ 0x55d0] Summary:
+  
+  Integrated loudness:
+    I:         -14.2 LUFS
+    Threshold: -24.5 LUFS
+  
+  Loudness range:
+    LRA:         6.1 LU
+  
+  True peak:
+    Peak:       -0.5 dBFS"""
+    loudness = parse_loudness(summary)
+    assert loudness == Loudness(integrated=-14.2, true_peak=-0.5)
+    assert loudness.track_gain == pytest.approx(-3.8)
+    assert parse_loudness("no summary") is None
+    
+    # MPEG-1 Layer III, 128 kbps, 44.1 kHz frames of 417 bytes (~26 ms each)
+    frame = b"\xff\xfb\x90\x64" + b"\x00" * 413
+    files = []
+    for index, (frames, integrated, true_peak) in enumerate([(300, -14.0, -1.0), (100, -24.0, -6.0)]):
+        file_path = tmp_path / f"track{index}.mp3"
+        file_path.write_bytes(frame * frames)
+        metadata = TrackMetadata(title=f"Track {index}", artist="Artist", album="", duration_ms=0, spotify_id="")
+        MetadataService.embed_metadata(file_path, metadata, Loudness(integrated, true_peak))
+        files.append(file_path)
+    untagged = tmp_path / "untagged.mp3"
+    untagged.write_bytes(frame * 100)
+    
+    stats = MetadataService.write_album_gain(files + [untagged])
+    
+    # Energy mean: 10 * log10((3 * 10^-1.4 + 10^-2.4) / 4) = -15.11 LUFS
+    assert stats["album_gain"] == pytest.approx(-2.89, abs=0.01)
+    assert stats["album_peak"] == pytest.approx(10 ** (-1.0 / 20), abs=1e-6)
+    assert stats["tracks"] == 2 and stats["skipped"] == [str(untagged)]
+    tags = ID3(files[1])
+    assert tags["TXXX:REPLAYGAIN_TRACK_GAIN"].text[0] == "+6.00 dB"
+    assert tags["TXXX:REPLAYGAIN_ALBUM_GAIN"].text[0] == "-2.89 dB"
+
+
+def test_write_tags_fills_reserved_padding(tmp_path):
+    """Test prepared tags are written into the encoder's padding without moving the audio."""
+    import os
+    from mutagen.id3 import ID3, APIC, TSSE
+    from app.models import TrackMetadata
+    from app.services.metadata_service import MetadataService
+    from app.utils.ffmpeg import Loudness
+    
+    # What the encoder leaves behind: a small tag followed by 256 KB of padding
+    audio = b"\xff\xfb\x90\x64" + os.urandom(413)
+    file_path = tmp_path / "track.mp3"
+    file_path.write_bytes(audio * 200)
+    encoder_tags = ID3()
+    encoder_tags.add(TSSE(encoding=3, text="Lavf"))
+    encoder_tags.save(file_path, padding=lambda info: 256 * 1024)
+    size = file_path.stat().st_size
+    
+    metadata = TrackMetadata(title="Song", artist="Artist", album="Album", duration_ms=0, spotify_id="")
+    tags = MetadataService.prepare_tags_async(metadata).result()
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=os.urandom(100 * 1024)))
+    MetadataService.write_tags(file_path, tags, Loudness(-12.0, -0.1))
+    
+    assert file_path.stat().st_size == size
+    assert file_path.read_bytes().endswith(audio * 200)
+    written = ID3(file_path)
+    assert written["TIT2"].text[0] == "Song" and len(written["APIC:Cover"].data) == 100 * 1024
+    assert written["TXXX:REPLAYGAIN_TRACK_GAIN"].text[0] == "-6.00 dB"
+
+
+def test_http_retry_transport():
+    """Test idempotent requests are retried on 5xx, counted, and others aren't retried."""
+    import asyncio
+    import httpx
+    from app.utils import http
+    from app.utils.http import AsyncRetryTransport, RetryTransport, metrics
+    from app.workers.control import flush_http_stats, read_http_stats
+    
+    attempts = []
+    
+    def handler(request):
+        attempts.append(request.method)
+        return httpx.Response(503 if len(attempts) % 3 else 200)
+    
+    metrics.reset()
+    with httpx.Client(transport=RetryTransport(httpx.MockTransport(handler), retries=2, backoff=0)) as client:
+        assert client.get("https://example.com/").status_code == 200
+        assert client.post("https://example.com/").status_code == 503
+    assert attempts == ["GET", "GET", "GET", "POST"]
+    assert metrics.snapshot()["requests"] == 4 and metrics.snapshot()["retries"] == 2
+    
+    # Worker processes add their counts to the node's totals, read by the main process
+    class Redis:
+        hashes = {}
+        
+        def pipeline(self, transaction=True):
+            return self
+        
+        def __enter__(self):
+            return self
+        
+        def __exit__(self, *exc_info):
+            pass
+        
+        def hincrby(self, key, name, amount):
+            fields = self.hashes.setdefault(key, {})
+            fields[name.encode()] = fields.get(name.encode(), 0) + amount
+        
+        def execute(self):
+            pass
+        
+        def hgetall(self, key):
+            return self.hashes.get(key, {})
+    
+    flush_http_stats(Redis(), "celery@node")
+    metrics.count("requests", 2)
+    flush_http_stats(Redis(), "celery@node")
+    stats = read_http_stats(Redis(), "celery@node")
+    assert stats["requests"] == 6 and stats["retries"] == 2 and stats["connections"] == 0
+    assert metrics.snapshot()["requests"] == 0
+    
+    async def fetch():
+        transport = AsyncRetryTransport(httpx.MockTransport(handler), retries=1, backoff=0)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return (await client.get("https://example.com/")).status_code
+    
+    attempts.clear()
+    assert asyncio.run(fetch()) == 503
+    assert len(attempts) == 2
+    assert metrics.snapshot()["requests"] == 2 and metrics.snapshot()["retries"] == 1
+    
+    # Each event loop gets one pooled async client, which fork children forget
+    async def shared_client():
+        client = http.get_async_client(http2=False)
+        assert http.get_async_client(http2=False) is client
+        assert isinstance(client._transport, AsyncRetryTransport)
+        http._forget_clients()
+        assert http.get_async_client(http2=False) is not client
+        await client.aclose()
+        await http.aclose_clients()
+        return client
+    
+    assert asyncio.run(shared_client()) is not asyncio.run(shared_client())
+    assert not http._async_clients
+
+
+def test_ytdl_pool_overrides_are_per_call():
+    """Test pooled YoutubeDL instances are reused with per-call options undone."""
+    from app.utils.ytdl_pool import YoutubeDLPool
+    
+    pool = YoutubeDLPool(max_idle=1)
+    hook = lambda status: None  # noqa: E731
+    
+    with pool.acquire("download", format="bestaudio", outtmpl="/tmp/x.%(ext)s",
+                      progress_hooks=[hook], concurrent_fragment_downloads=4) as ydl:
+        assert ydl.params["outtmpl"]["default"] == "/tmp/x.%(ext)s"
+        assert ydl.params["concurrent_fragment_downloads"] == 4
+        assert hook in ydl._progress_hooks and ydl.format_selector is not None
+        first = ydl
+    
+    with pool.acquire("download") as ydl:
+        assert ydl is first
+        assert "concurrent_fragment_downloads" not in ydl.params
+        assert ydl.params["outtmpl"]["default"] != "/tmp/x.%(ext)s"
+        assert hook not in ydl._progress_hooks and ydl.format_selector is None
+    
+    # An instance that raised is not handed out again
+    with pytest.raises(RuntimeError):
+        with pool.acquire("download") as ydl:
+            raise RuntimeError("boom")
+    with pool.acquire("download") as ydl:
+        assert ydl is not first
+    assert pool.stats() == {"created": 2, "reused": 2, "idle": 1}
+
+
+def test_compact_result_encoding():
+    """Test results round-trip, large ones are compressed, and expiry is per task type."""
+    from app.config import settings
+    from app.workers.results import dumps, expand_result, loads, result_expires
+    
+    small = {"status": "SUCCESS", "result": {"success": True, "file": "/music/a.mp3"}}
+    assert loads(dumps(small)) == small
+    assert dumps(small)[:1] != b"Z"
+    
+    tasks = [{"task_id": f"{i:036d}", "track": f"Track {i}", "artist": "Artist"} for i in range(500)]
+    large = {"status": "SUCCESS", "result": {"tasks": tasks}}
+    encoded = dumps(large)
+    assert encoded[:1] == b"Z" and len(encoded) < len(str(large)) / 5
+    assert loads(encoded) == large
+    
+    assert result_expires("tasks.download_playlist") == settings.result_expires_playlist
+    assert result_expires(None) == settings.result_expires
+    # Inline (not paged) results pass through unchanged
+    assert expand_result(None, "id", {"tasks": tasks}) == {"tasks": tasks}
+
+
+def test_legacy_json_results_still_decode():
+    """Test results stored as plain JSON before the compact encoding are read by the backend."""
+    from app.workers.celery_app import celery_app
+    
+    legacy = b'{"status": "SUCCESS", "result": {"success": true, "file": "/music/a.mp3"}, "task_id": "t1"}'
+    meta = celery_app.backend.decode_result(legacy)
+    assert meta["status"] == "SUCCESS" and meta["result"]["file"] == "/music/a.mp3"
+
+
+def test_autoscaler_follows_simulated_queue():
+    """Test the pool grows with a backlog within cooldowns and headroom, then shrinks slowly."""
+    from app.workers.autoscale import NETWORK_POLICY, TRANSCODE_POLICY, ScalingController, ScalingSignals
+    
+    now = [0.0]
+    controller = ScalingController(NETWORK_POLICY, clock=lambda: now[0])
+    
+    # A playlist burst of 40 tasks; each process finishes one task per 3 seconds
+    queued, processes, sizes = 40, 1, []
+    for second in range(1000):
+        now[0] = float(second)
+        busy = min(processes, queued)
+        signals = ScalingSignals(queue_depth=queued - busy, busy=busy, cpu_idle=0.5, memory_free=0.5)
+        processes = controller.decide(processes, signals, 1, 8)
+        sizes.append(processes)
+        if second % 3 == 2:
+            queued = max(0, queued - processes)
+    
+    assert sizes[0] == 1 + NETWORK_POLICY.max_step_up
+    assert sizes[int(NETWORK_POLICY.up_cooldown) - 1] == sizes[0]  # Cooldown holds the size
+    assert max(sizes) == 8
+    # After the queue drains, one process goes per down_cooldown until the minimum
+    assert sizes[-1] == 1
+    assert all(a - b <= NETWORK_POLICY.max_step_down for a, b in zip(sizes, sizes[1:]))
+    
+    # No headroom, no growth
+    busy_host = ScalingController(NETWORK_POLICY, clock=lambda: 0.0)
+    assert busy_host.decide(2, ScalingSignals(queue_depth=10, busy=2, cpu_idle=0.05), 1, 8) == 2
+    assert busy_host.decide(2, ScalingSignals(queue_depth=10, busy=2, memory_free=0.05), 1, 8) == 2
+    
+    # Transcode-bound work grows one process at a time, up to the cores
+    transcode = ScalingController(TRANSCODE_POLICY, clock=lambda: now[0], cpu_count=2)
+    now[0] = 0.0
+    assert transcode.decide(1, ScalingSignals(queue_depth=10, busy=1), 1, 8) == 2
+    now[0] = 1000.0
+    assert transcode.decide(2, ScalingSignals(queue_depth=10, busy=2), 1, 8) == 2
+    
+    # Reserved tasks waiting too long grow the pool even with an empty broker queue
+    waiting = ScalingController(NETWORK_POLICY, clock=lambda: 0.0)
+    assert waiting.decide(2, ScalingSignals(queue_depth=2, busy=2, max_wait=60.0), 1, 8) == 3
+
+
+def test_cancellation_kills_encoder(tmp_path):
+    """Test cancel checks are throttled and a cancelled ffmpeg run is killed promptly."""
+    import subprocess
+    import sys
+    import time
+    from app.utils.ffmpeg import communicate
+    from app.workers.cancellation import CancelToken, TaskCancelled
+    
+    now = [0.0]
+    flagged = set()
+    lookups = []
+    
+    def lookup(task_id):
+        lookups.append(task_id)
+        return task_id in flagged
+    
+    token = CancelToken("task-1", interval=0.5, clock=lambda: now[0], lookup=lookup)
+    for _ in range(100):
+        token.hook({"status": "downloading"})
+    assert len(lookups) == 1  # Progress hooks fire per block; Redis is asked once per interval
+    
+    flagged.add("task-1")
+    token.hook({})
+    assert not token.cancelled
+    now[0] = 0.5
+    with pytest.raises(TaskCancelled):
+        token.hook({})
+    
+    # Before storing its result a task looks the flag up regardless of the interval
+    finishing = CancelToken("task-2", interval=0.5, clock=lambda: now[0], lookup=lookup)
+    finishing.check()
+    flagged.add("task-2")
+    with pytest.raises(TaskCancelled):
+        finishing.check(fresh=True)
+    
+    # A stand-in for a long encode, killed on the first check after cancellation
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(30)"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    started = time.monotonic()
+    with pytest.raises(TaskCancelled):
+        communicate(process, token.check)
+    assert time.monotonic() - started < 5
+    assert process.returncode is not None
+
+
+def test_circuit_breaker_and_error_classification():
+    """Test errors are classified, the breaker opens, fails fast and closes after a good probe."""
+    import httpx
+    from yt_dlp.utils import DownloadError
+    from app.config import settings
+    from app.utils.resilience import (
+        CircuitBreaker, CircuitOpenError, LocalBreakerStore, PermanentError, ThrottledError,
+        TransientError, backoff_delay, classify
+    )
+    
+    throttled = httpx.HTTPStatusError(
+        "429", request=httpx.Request("GET", "https://x"),
+        response=httpx.Response(429, headers={"Retry-After": "30"})
+    )
+    assert isinstance(classify("spotify", throttled), ThrottledError)
+    assert classify("spotify", throttled).retry_after == 30
+    assert isinstance(classify("youtube", httpx.ConnectTimeout("slow")), TransientError)
+    assert isinstance(classify("youtube", DownloadError("ERROR: [youtube] abc: Video unavailable")), PermanentError)
+    assert isinstance(classify("youtube", DownloadError("ERROR: Unable to download webpage: HTTP Error 503")), TransientError)
+    assert classify("youtube", KeyError("title")) is None
+    
+    now = [1000.0]
+    breaker = CircuitBreaker("youtube", 3, 60.0, store=LocalBreakerStore(), clock=lambda: now[0])
+    
+    def call(error=None):
+        with breaker.guard():
+            if error:
+                raise error
+    
+    # Permanent errors don't count against the dependency
+    for _ in range(5):
+        with pytest.raises(PermanentError):
+            call(DownloadError("Private video"))
+    assert breaker.snapshot()["state"] == "closed"
+    
+    for _ in range(3):
+        with pytest.raises(TransientError):
+            call(httpx.ReadTimeout("timed out"))
+    assert breaker.snapshot()["state"] == "open"
+    with pytest.raises(CircuitOpenError) as raised:
+        call()
+    assert raised.value.retry_after == 60
+    
+    # Half-open: one probe goes through; a success closes the breaker
+    now[0] += 61
+    assert breaker.snapshot()["state"] == "half_open"
+    call()
+    assert breaker.snapshot() == {"state": "closed", "failures": 0}
+    
+    # Backoff grows, has jitter and respects Retry-After
+    assert settings.task_retry_backoff / 2 <= backoff_delay(0) <= settings.task_retry_backoff
+    assert backoff_delay(20) <= settings.task_retry_backoff_max
+    assert backoff_delay(0, ThrottledError("spotify", "429", retry_after=120)) >= 120
+
+
+def test_url_canonicalization_and_dedupe():
+    """Test variants of one link canonicalize to a single URL and old shapes still identify."""
+    from app.services.url_parser import URLParser, URLType
+    
+    urls = [
+        "https://youtu.be/dQw4w9WgXcQ?si=abc",
+        "https://music.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+        "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+        "m.youtube.com/watch?t=10&v=dQw4w9WgXcQ",
+        "https://open.spotify.com/intl-de/track/6rqhFgbbKwnb9MLmUQDhG6?si=x",
+        "spotify:track:6rqhFgbbKwnb9MLmUQDhG6",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLabc",
+        "",
+        "https://example.com/song",
+    ]
+    parsed, rejected, duplicates = URLParser.parse_many(urls)
+    
+    assert [item.url for item in parsed] == [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://open.spotify.com/track/6rqhFgbbKwnb9MLmUQDhG6",
+        "https://www.youtube.com/playlist?list=PLabc",
+    ]
+    assert duplicates == 4
+    assert rejected == ["https://example.com/song"]
+    
+    # Shapes parse() doesn't know are still identified as before
+    assert URLParser.identify_url("https://www.youtube.com/channel/abc") == (URLType.YOUTUBE_VIDEO, None)
+    assert URLParser.identify_url("https://example.com/song") == (URLType.UNKNOWN, None)
+
+
+def test_range_file_response(tmp_path):
+    """Test file delivery answers ranges, revalidation and proxy offload."""
+    from fastapi import FastAPI, Request
+    from fastapi.testclient import TestClient
+    from app.utils.file_delivery import RangeFileResponse
+    
+    song = tmp_path / "Artist - Song.mp3"
+    song.write_bytes(bytes(range(256)) * 4096)
+    offload = {}
+    
+    app = FastAPI()
+    
+    @app.get("/file")
+    async def get_file(request: Request):
+        return RangeFileResponse(song, request.headers, offload_root=tmp_path, method=request.method, **offload)
+    
+    client = TestClient(app)
+    
+    full = client.get("/file")
+    assert full.status_code == 200
+    assert full.content == song.read_bytes()
+    assert full.headers["accept-ranges"] == "bytes"
+    etag = full.headers["etag"]
+    
+    partial = client.get("/file", headers={"Range": "bytes=1000-1999"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 1000-1999/{len(full.content)}"
+    assert partial.content == full.content[1000:2000]
+    assert client.get("/file", headers={"Range": "bytes=-10"}).content == full.content[-10:]
+    assert client.get("/file", headers={"Range": "bytes=999999999-"}).status_code == 416
+    
+    # A stale If-Range gets the whole (changed) file instead of a mismatched slice
+    assert client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'}).status_code == 200
+    assert client.get("/file", headers={"If-None-Match": etag}).status_code == 304
+    
+    offload.update(offload="x-accel-redirect", offload_prefix="/protected/")
+    offloaded = client.get("/file")
+    assert offloaded.headers["x-accel-redirect"] == "/protected/Artist%20-%20Song.mp3"
+    assert offloaded.content == b""
+
+
+def test_playlist_archive_streams_in_order(tmp_path, monkeypatch):
+    """Test a playlist archive holds finished tracks, stored, with an M3U in playlist order."""
+    import io
+    import zipfile
+    from app.api.endpoints.playlists import _archive_tracks
+    from app.config import settings
+    from app.utils.archive import m3u_playlist, stream_zip
+    
+    monkeypatch.setattr(settings, "download_dir", tmp_path)
+    first = tmp_path / "A - First.mp3"
+    second = tmp_path / "B" / "B - Second.mp3"
+    second.parent.mkdir()
+    first.write_bytes(b"first" * 1000)
+    second.write_bytes(b"second" * 1000)
+    
+    class Backend:
+        results = {
+            "t1": {"status": "SUCCESS", "result": {"success": True, "file": str(second)}},
+            "t2": {"status": "STARTED", "result": None},
+        }
+        
+        def get_key_for_task(self, task_id):
+            return task_id
+        
+        def mget(self, keys):
+            return [self.results.get(key) for key in keys]
+        
+        def decode_result(self, value):
+            return value
+    
+    result = {
+        "success": True,
+        "tasks": [
+            {"task_id": "t1", "track": "Second", "artist": "B", "position": 1},
+            {"task_id": "t2", "track": "Third", "artist": "C", "position": 2},
+            {"task_id": "t3", "track": "Gone", "artist": "D", "position": 3},
+        ],
+        "already_downloaded": [{"track": "First", "artist": "A", "file": str(first), "position": 0}],
+    }
+    tracks = _archive_tracks(Backend(), "playlist", result)
+    assert [(title, name) for title, name, _ in tracks] == [
+        ("A - First", "A - First.mp3"), ("B - Second", "B/B - Second.mp3")
+    ]
+    
+    members = [("playlist.m3u8", m3u_playlist((title, name) for title, name, _ in tracks))]
+    members += [(name, path) for _, name, path in tracks]
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(members))))
+    assert archive.testzip() is None
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert archive.read("B/B - Second.mp3") == second.read_bytes()
+    assert archive.read("playlist.m3u8").decode().splitlines() == [
+        "#EXTM3U", "#EXTINF:-1,A - First", "A - First.mp3", "#EXTINF:-1,B - Second", "B/B - Second.mp3"
+    ]
+
+
+def test_local_storage_dedupes_by_content(tmp_path, monkeypatch):
+    """Test copies of the same audio, however tagged, are stored once and served from storage."""
+    from fastapi import FastAPI, Request
+    from mutagen.id3 import ID3, TIT2
+    from fastapi.testclient import TestClient
+    from app.config import settings
+    from app.models import TrackMetadata
+    from app.services.pipeline import store_track, track_result
+    from app.services.url_parser import URLType
+    from app.utils import storage
+    from app.utils.file_delivery import stored_file_response
+    
+    monkeypatch.setattr(settings, "download_dir", tmp_path)
+    monkeypatch.setattr(settings, "storage_backend", "local")
+    monkeypatch.setattr(settings, "storage_dir", tmp_path / "objects")
+    monkeypatch.setattr(storage, "_storage", None)
+    
+    node_a = tmp_path / "node-a" / "Artist - Song.mp3"
+    node_b = tmp_path / "node-b" / "Artist - Song (1).mp3"
+    for title, path in (("Song", node_a), ("Song (Remastered)", node_b)):
+        path.parent.mkdir()
+        path.write_bytes(b"\xff\xfb" * 5000)
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=title))
+        tags.save(path)
+    
+    # Building a result stores nothing; storing is the explicit store_track() step
+    metadata = TrackMetadata(title="Song", artist="Artist", album="Album", duration_ms=0, spotify_id="sp1")
+    assert track_result(node_a, metadata, URLType.SPOTIFY_TRACK)["storage_key"] is None
+    assert not (tmp_path / "objects").exists()
+    
+    key = store_track(node_a)[str(node_a)]
+    assert storage.store_file(node_b) == key
+    stored = track_result(node_a, metadata, URLType.SPOTIFY_TRACK, storage_keys={str(node_a): key})
+    assert stored["storage_key"] == key
+    assert key.startswith("audio/") and key.endswith(".mp3")
+    assert len(list((tmp_path / "objects").rglob("*.mp3"))) == 1
+    assert storage.get_storage().metadata(key) == {"title": "Song"}
+    
+    with pytest.raises(ValueError):
+        storage.get_storage().local_path("../../etc/passwd")
+    
+    app = FastAPI()
+    
+    @app.get("/file")
+    async def get_file(request: Request):
+        return await stored_file_response(storage.get_storage(), key, request, "Artist - Song.mp3")
+    
+    response = TestClient(app).get("/file", headers={"Range": "bytes=0-3"})
+    assert response.status_code == 206
+    assert response.content == b"ID3\x04"
+    assert "Artist%20-%20Song.mp3" in response.headers["content-disposition"]
+
+
+def test_extra_formats_share_one_decode(tmp_path, monkeypatch):
+    """Test extra formats are encoded by the MP3's ffmpeg run and Opus files get tagged."""
+    import struct
+    from pathlib import Path
+    from mutagen.id3 import ID3, TIT2
+    from mutagen.ogg import OggPage
+    from mutagen.oggopus import OggOpus
+    from app.services.metadata_service import MetadataService
+    from app.utils import ffmpeg
+    from app.utils.downloader import AudioDownloader
+    
+    formats = ffmpeg.parse_formats(["mp3", "opus", "OPUS", "preview@48"])
+    assert [(fmt.name, fmt.bitrate) for fmt in formats] == [("opus", 128), ("preview@48", 48)]
+    with pytest.raises(ValueError):
+        ffmpeg.parse_formats(["flac"])
+    
+    def minimal_opus() -> bytes:
+        head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+        comments = b"OpusTags" + struct.pack("<I", 6) + b"vendor" + struct.pack("<I", 0)
+        pages = []
+        for sequence, packet in enumerate([head, comments, b"\xfc\xff\xfe"]):
+            page = OggPage()
+            page.serial, page.sequence, page.packets = 1, sequence, [packet]
+            page.first, page.last, page.position = sequence == 0, sequence == 2, 960 if sequence == 2 else 0
+            pages.append(page.write())
+        return b"".join(pages)
+    
+    commands = []
+    
+    class FakeFFmpeg:
+        """Writes every output it is given, like one ffmpeg run would."""
+        returncode = 0
+        
+        def __init__(self, command, **kwargs):
+            commands.append(command)
+            for arg in command:
+                if arg.endswith(".opus.part"):
+                    Path(arg).write_bytes(minimal_opus())
+                elif arg.endswith(".part"):
+                    Path(arg).write_bytes(b"audio")
+        
+        def communicate(self, timeout=None):
+            return None, b""
+    
+    monkeypatch.setattr(ffmpeg.subprocess, "Popen", FakeFFmpeg)
+    
+    downloader = AudioDownloader(tmp_path)
+    output_file = tmp_path / "Artist - Song.mp3"
+    source = tmp_path / "Artist - Song.source.webm"
+    source.write_bytes(b"source")
+    extra = downloader.format_paths(output_file, ffmpeg.parse_formats(["opus", "preview"]))
+    
+    ffmpeg.transcode(source, output_file, delete_source=True, analyze=False, extra_outputs=extra)
+    
+    assert len(commands) == 1 and commands[0].count("-i") == 1
+    assert output_file.exists() and not source.exists()
+    assert [path.relative_to(tmp_path).as_posix() for _, path in extra] == [
+        ".formats/opus/Artist - Song.opus", ".formats/preview/Artist - Song.mp3"
+    ]
+    assert all(path.exists() for _, path in extra)
+    assert not list(tmp_path.rglob("*.part"))
+    
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text="Song"))
+    MetadataService.write_tags(extra[0][1], tags, ffmpeg.Loudness(integrated=-14.0, true_peak=-1.0))
+    opus = OggOpus(extra[0][1])
+    assert opus["TITLE"] == ["Song"]
+    assert opus["R128_TRACK_GAIN"] == [str(-9 * 256)]
+
+
+def test_transcode_pool_refuses_prefork_workers(monkeypatch):
+    """Test a worker with the transcode pool only starts when its tasks share one process."""
+    from types import SimpleNamespace
+    from app.config import settings
+    from app.utils.transcoder import fetch_threads
+    from app.workers.autoscale import TRANSCODE_POLICY, select_policy
+    from app.workers.signals import check_worker_pool
+    
+    check_worker_pool(SimpleNamespace(pool_cls="prefork", options={"autoscale": (8, 1)}))
+    monkeypatch.setattr(settings, "transcode_pool", True)
+    check_worker_pool(SimpleNamespace(pool_cls="threads", options={}))
+    check_worker_pool(SimpleNamespace(pool_cls="solo", options={}))
+    with pytest.raises(SystemExit):
+        check_worker_pool(SimpleNamespace(pool_cls="prefork", options={}))
+    # Thread pools can't be resized
+    with pytest.raises(SystemExit):
+        check_worker_pool(SimpleNamespace(pool_cls="threads", options={"autoscale": (8, 1)}))
+    assert select_policy("auto") is TRANSCODE_POLICY
+    
+    # Threads waiting on encodes don't fetch, so there are more threads than encoders
+    monkeypatch.setattr(settings, "transcode_workers", 4)
+    assert fetch_threads() == 4 + 8 + 4
+    monkeypatch.setattr(settings, "fetch_threads", 6)
+    assert fetch_threads() == 6
+
+
+def test_streaming_download(tmp_path, monkeypatch):
+    """Test the overlapped download feeds ffmpeg as bytes arrive and progress hooks can abort either source."""
+    import io
+    import subprocess
+    from contextlib import contextmanager
+    from pathlib import Path
+    from yt_dlp.utils import DownloadCancelled
+    from app.config import settings
+    from app.models import TrackMetadata
+    from app.utils import downloader as downloader_module
+    from app.utils import ffmpeg
+    from app.utils.downloader import AudioDownloader
+    
+    processes = []
+    
+    class FakeStdin:
+        def __init__(self):
+            self.data = b""
+        
+        def write(self, chunk):
+            self.data += chunk
+        
+        def close(self):
+            pass
+    
+    class FakeFFmpeg:
+        """Writes its outputs up front; URL inputs keep it busy until killed."""
+        
+        def __init__(self, command, stdin=None, **kwargs):
+            processes.append(self)
+            self.command = command
+            self.stdin = FakeStdin() if stdin == subprocess.PIPE else None
+            self.stderr = io.BytesIO(b"")
+            self.returncode = None
+            for arg in command:
+                if arg.endswith(".part"):
+                    Path(arg).write_bytes(b"audio")
+        
+        def wait(self, timeout=None):
+            if self.returncode is None and self.stdin is None:
+                assert timeout is not None, "nothing polls for cancellation"
+                raise subprocess.TimeoutExpired(self.command, timeout)
+            self.returncode = self.returncode or 0
+            return self.returncode
+        
+        def poll(self):
+            return self.returncode
+        
+        def kill(self):
+            self.returncode = -9
+    
+    info = {"url": "https://media.example.com/audio", "protocol": "https", "filesize": 6}
+    
+    class FakeYdl:
+        def extract_info(self, url, download=False):
+            return info
+    
+    class FakePool:
+        @contextmanager
+        def acquire(self, *args, **kwargs):
+            yield FakeYdl()
+    
+    monkeypatch.setattr(ffmpeg.subprocess, "Popen", FakeFFmpeg)
+    monkeypatch.setattr(downloader_module, "get_ytdl_pool", lambda: FakePool())
+    monkeypatch.setattr(
+        AudioDownloader, "_iter_source",
+        staticmethod(lambda url, headers, connections, size=None: iter([b"abc", b"def"]))
+    )
+    monkeypatch.setattr(settings, "efficient_format_selection", False)
+    monkeypatch.setattr(settings, "loudness_analysis", False)
+    
+    downloader = AudioDownloader(tmp_path)
+    metadata = TrackMetadata(title="Song", artist="Artist", album="", duration_ms=0, spotify_id="")
+    progress = []
+    
+    output_file = downloader.download_streaming(
+        "https://youtube.com/watch?v=x", metadata, progress_hooks=[progress.append]
+    )
+    assert output_file.exists() and output_file.read_bytes() == b"audio"
+    assert processes[-1].stdin.data == b"abcdef"
+    assert [(p["downloaded_bytes"], p["total_bytes"]) for p in progress] == [(3, 6), (6, 6)]
+    output_file.unlink()
+    
+    cancels = []
+    
+    def cancel(progress):
+        cancels.append(progress)
+        raise DownloadCancelled("Cancelled by user")
+    
+    # Raising from a hook kills the encoder, whether we feed it or it fetches an HLS manifest itself
+    for protocol in ("https", "m3u8_native"):
+        info["protocol"] = protocol
+        assert downloader.download_streaming(
+            "https://youtube.com/watch?v=x", metadata, progress_hooks=[cancel]
+        ) is None
+        assert len(cancels) == 1 and processes[-1].returncode == -9
+        cancels.clear()
+        assert not output_file.exists() and not list(tmp_path.rglob("*.part"))
+    assert processes[-1].stdin is None and "https://media.example.com/audio" in processes[-1].command
+
+
+def test_track_key_keeps_distinct_versions(tmp_path):
+    """Test only remasters share a key with the original; live, acoustic, edit and mix versions don't."""
+    import sqlite3
+    from app.services.library import LibraryIndex, normalize_track
+    
+    song = normalize_track("Artist", "Song")
+    assert normalize_track("Artist", "Song - Remastered 2011") == song
+    assert normalize_track("Artist", "Song - 2009 Remaster") == song
+    assert normalize_track("Artist", "Song (Remastered)") == song
+    for version in ("Song - Acoustic Version", "Song - Radio Edit", "Song - Live", "Song - Extended Mix"):
+        assert normalize_track("Artist", version) != song
+    radio_edit = normalize_track("Artist", "Song - Radio Edit")
+    assert normalize_track("Artist", "Song - Radio Edit - Remastered") == radio_edit
+    
+    # Keys stored by an older normalization are rebuilt when the index opens
+    db_path = tmp_path / "library.sqlite3"
+    (tmp_path / "acoustic.mp3").write_bytes(b"")
+    LibraryIndex(db_path).upsert([{
+        "path": str(tmp_path / "acoustic.mp3"), "artist": "Artist", "title": "Song - Acoustic Version",
+        "norm_key": song
+    }])
+    with sqlite3.connect(str(db_path)) as db:
+        db.execute("PRAGMA user_version = 0")
+    assert LibraryIndex(db_path).find(artist="Artist", title="Song") is None
+
+
 # Add more tests as needed